@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 import json
@@ -8,11 +9,31 @@ import re
 import tempfile
 import subprocess
 import shutil
+import base64
+import hashlib
+import html
+import io
+import sqlite3
+import binascii
+import threading
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+import click
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, Response, has_request_context, render_template, request, jsonify, send_file
 from flask_cors import CORS
-from anthropic import Anthropic
+from werkzeug.wsgi import ClosingIterator
+from anthropic import Anthropic, RateLimitError
+from PIL import Image, ImageOps
 
 load_dotenv()
 
@@ -20,16 +41,1872 @@ app = Flask(__name__)
 CORS(app)
 
 # Force unbuffered logging to stderr
-logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+logging.basicConfig(stream=sys.stderr, level=os.environ.get("LOG_LEVEL", "DEBUG").upper())
 log = app.logger
 
+# Request/response bodies logged on the hot paths (prompts, fal.ai replies).
+# Set LOG_PAYLOADS=0 in production: formatting them costs real CPU and I/O.
+LOG_PAYLOADS = os.environ.get("LOG_PAYLOADS", "1") != "0"
+
 FAL_KEY = os.environ.get("FAL_KEY")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 
 APP_VERSION = "2025-02-22-v3"
 
-# In-memory cache for uploaded photos (keyed by a simple token)
-_photo_cache = {}
+
+# ---------------------------------------------------------------------------
+# Metrics — Prometheus counters, gauges and histograms for /api/metrics
+# ---------------------------------------------------------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class Metrics:
+    """Minimal Prometheus registry rendered in the text exposition format.
+
+    Metrics are declared once with a fixed label set; series are created on
+    first use. One lock guards every series and is only held for the update
+    itself, so instrumenting a hot path costs a dict lookup and an add.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help, label names, buckets)
+        self._series = {}  # name -> {label values: float | [bucket counts..., sum, count]}
+
+    def _declare(self, kind, name, help, labels, buckets=None):
+        self._meta[name] = (kind, help, tuple(labels), buckets)
+        self._series[name] = {}
+
+    def counter(self, name, help, labels=()):
+        self._declare("counter", name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        self._declare("gauge", name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self._declare("histogram", name, help, labels, tuple(buckets))
+
+    def _key(self, name, labels):
+        return tuple(str(labels.get(label, "")) for label in self._meta[name][2])
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._series[name][key] = value
+
+    def clear(self, name):
+        with self._lock:
+            self._series[name] = {}
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        buckets = self._meta[name][3]
+        with self._lock:
+            state = self._series[name].get(key)
+            if state is None:
+                state = self._series[name][key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @staticmethod
+    def _labels(names, values, extra=()):
+        pairs = list(zip(names, values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help, label_names, buckets) in self._meta.items():
+                full = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full} {help}")
+                lines.append(f"# TYPE {full} {kind}")
+                for key, value in sorted(self._series[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{full}{self._labels(label_names, key)} {value}")
+                        continue
+                    for bound, count in zip(buckets, value):
+                        lines.append(f"{full}_bucket{self._labels(label_names, key, [('le', bound)])} {count}")
+                    lines.append(f"{full}_bucket{self._labels(label_names, key, [('le', '+Inf')])} {value[-1]}")
+                    lines.append(f"{full}_sum{self._labels(label_names, key)} {value[-2]}")
+                    lines.append(f"{full}_count{self._labels(label_names, key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics("sorashorts")
+metrics.histogram("llm_request_seconds", "Anthropic messages call latency.", ["model"])
+metrics.gauge("llm_in_flight", "Anthropic calls currently holding a concurrency slot.", ["model"])
+metrics.gauge("llm_waiting", "Callers queued for an Anthropic concurrency slot.", ["model"])
+metrics.counter("llm_errors_total", "Anthropic calls that raised.", ["model"])
+metrics.counter("llm_busy_rejections_total", "Calls rejected after waiting too long for a slot.", ["model"])
+metrics.counter("llm_tokens_total", "Anthropic tokens billed, by kind.", ["model", "type"])
+metrics.histogram("fal_request_seconds", "fal.ai HTTP call latency.", ["kind", "endpoint"])
+metrics.gauge("fal_in_flight", "fal.ai HTTP calls in progress.", ["kind"])
+metrics.counter("fal_errors_total", "fal.ai calls that raised or returned HTTP >= 400.", ["kind", "endpoint"])
+metrics.histogram("job_seconds", "Submission to COMPLETED/FAILED time of fal.ai jobs.", ["kind", "status"])
+metrics.gauge("jobs_tracked", "fal.ai jobs held by the job manager.", ["kind", "status"])
+metrics.histogram("merge_seconds", "Clip merge step duration.", ["step"])
+metrics.counter("merge_errors_total", "Failed clip merges.")
+metrics.gauge("merge_queue_depth", "Merges waiting for a worker.")
+metrics.gauge("merge_running", "Merges in progress.")
+metrics.histogram("sanitizer_seconds", "Sora prompt sanitiser time per prompt.", buckets=FAST_BUCKETS)
+metrics.histogram("pipeline_stage_seconds", "Server-side pipeline stage duration.", ["stage", "status"])
+metrics.gauge("pipelines", "Server-side pipelines held in memory.", ["status"])
+metrics.histogram("admission_wait_seconds", "Time upstream calls queued for admission.", ["upstream", "model"])
+metrics.gauge("admission_queued", "Upstream calls waiting for admission.", ["upstream"])
+metrics.counter("admission_deferrals_total", "Upstream 429s that paused admission.", ["upstream", "model"])
+metrics.counter("admission_timeouts_total", "Calls that gave up waiting for admission.", ["upstream", "model"])
+metrics.gauge("http_requests_in_flight", "WSGI requests holding a server thread, open streams included.")
+metrics.histogram("http_request_seconds", "WSGI request time until the response body is closed.")
+
+
+def _count_requests(wsgi_app):
+    """Track requests until their body is closed, so SSE/NDJSON streams count as busy threads."""
+    def counted(environ, start_response):
+        start = time.monotonic()
+        metrics.inc("http_requests_in_flight")
+
+        def finished():
+            metrics.inc("http_requests_in_flight", -1)
+            metrics.observe("http_request_seconds", time.monotonic() - start)
+
+        try:
+            return ClosingIterator(wsgi_app(environ, start_response), finished)
+        except BaseException:
+            finished()
+            raise
+    return counted
+
+
+app.wsgi_app = _count_requests(app.wsgi_app)
+
+
+
+# ---------------------------------------------------------------------------
+# Photo store — bounded in-memory cache for uploaded reference photos
+# ---------------------------------------------------------------------------
+class PhotoStore:
+    """Thread-safe LRU store of decoded photo bytes with a byte budget and TTL.
+
+    Photos arrive as base64 data URIs but are kept as raw bytes (~25% smaller)
+    and re-encoded on read.  Entries are evicted least-recently-used first once
+    ``max_bytes`` is exceeded, and expire ``ttl`` seconds after their last use.
+    A photo that would not fit in ``max_bytes`` on its own is refused.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (media_type, data, last_used)
+        self._urls = {}  # token -> URL the photo is hosted at for fal.ai
+        self._thumbs = {}  # token -> (media_type, data) downscaled for gender detection
+        self._digests = {}  # token -> sha256 of the uploaded bytes, keys the gender cache
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def put(self, media_type, data, thumbnail=None, digest=None):
+        """Store a photo and return its token; raises PhotoTooLarge if it alone exceeds the budget."""
+        size = len(data) + (len(thumbnail[1]) if thumbnail is not None else 0)
+        if size > self.max_bytes:
+            raise PhotoTooLarge(f"Photo is too large to keep ({size} bytes, budget {self.max_bytes})")
+        token = str(uuid.uuid4())
+        with self._lock:
+            self._entries[token] = (media_type, data, time.monotonic())
+            self._bytes += len(data)
+            if thumbnail is not None:
+                self._thumbs[token] = thumbnail
+                self._bytes += len(thumbnail[1])
+            if digest is not None:
+                self._digests[token] = digest
+            self._evict_locked()
+        return token
+
+    def get(self, token):
+        """Return ``(media_type, data)`` for a live token, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            media_type, data, last_used = entry
+            if now - last_used > self.ttl:
+                self._remove_locked(token)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries[token] = (media_type, data, now)
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return media_type, data
+
+    def get_data_uri(self, token):
+        entry = self.get(token)
+        if entry is None:
+            return None
+        media_type, data = entry
+        return f"data:{media_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+    def get_thumbnail(self, token):
+        """Return ``(media_type, data)`` of the token's thumbnail (or the photo itself), or None."""
+        entry = self.get(token)
+        if entry is None:
+            return None
+        with self._lock:
+            return self._thumbs.get(token, entry)
+
+    def set_url(self, token, url):
+        with self._lock:
+            if token in self._entries:
+                self._urls[token] = url
+
+    def _touch_locked(self, token):
+        """Refresh a live token's last use without counting a hit; False if it is gone."""
+        now = time.monotonic()
+        entry = self._entries.get(token)
+        if entry is None or now - entry[2] > self.ttl:
+            return False
+        self._entries[token] = entry[:2] + (now,)
+        self._entries.move_to_end(token)
+        return True
+
+    def get_url(self, token):
+        """Return the hosted URL of a live token, or None."""
+        with self._lock:
+            return self._urls.get(token) if self._touch_locked(token) else None
+
+    def get_digest(self, token):
+        with self._lock:
+            return self._digests.get(token) if self._touch_locked(token) else None
+
+    def _remove_locked(self, token):
+        _, data, _ = self._entries.pop(token)
+        self._urls.pop(token, None)
+        self._digests.pop(token, None)
+        self._bytes -= len(data)
+        thumbnail = self._thumbs.pop(token, None)
+        if thumbnail is not None:
+            self._bytes -= len(thumbnail[1])
+
+    def _evict_locked(self):
+        now = time.monotonic()
+        # Entries are ordered by last use, so expired ones sit at the front
+        while self._entries:
+            token, (_, _, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.ttl:
+                break
+            self._remove_locked(token)
+            self.expirations += 1
+        while self._bytes > self.max_bytes:
+            token = next(iter(self._entries))
+            self._remove_locked(token)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hosted": len(self._urls),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def decode_data_uri(data_uri):
+    """Split a ``data:<type>;base64,<payload>`` URI into (media_type, bytes).
+
+    Raises ValueError if the URI is malformed.
+    """
+    try:
+        header, b64_data = data_uri.split(",", 1)
+        media_type = header.split(":", 1)[1].split(";")[0]
+        return media_type, base64.b64decode(b64_data, validate=True)
+    except (IndexError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid photo data URI: {e}") from e
+
+
+# Uploads are decoded once, turned upright and re-encoded as JPEG (dropping
+# EXIF such as GPS) within PHOTO_MAX_DIMENSION for fal.ai, plus a thumbnail
+# within PHOTO_THUMB_DIMENSION for gender detection.
+PHOTO_MAX_UPLOAD_BYTES = int(os.environ.get("PHOTO_MAX_UPLOAD_BYTES", 12 * 1024 * 1024))
+PHOTO_MAX_PIXELS = int(os.environ.get("PHOTO_MAX_PIXELS", 40_000_000))
+PHOTO_MAX_DIMENSION = int(os.environ.get("PHOTO_MAX_DIMENSION", 1536))
+PHOTO_THUMB_DIMENSION = int(os.environ.get("PHOTO_THUMB_DIMENSION", 384))
+PHOTO_JPEG_QUALITY = 90
+PHOTO_THUMB_JPEG_QUALITY = 80
+
+# Request bodies carry the photo as base64 (4/3 of its size) plus a little JSON
+app.config["MAX_CONTENT_LENGTH"] = PHOTO_MAX_UPLOAD_BYTES * 4 // 3 + 64 * 1024
+
+
+class PhotoTooLarge(ValueError):
+    """Raised for photos over PHOTO_MAX_UPLOAD_BYTES or PHOTO_MAX_PIXELS."""
+
+
+def _open_photo(photo_bytes):
+    if len(photo_bytes) > PHOTO_MAX_UPLOAD_BYTES:
+        raise PhotoTooLarge(f"Photo is larger than {PHOTO_MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    try:
+        img = Image.open(io.BytesIO(photo_bytes))
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not read photo: {e}") from e
+    if img.width * img.height > PHOTO_MAX_PIXELS:
+        raise PhotoTooLarge(f"Photo is too large ({img.width}x{img.height} pixels)")
+    return img
+
+
+def _fit_photo(img, max_dimension):
+    """Decode ``img`` upright and RGB with its long edge at most ``max_dimension``.
+
+    Pillow only decodes the pixels here, so a truncated or corrupt upload
+    fails in this function rather than in ``_open_photo``; it is raised as
+    ValueError either way.
+    """
+    try:
+        # For JPEGs, let libjpeg decode at 1/2, 1/4 or 1/8 scale when that is still big enough
+        img.draft("RGB", (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "PA", "P"):
+            # convert() turns a palette's transparency entry into alpha
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not read photo: {e}") from e
+    return img
+
+
+def _encode_jpeg(img, quality):
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def normalize_photo(photo_bytes):
+    """Return ``(fal_ready, thumbnail)`` ``(media_type, bytes)`` pairs from one decode of an upload.
+
+    Raises PhotoTooLarge for oversized uploads and ValueError for anything
+    Pillow cannot read.
+    """
+    img = _fit_photo(_open_photo(photo_bytes), PHOTO_MAX_DIMENSION)
+    thumb = img.copy()
+    thumb.thumbnail((PHOTO_THUMB_DIMENSION, PHOTO_THUMB_DIMENSION), Image.Resampling.LANCZOS)
+    return (
+        ("image/jpeg", _encode_jpeg(img, PHOTO_JPEG_QUALITY)),
+        ("image/jpeg", _encode_jpeg(thumb, PHOTO_THUMB_JPEG_QUALITY)),
+    )
+
+
+def photo_thumbnail(photo_bytes):
+    """Return just the gender-detection thumbnail for a photo that is not being stored."""
+    img = _fit_photo(_open_photo(photo_bytes), PHOTO_THUMB_DIMENSION)
+    return "image/jpeg", _encode_jpeg(img, PHOTO_THUMB_JPEG_QUALITY)
+
+
+_photo_store = PhotoStore(
+    max_bytes=int(os.environ.get("PHOTO_STORE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.environ.get("PHOTO_STORE_TTL", 2 * 60 * 60)),
+)
+
+
+# ---------------------------------------------------------------------------
+# Single-flight — collapse identical concurrent upstream calls into one
+# ---------------------------------------------------------------------------
+class _Flight:
+    __slots__ = ("done", "result", "error", "finished")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and hand its outcome to every caller.
+
+    The first caller for a key (the leader) runs ``fn``; callers arriving
+    while it is in flight block and receive the same return value or
+    exception. With ``linger`` > 0 a finished outcome is also reused for
+    that many seconds, which dedupes bursts of identical polls. Every caller
+    gets the same object, so ``fn`` should return something immutable such
+    as a SharedResponse; exceptions are never kept for ``linger``.
+    """
+
+    def __init__(self, name, linger=0.0):
+        self.name = name
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.collapsed = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.finished is not None \
+                    and time.monotonic() - flight.finished > self.linger:
+                del self._flights[key]
+                flight = None
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            self._note(leader)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flight.finished = time.monotonic()
+                if self.linger <= 0 or flight.error is not None:
+                    self._flights.pop(key, None)
+                elif len(self._flights) > 1000:
+                    self._prune()
+            flight.done.set()
+        return flight.result
+
+    def note(self, leader):
+        """Count one call made elsewhere (e.g. the asyncio serving mode) against this flight group."""
+        with self._lock:
+            self._note(leader)
+
+    def _note(self, leader):
+        if leader:
+            self.leaders += 1
+        else:
+            self.collapsed += 1
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, flight in list(self._flights.items()):
+            if flight.finished is not None and now - flight.finished > self.linger:
+                del self._flights[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "collapsed": self.collapsed,
+                "in_flight": sum(1 for f in self._flights.values() if f.finished is None),
+            }
+
+
+class SharedResponse(namedtuple("SharedResponse", ("status_code", "headers", "content"))):
+    """Read-only copy of an HTTP response that single-flight callers can share.
+
+    Works for requests and httpx responses alike. ``json()`` parses the body
+    afresh for each caller, so no caller sees another's mutations.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, response):
+        return cls(response.status_code, MappingProxyType(CaseInsensitiveDict(response.headers)), response.content)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+# ---------------------------------------------------------------------------
+# Upstream admission — token buckets with fair queuing across sessions
+# ---------------------------------------------------------------------------
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 60))
+ADMISSION_MAX_DEFERRALS = int(os.environ.get("ADMISSION_MAX_DEFERRALS", 3))
+
+# Session the current thread or task is calling upstream for; request
+# handlers fall back to the body's session_id or the client address
+current_admission_key = ContextVar("admission_key", default=None)
+
+
+class AdmissionTimeout(Exception):
+    """Raised when an upstream call is not admitted within its queue timeout."""
+
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``burst``; a rate of 0 never runs dry.
+
+    Not locked on its own, the owning AdmissionController's lock guards it.
+    ``updated`` may lie in the future while the bucket is paused.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if now > self.updated:
+            if self.rate:
+                self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+            else:
+                self.tokens = float(self.burst)
+            self.updated = now
+
+    def ready(self, now):
+        return now >= self.updated and self.tokens >= 1
+
+    def eta(self, now):
+        """Seconds until a token may be available."""
+        start = max(now, self.updated)
+        if self.tokens >= 1 or not self.rate:
+            return start - now
+        return start - now + (1 - self.tokens) / self.rate
+
+    def pause(self, now, seconds):
+        until = now + seconds
+        if until > self.updated:
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = until
+
+    def stats(self, now):
+        self.refill(now)
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(max(self.tokens, 0.0), 2),
+            "paused_for_s": round(max(self.updated - now, 0.0), 2),
+        }
+
+
+class _AdmissionWaiter:
+    __slots__ = ("key", "model", "buckets", "granted", "event")
+
+    def __init__(self, key, model, buckets):
+        self.key = key
+        self.model = model
+        self.buckets = buckets
+        self.granted = False
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """Token-bucket admission in front of one upstream, fair across sessions.
+
+    Every call takes a token from the upstream's bucket and from its model's
+    bucket. Calls that have to wait queue per session, and freed tokens go
+    round-robin across the waiting sessions, so one user's five-act fan-out
+    doesn't starve other users' single calls. ``defer`` pauses a model's
+    bucket after a 429 so every queued call backs off until Retry-After
+    instead of each retrying on its own.
+    """
+
+    def __init__(self, name, rate, burst, models=None, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.models = {model: TokenBucket(r, b) for model, (r, b) in (models or {}).items()}
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()  # session key -> deque of waiters, least recently served first
+        self.admitted = 0
+        self.deferrals = 0
+        self.timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def model_for(self, endpoint):
+        """The configured model an endpoint such as ``fal-ai/sora-2/image-to-video`` belongs to."""
+        for model in self.models:
+            if endpoint == model or endpoint.startswith(model + "/"):
+                return model
+        return endpoint
+
+    def _dispatch_locked(self, now):
+        self.bucket.refill(now)
+        for bucket in self.models.values():
+            bucket.refill(now)
+        while True:
+            for key, queue in self._queues.items():
+                waiter = next((w for w in queue if all(b.ready(now) for b in w.buckets)), None)
+                if waiter is not None:
+                    break
+            else:
+                return
+            queue.remove(waiter)
+            for bucket in waiter.buckets:
+                bucket.tokens -= 1
+            waiter.granted = True
+            waiter.event.set()
+            metrics.inc("admission_queued", -1, upstream=self.name)
+            # The session just served goes to the back of the rotation
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+
+    def _enqueue(self, model, key):
+        buckets = [self.bucket] + ([self.models[model]] if model in self.models else [])
+        waiter = _AdmissionWaiter(key, model, buckets)
+        metrics.inc("admission_queued", upstream=self.name)
+        with self._lock:
+            self._queues.setdefault(key, deque()).append(waiter)
+        return waiter
+
+    def _poll(self, waiter):
+        """Hand out due tokens; None once ``waiter`` is admitted, else seconds to wait before polling again."""
+        with self._lock:
+            now = time.monotonic()
+            self._dispatch_locked(now)
+            if waiter.granted:
+                return None
+            return max(max(b.eta(now) for b in waiter.buckets), 0.005)
+
+    def _give_up(self, waiter):
+        with self._lock:
+            if waiter.granted:
+                return False
+            queue = self._queues[waiter.key]
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.key]
+            self.timeouts += 1
+        metrics.inc("admission_queued", -1, upstream=self.name)
+        metrics.inc("admission_timeouts_total", upstream=self.name, model=waiter.model)
+        return True
+
+    def _admitted(self, waiter, waited):
+        with self._lock:
+            self.admitted += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        metrics.observe("admission_wait_seconds", waited, upstream=self.name, model=waiter.model)
+        return waited
+
+    def _timeout_error(self, model):
+        return AdmissionTimeout(f"Too many {self.name} requests for {model}, please retry shortly")
+
+    def acquire(self, model, key=None, timeout=None):
+        """Block until a call to ``model`` is admitted for session ``key``; returns the seconds waited."""
+        start = time.monotonic()
+        deadline = start + (self.queue_timeout if timeout is None else timeout)
+        waiter = self._enqueue(model, key)
+        while True:
+            wait = self._poll(waiter)
+            if wait is None:
+                return self._admitted(waiter, time.monotonic() - start)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and self._give_up(waiter):
+                raise self._timeout_error(model)
+            # Woken early when another caller's dispatch admits us
+            waiter.event.wait(max(min(wait, remaining), 0))
+
+    async def acquire_async(self, model, key=None, timeout=None):
+        """``acquire`` for the asyncio serving mode; polls instead of blocking the loop."""
+        start = time.monotonic()
+        deadline = start + (self.queue_timeout if timeout is None else timeout)
+        waiter = self._enqueue(model, key)
+        while True:
+            wait = self._poll(waiter)
+            if wait is None:
+                return self._admitted(waiter, time.monotonic() - start)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and self._give_up(waiter):
+                raise self._timeout_error(model)
+            await asyncio.sleep(max(min(wait, remaining, 0.05), 0))
+
+    def defer(self, model, seconds):
+        """Admit no calls to ``model`` (the whole upstream if it has no bucket) for ``seconds``."""
+        with self._lock:
+            self.deferrals += 1
+            self.models.get(model, self.bucket).pause(time.monotonic(), seconds)
+        metrics.inc("admission_deferrals_total", upstream=self.name, model=model)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                **self.bucket.stats(now),
+                "models": {model: bucket.stats(now) for model, bucket in self.models.items()},
+                "queued": sum(len(q) for q in self._queues.values()),
+                "sessions_waiting": len(self._queues),
+                "admitted": self.admitted,
+                "deferrals": self.deferrals,
+                "timeouts": self.timeouts,
+                "wait_avg_s": round(self._wait_total / self.admitted, 3) if self.admitted else 0.0,
+                "wait_max_s": round(self._wait_max, 3),
+            }
+
+
+def admission_key():
+    """Fair-share key of the current caller: its session, else the client's address."""
+    key = current_admission_key.get()
+    if key is None and has_request_context():
+        data = request.get_json(silent=True) if request.is_json else None
+        key = (data.get("session_id") if isinstance(data, dict) else None) or request.remote_addr
+    return key
+
+
+@contextmanager
+def admission_session(key):
+    """Queue upstream calls made inside the block (e.g. on worker threads) under session ``key``."""
+    token = current_admission_key.set(key)
+    try:
+        yield
+    finally:
+        current_admission_key.reset(token)
+
+
+def retry_after_seconds(value, attempt):
+    """How long to defer after a 429: the upstream's Retry-After, else exponential backoff."""
+    try:
+        return min(max(float(value), 0.5), 60.0)
+    except (TypeError, ValueError):
+        return min(2.0 ** attempt, 60.0)
+
+
+@app.errorhandler(AdmissionTimeout)
+def handle_admission_timeout(e):
+    log.warning(f"[ADMISSION] {e}")
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+# ---------------------------------------------------------------------------
+# fal.ai HTTP client — one pooled keep-alive session shared by all threads
+# ---------------------------------------------------------------------------
+# Overridable so the app can be pointed at a local stub fal server
+FAL_QUEUE_URL = os.environ.get("FAL_QUEUE_URL", "https://queue.fal.run").rstrip("/")
+FAL_STORAGE_URL = os.environ.get("FAL_STORAGE_URL", "https://rest.alpha.fal.ai").rstrip("/")
+
+# (connect, read) timeouts in seconds per kind of fal.ai call
+FAL_TIMEOUTS = {
+    "submit": (5, 60),
+    "status": (5, 15),
+    "result": (5, 30),
+    "upload": (5, 60),
+    "download": (5, 120),
+}
+
+
+class FalClient:
+    """Thread-safe wrapper around a pooled ``requests.Session`` for fal.ai.
+
+    urllib3 connection pools are thread-safe, so a single session is shared
+    by every gthread worker thread and TLS connections to queue.fal.run are
+    kept alive between polls instead of being re-established each time.
+
+    GETs are retried on 429/5xx and read errors. Other methods are only
+    retried when the connection could not be opened, i.e. before anything
+    was sent, so a job whose response is lost is never submitted twice; a
+    submission's 429 is deferred and resubmitted through ``admission``
+    instead.
+    """
+
+    def __init__(self, base_url, storage_url, api_key, pool_size, retries, admission, status_dedupe=0.0):
+        self.base_url = base_url
+        self.storage_url = storage_url
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.admission = admission
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(
+            pool_connections=8, pool_maxsize=pool_size, pool_block=False, max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._calls = {kind: 0 for kind in FAL_TIMEOUTS}
+        self._errors = {kind: 0 for kind in FAL_TIMEOUTS}
+        # Browser polls and the job poller hitting the same request_id share one GET
+        self.status_flights = SingleFlight("fal_status", linger=status_dedupe)
+
+    def _headers(self, json_body=False):
+        headers = {"Authorization": f"Key {self.api_key}"}
+        if json_body:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+    def request(self, method, url, kind, endpoint="", **kwargs):
+        """Send one request; ``endpoint`` (the fal.ai model path) only labels the metrics."""
+        kwargs.setdefault("timeout", FAL_TIMEOUTS[kind])
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._calls[kind] += 1
+        metrics.inc("fal_in_flight", kind=kind)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            if response.status_code >= 400:
+                with self._lock:
+                    self._errors[kind] += 1
+                metrics.inc("fal_errors_total", kind=kind, endpoint=endpoint)
+            return response
+        except Exception:
+            with self._lock:
+                self._errors[kind] += 1
+            metrics.inc("fal_errors_total", kind=kind, endpoint=endpoint)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            metrics.inc("fal_in_flight", -1, kind=kind)
+            metrics.observe("fal_request_seconds", time.monotonic() - start, kind=kind, endpoint=endpoint)
+
+    def submit(self, model, payload):
+        """Submit a job once admitted; on 429 the model's submissions are deferred and it is resubmitted."""
+        bucket = self.admission.model_for(model)
+        key = admission_key()
+        deadline = time.monotonic() + self.admission.queue_timeout
+        for attempt in range(ADMISSION_MAX_DEFERRALS + 1):
+            self.admission.acquire(bucket, key, timeout=deadline - time.monotonic())
+            response = self.request(
+                "POST", f"{self.base_url}/{model}", "submit", model,
+                headers=self._headers(json_body=True), json=payload,
+            )
+            if response.status_code != 429 or attempt == ADMISSION_MAX_DEFERRALS:
+                return response
+            delay = retry_after_seconds(response.headers.get("Retry-After"), attempt)
+            log.warning(f"[ADMISSION] fal.ai 429 on {model}, deferring {bucket} submissions {delay:.1f}s")
+            self.admission.defer(bucket, delay)
+
+    def status(self, model, request_id):
+        return self.status_flights.do((model, request_id), lambda: SharedResponse.of(self.request(
+            "GET", f"{self.base_url}/{model}/requests/{request_id}/status", "status", model,
+            headers=self._headers(),
+        )))
+
+    def result(self, model, request_id):
+        return self.request(
+            "GET", f"{self.base_url}/{model}/requests/{request_id}", "result", model,
+            headers=self._headers(),
+        )
+
+    def upload(self, data, media_type, file_name):
+        """Put ``data`` on the fal.ai CDN and return its public URL."""
+        initiate = self.request(
+            "POST", f"{self.storage_url}/storage/upload/initiate?storage_type=fal-cdn-v3", "upload", "storage",
+            headers=self._headers(json_body=True), json={"content_type": media_type, "file_name": file_name},
+        )
+        if initiate.status_code != 200:
+            raise RuntimeError(f"fal.ai storage error {initiate.status_code}: {initiate.text[:200]}")
+        target = initiate.json()
+        put = self.request(
+            "PUT", target["upload_url"], "upload", "storage",
+            headers={"Content-Type": media_type}, data=data,
+        )
+        if put.status_code >= 300:
+            raise RuntimeError(f"fal.ai storage upload error {put.status_code}: {put.text[:200]}")
+        return target["file_url"]
+
+    def download(self, url, **kwargs):
+        """GET an arbitrary (unauthenticated) URL such as a generated clip."""
+        return self.request("GET", url, "download", **kwargs)
+
+    def stats(self):
+        pools = {}
+        manager = self._adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            if pool.pool is None:
+                continue
+            # The LifoQueue is pre-filled with None placeholders; real
+            # connections are the non-None slots, checked-out ones are missing
+            slots = list(pool.pool.queue)
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "in_use": pool.pool.maxsize - len(slots),
+                "idle": sum(1 for conn in slots if conn is not None),
+                "maxsize": pool.pool.maxsize,
+            }
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "pool_size": self.pool_size,
+                "calls": dict(self._calls),
+                "errors": dict(self._errors),
+                "pools": pools,
+            }
+
+
+FAL_IMAGE_MODEL = "fal-ai/nano-banana-2"
+FAL_VIDEO_MODEL = "fal-ai/sora-2"
+
+# Job submissions per second (0 = unlimited, the default) and burst, account-wide
+# and per model; a 429 still pauses the upstream when throttling is off
+fal_admission = AdmissionController(
+    "fal",
+    rate=float(os.environ.get("FAL_SUBMIT_RATE", 0)),
+    burst=int(os.environ.get("FAL_SUBMIT_BURST", 20)),
+    models={
+        FAL_IMAGE_MODEL: (float(os.environ.get("FAL_IMAGE_SUBMIT_RATE", 0)),
+                          int(os.environ.get("FAL_IMAGE_SUBMIT_BURST", 10))),
+        FAL_VIDEO_MODEL: (float(os.environ.get("FAL_VIDEO_SUBMIT_RATE", 0)),
+                          int(os.environ.get("FAL_VIDEO_SUBMIT_BURST", 5))),
+    },
+)
+
+fal = FalClient(
+    base_url=FAL_QUEUE_URL,
+    storage_url=FAL_STORAGE_URL,
+    api_key=FAL_KEY,
+    pool_size=int(os.environ.get("FAL_POOL_SIZE", 16)),
+    retries=int(os.environ.get("FAL_MAX_RETRIES", 3)),
+    admission=fal_admission,
+    status_dedupe=float(os.environ.get("FAL_STATUS_DEDUPE_SECONDS", 1.0)),
+)
+
+
+# ---------------------------------------------------------------------------
+# Anthropic client — one shared client with per-model limits and metrics
+# ---------------------------------------------------------------------------
+OPUS_MODEL = "claude-opus-4-6"
+HAIKU_MODEL = "claude-haiku-4-5-20251001"
+
+# Per-model concurrency cap, request timeout, how long a caller may wait
+# for admission and a free slot (seconds), and admitted calls per second
+# (0 = unlimited, the default) with their burst.  Separate caps keep a burst of slow Opus
+# storyboard calls from starving quick Haiku calls such as gender detection.
+LLM_MODEL_LIMITS = {
+    OPUS_MODEL: {
+        "max_concurrency": int(os.environ.get("LLM_OPUS_CONCURRENCY", 6)),
+        "timeout": float(os.environ.get("LLM_OPUS_TIMEOUT", 180)),
+        "queue_timeout": float(os.environ.get("LLM_OPUS_QUEUE_TIMEOUT", 120)),
+        "rate": float(os.environ.get("LLM_OPUS_RATE", 0)),
+        "burst": int(os.environ.get("LLM_OPUS_BURST", 10)),
+    },
+    HAIKU_MODEL: {
+        "max_concurrency": int(os.environ.get("LLM_HAIKU_CONCURRENCY", 6)),
+        "timeout": float(os.environ.get("LLM_HAIKU_TIMEOUT", 30)),
+        "queue_timeout": float(os.environ.get("LLM_HAIKU_QUEUE_TIMEOUT", 30)),
+        "rate": float(os.environ.get("LLM_HAIKU_RATE", 0)),
+        "burst": int(os.environ.get("LLM_HAIKU_BURST", 20)),
+    },
+}
+
+anthropic_admission = AdmissionController(
+    "anthropic",
+    rate=float(os.environ.get("ANTHROPIC_RATE", 0)),
+    burst=int(os.environ.get("ANTHROPIC_BURST", 20)),
+    models={model: (cfg["rate"], cfg["burst"]) for model, cfg in LLM_MODEL_LIMITS.items()},
+)
+
+
+class LLMBusyError(Exception):
+    """Raised when no concurrency slot frees up for a model in time."""
+
+
+class LLMClient:
+    """Process-wide Anthropic client shared by all request threads.
+
+    The underlying ``Anthropic`` client (and its httpx connection pool) is
+    thread-safe and built once on first use.  Each model gets its own
+    semaphore, timeout and latency/token counters.  Calls are admitted
+    through ``admission`` first; a 429 that outlasts the SDK's own retries
+    defers the model there and the call queues again.
+    """
+
+    def __init__(self, api_key, limits, admission):
+        self.api_key = api_key
+        self.limits = limits
+        self.admission = admission
+        self._client = None
+        self._lock = threading.Lock()
+        self._semaphores = {
+            model: threading.BoundedSemaphore(cfg["max_concurrency"])
+            for model, cfg in limits.items()
+        }
+        self._metrics = {model: self._new_metrics() for model in limits}
+        self.flights = SingleFlight("llm")
+
+    @staticmethod
+    def _new_metrics():
+        return {
+            "calls": 0,
+            "errors": 0,
+            "busy_rejections": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            "latency_total_s": 0.0,
+            "latency_max_s": 0.0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = Anthropic(api_key=self.api_key, max_retries=2)
+        return self._client
+
+    def _acquire(self, model):
+        """Wait for admission and one of ``model``'s concurrency slots, raising LLMBusyError on timeout."""
+        if model not in self.limits:
+            raise ValueError(f"No LLM limits configured for model {model}")
+        cfg = self.limits[model]
+        counters = self._metrics[model]
+
+        with self._lock:
+            counters["waiting"] += 1
+        metrics.inc("llm_waiting", model=model)
+        try:
+            waited = self.admission.acquire(model, admission_key(), timeout=cfg["queue_timeout"])
+            acquired = self._semaphores[model].acquire(timeout=max(cfg["queue_timeout"] - waited, 0))
+        except AdmissionTimeout:
+            acquired = False
+        with self._lock:
+            counters["waiting"] -= 1
+            if not acquired:
+                counters["busy_rejections"] += 1
+            else:
+                counters["in_flight"] += 1
+        metrics.inc("llm_waiting", -1, model=model)
+        if not acquired:
+            metrics.inc("llm_busy_rejections_total", model=model)
+            raise LLMBusyError(f"Too many concurrent {model} requests, please retry shortly")
+        metrics.inc("llm_in_flight", model=model)
+        return cfg
+
+    async def acquire_slot_async(self, model, timeout):
+        """Take one of ``model``'s concurrency slots for the asyncio serving mode; polls instead of blocking the loop.
+
+        Both serving modes draw on the same semaphores, so native async
+        routes and thread-pool work together stay within ``max_concurrency``.
+        """
+        deadline = time.monotonic() + timeout
+        semaphore = self._semaphores[model]
+        while not semaphore.acquire(blocking=False):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(remaining, 0.05))
+        return True
+
+    def release_slot(self, model):
+        self._semaphores[model].release()
+
+    def _release(self, model, elapsed, message):
+        self.release_slot(model)
+        with self._lock:
+            self._metrics[model]["in_flight"] -= 1
+        metrics.inc("llm_in_flight", -1, model=model)
+        self.record(model, elapsed, message)
+
+    def defer(self, model, error, attempt):
+        """Pause ``model``'s admission after a 429; re-raise once the deferrals are used up."""
+        if attempt == ADMISSION_MAX_DEFERRALS:
+            raise error
+        delay = retry_after_seconds(error.response.headers.get("retry-after"), attempt)
+        log.warning(f"[ADMISSION] Anthropic 429 on {model}, deferring its calls {delay:.1f}s")
+        self.admission.defer(model, delay)
+
+    def create(self, model, **kwargs):
+        """Call ``messages.create`` for ``model`` within its admission and concurrency limits."""
+        for attempt in range(ADMISSION_MAX_DEFERRALS + 1):
+            cfg = self._acquire(model)
+            start = time.monotonic()
+            message = None
+            try:
+                message = self.client.messages.create(model=model, timeout=cfg["timeout"], **kwargs)
+                return message
+            except RateLimitError as e:
+                self.defer(model, e, attempt)
+            finally:
+                self._release(model, time.monotonic() - start, message)
+
+    def stream(self, model, **kwargs):
+        """Yield the text deltas of a streamed ``messages`` call within ``model``'s admission and concurrency limits.
+
+        The slot is held until the generator is exhausted or closed. A 429
+        arrives before any text, so a deferred stream is simply reopened.
+        """
+        for attempt in range(ADMISSION_MAX_DEFERRALS + 1):
+            cfg = self._acquire(model)
+            start = time.monotonic()
+            message = None
+            try:
+                with self.client.messages.stream(model=model, timeout=cfg["timeout"], **kwargs) as stream:
+                    for text in stream.text_stream:
+                        yield text
+                    message = stream.get_final_message()
+                return
+            except RateLimitError as e:
+                self.defer(model, e, attempt)
+            finally:
+                self._release(model, time.monotonic() - start, message)
+
+    def create_shared(self, model, **kwargs):
+        """Like ``create``, but identical concurrent calls share one upstream request.
+
+        The key is the full request (model, prompt and parameters), so
+        double-clicks and client retries don't each pay for a model call.
+        """
+        key = hashlib.sha256(json.dumps([model, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+        return self.flights.do(key, lambda: self.create(model, **kwargs))
+
+    def record(self, model, elapsed, message):
+        """Account one finished call; ``message`` is None if the call raised."""
+        counters = self._metrics[model]
+        usage = getattr(message, "usage", None)
+        tokens = {
+            kind: getattr(usage, f"{kind}_tokens", 0) or 0
+            for kind in ("input", "output", "cache_creation_input", "cache_read_input")
+        }
+        with self._lock:
+            counters["calls"] += 1
+            if message is None:
+                counters["errors"] += 1
+            for kind, count in tokens.items():
+                counters[f"{kind}_tokens"] += count
+            counters["latency_total_s"] += elapsed
+            counters["latency_max_s"] = max(counters["latency_max_s"], elapsed)
+        metrics.observe("llm_request_seconds", elapsed, model=model)
+        if message is None:
+            metrics.inc("llm_errors_total", model=model)
+        for kind, count in tokens.items():
+            if count:
+                metrics.inc("llm_tokens_total", count, model=model, type=kind)
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for model, counters in self._metrics.items():
+                entry = dict(counters)
+                entry["latency_avg_s"] = (
+                    counters["latency_total_s"] / counters["calls"] if counters["calls"] else 0.0
+                )
+                entry["max_concurrency"] = self.limits[model]["max_concurrency"]
+                entry["timeout_s"] = self.limits[model]["timeout"]
+                out[model] = entry
+        return out
+
+
+llm = LLMClient(api_key=ANTHROPIC_API_KEY, limits=LLM_MODEL_LIMITS, admission=anthropic_admission)
+
+
+@app.errorhandler(LLMBusyError)
+def handle_llm_busy(e):
+    log.warning(f"[LLM] {e}")
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Response cache — persistent SQLite store for expensive LLM outputs
+# ---------------------------------------------------------------------------
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "sorashorts"))
+STORYBOARD_CACHE_ENABLED = os.environ.get("STORYBOARD_CACHE", "1") != "0"
+
+# Bump when the storyboard prompt changes so stale entries are not served
+STORYBOARD_PROMPT_VERSION = 1
+STORYBOARD_ACT_COUNT = 5
+USER_NAME_PLACEHOLDER = "{{USER_NAME}}"
+
+
+class ResponseCache:
+    """Namespaced JSON key/value cache with TTL and a per-namespace entry cap.
+
+    Backed by a single SQLite connection guarded by a lock, so it is safe to
+    share across request threads and survives process restarts.
+    """
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _counters(self, namespace):
+        return self._stats.setdefault(
+            namespace, {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        )
+
+    def get(self, namespace, key):
+        now = time.time()
+        with self._lock:
+            counters = self._counters(namespace)
+            row = self._conn.execute(
+                "SELECT value, created FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+                    )
+                counters["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache SET last_used = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+            counters["hits"] += 1
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value):
+        now = time.time()
+        encoded = json.dumps(value)
+        with self._lock:
+            counters = self._counters(namespace)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, encoded, now, now),
+            )
+            counters["stores"] += 1
+            evicted = self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache WHERE namespace = ?"
+                " ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (namespace, namespace, self.max_entries),
+            ).rowcount
+            counters["evictions"] += max(evicted, 0)
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM cache GROUP BY namespace"
+            ).fetchall())
+            out = {}
+            for namespace in set(sizes) | set(self._stats):
+                counters = dict(self._counters(namespace))
+                lookups = counters["hits"] + counters["misses"]
+                counters["entries"] = sizes.get(namespace, 0)
+                counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+                out[namespace] = counters
+            return out
+
+
+def storyboard_cache_key(show_name, gender):
+    gender = "female" if gender == "female" else "male"
+    raw = json.dumps([STORYBOARD_PROMPT_VERSION, normalize_show_name(show_name), gender])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+response_cache = ResponseCache(
+    path=os.path.join(CACHE_DIR, "responses.sqlite3"),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 7 * 24 * 60 * 60)),
+    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 2000)),
+)
+
+
+# ---------------------------------------------------------------------------
+# Session events — per-session event log streamed to the browser over SSE
+# ---------------------------------------------------------------------------
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+# Request threads: gunicorn --threads under gthread, the WSGI bridge's pool
+# under asgi_app. The deployed ASGI mode streams events on its event loop;
+# when this app is served by gthread directly each open stream pins a thread,
+# so the cap defaults to a quarter of them
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 12))
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", max(WORKER_THREADS // 4, 1)))
+SSE_STREAM_SECONDS = float(os.environ.get("SSE_STREAM_SECONDS", 55))
+SSE_HEARTBEAT_SECONDS = 15.0
+
+
+class SessionEvents:
+    """Bounded, replayable event log per generation session.
+
+    Publishers append events with increasing ids; stream handlers block on a
+    condition variable until something newer than their Last-Event-ID is
+    available, so waiting streams cost no CPU and make no upstream calls.
+    Event-loop streams register a ``listen`` callback instead of blocking.
+    """
+
+    def __init__(self, max_events, ttl):
+        self.max_events = max_events
+        self.ttl = ttl
+        self._sessions = {}
+        self._listeners = {}  # session_id -> callables run after each publish
+        self._cond = threading.Condition()
+        self.published = 0
+
+    def _session_locked(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {
+                "events": deque(maxlen=self.max_events),
+                "next_id": 0,
+                "touched": time.monotonic(),
+            }
+        return session
+
+    def publish(self, session_id, event, data):
+        if not session_id:
+            return
+        with self._cond:
+            now = time.monotonic()
+            for stale in [sid for sid, s in self._sessions.items() if now - s["touched"] > self.ttl]:
+                del self._sessions[stale]
+            session = self._session_locked(session_id)
+            session["next_id"] += 1
+            session["events"].append((session["next_id"], event, data))
+            session["touched"] = now
+            self.published += 1
+            self._cond.notify_all()
+            listeners = list(self._listeners.get(session_id, ()))
+        for callback in listeners:
+            callback()
+
+    def listen(self, session_id, callback):
+        """Call ``callback()`` from the publishing thread whenever ``session_id`` gets an event."""
+        with self._cond:
+            self._listeners.setdefault(session_id, set()).add(callback)
+
+    def unlisten(self, session_id, callback):
+        with self._cond:
+            listeners = self._listeners.get(session_id)
+            if listeners is not None:
+                listeners.discard(callback)
+                if not listeners:
+                    del self._listeners[session_id]
+
+    def wait(self, session_id, after_id, timeout):
+        """Return events newer than ``after_id``, blocking up to ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                session = self._session_locked(session_id)
+                session["touched"] = time.monotonic()
+                events = [e for e in session["events"] if e[0] > after_id]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            return {"sessions": len(self._sessions), "published": self.published}
+
+
+session_bus = SessionEvents(max_events=200, ttl=2 * 60 * 60)
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+# ---------------------------------------------------------------------------
+# Job manager — polls fal.ai server-side so browsers only hit /api/jobs
+# ---------------------------------------------------------------------------
+# Poll interval starts at min_interval and backs off towards max_interval;
+# jobs still unfinished after `deadline` seconds are marked FAILED.
+JOB_KINDS = {
+    "image": {"model": FAL_IMAGE_MODEL, "min_interval": 2.0, "max_interval": 6.0, "deadline": 10 * 60},
+    "video": {"model": FAL_VIDEO_MODEL, "min_interval": 5.0, "max_interval": 15.0, "deadline": 30 * 60},
+}
+JOB_TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+
+
+def extract_image_url(result):
+    """Return the image URL from a nano-banana result (mirrors extractImageURL in app.js)."""
+    if result.get("images"):
+        return result["images"][0].get("url")
+    if (result.get("image") or {}).get("url"):
+        return result["image"]["url"]
+    if (result.get("output") or {}).get("images"):
+        return result["output"]["images"][0].get("url")
+    return None
+
+
+def extract_video_url(result):
+    return (result.get("video") or {}).get("url")
+
+
+def job_result_url(kind, result):
+    if not result:
+        return None
+    return extract_image_url(result) if kind == "image" else extract_video_url(result)
+
+
+class Job:
+    def __init__(self, request_id, kind, session_id=None):
+        self.request_id = request_id
+        self.kind = kind
+        self.session_id = session_id
+        self.status = "IN_QUEUE"
+        self.queue_position = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.polls = 0
+        self.interval = JOB_KINDS[kind]["min_interval"]
+        self.next_poll = time.monotonic() + self.interval
+        self.on_done = []  # callables run once with the Job when it finishes
+
+    @property
+    def done(self):
+        return self.status in JOB_TERMINAL_STATUSES
+
+    def to_dict(self):
+        out = {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "updated": self.updated,
+        }
+        if self.queue_position is not None:
+            out["queue_position"] = self.queue_position
+        if self.result is not None:
+            out["result"] = self.result
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+    def to_record(self):
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "status": self.status,
+            "result_url": job_result_url(self.kind, self.result),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record["request_id"], record["kind"], record["session_id"])
+        job.status = record["status"]
+        job.result = record["result"]
+        job.error = record["error"]
+        job.created = record["created"]
+        job.updated = record["updated"]
+        job.next_poll = time.monotonic()
+        return job
+
+
+class JobStore:
+    """Durable record of every fal.ai submission and pipeline session.
+
+    Same layout as ResponseCache — one SQLite connection in WAL mode behind a
+    lock — so request threads, poll workers and pipeline workers can all
+    write to it. Jobs still in flight when the process stopped are read back
+    and polled again instead of being re-submitted, and pipeline snapshots
+    let a session carry on from the stages it had already finished.
+    """
+
+    JOB_COLUMNS = ("request_id", "kind", "session_id", "status", "result_url", "result", "error",
+                   "created", "updated")
+
+    def __init__(self, path, retention):
+        self.path = path
+        self.retention = retention
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " request_id TEXT PRIMARY KEY, kind TEXT NOT NULL, session_id TEXT,"
+            " status TEXT NOT NULL, result_url TEXT, result TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, status TEXT NOT NULL, state TEXT NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.writes = 0
+
+    def _job_from_row(self, row):
+        record = dict(zip(self.JOB_COLUMNS, row))
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        return record
+
+    def save_job(self, record):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (request_id, kind, session_id, status, result_url,"
+                " result, error, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record["request_id"], record["kind"], record["session_id"], record["status"],
+                    record["result_url"],
+                    json.dumps(record["result"]) if record["result"] is not None else None,
+                    record["error"], record["created"], record["updated"],
+                ),
+            )
+            self.writes += 1
+            self._maybe_prune_locked()
+
+    def load_job(self, request_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.JOB_COLUMNS)} FROM jobs WHERE request_id = ?", (request_id,)
+            ).fetchone()
+        return self._job_from_row(row) if row is not None else None
+
+    def pending_jobs(self):
+        """Jobs that had not reached COMPLETED or FAILED when they were last saved."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.JOB_COLUMNS)} FROM jobs"
+                " WHERE status NOT IN (?, ?) ORDER BY created",
+                JOB_TERMINAL_STATUSES,
+            ).fetchall()
+        return [self._job_from_row(row) for row in rows]
+
+    def session_jobs(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.JOB_COLUMNS)} FROM jobs WHERE session_id = ? ORDER BY created",
+                (session_id,),
+            ).fetchall()
+        return [self._job_from_row(row) for row in rows]
+
+    def save_session(self, session_id, status, state):
+        encoded = json.dumps(state)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, status, state, updated) VALUES (?, ?, ?, ?)",
+                (session_id, status, encoded, time.time()),
+            )
+            self.writes += 1
+            self._maybe_prune_locked()
+
+    def load_session(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def running_sessions(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, state FROM sessions WHERE status = 'RUNNING' ORDER BY updated"
+            ).fetchall()
+        return [(session_id, json.loads(state)) for session_id, state in rows]
+
+    def _maybe_prune_locked(self):
+        now = time.time()
+        if now - self._last_prune < 10 * 60:
+            return
+        self._last_prune = now
+        cutoff = now - self.retention
+        pruned = self._conn.execute(
+            "DELETE FROM jobs WHERE updated < ? AND status IN (?, ?)", (cutoff, *JOB_TERMINAL_STATUSES)
+        ).rowcount
+        pruned += self._conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+        if pruned > 0:
+            log.info(f"[JOB-STORE] Pruned {pruned} rows older than {self.retention:.0f}s")
+
+    def stats(self):
+        with self._lock:
+            by_status = {
+                f"{kind}:{status}": count
+                for kind, status, count in self._conn.execute(
+                    "SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"
+                ).fetchall()
+            }
+            sessions = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM sessions GROUP BY status"
+            ).fetchall())
+            return {"jobs": by_status, "sessions": sessions, "writes": self.writes}
+
+
+class JobManager:
+    """Track outstanding fal.ai requests and poll them from one background thread.
+
+    Each sweep collects the jobs that are due and polls them concurrently over
+    the shared fal session, then backs off each job's interval so long-running
+    Sora renders are polled less often than quick image edits.  Finished jobs
+    are kept for ``retention`` seconds so late readers still see the result.
+    Every submission and status change is written through to ``store``, and
+    jobs evicted from memory (or lost to a restart) are reloaded from it.
+    """
+
+    def __init__(self, fal_client, poll_workers, retention, on_change=None, store=None):
+        self.fal = fal_client
+        self.retention = retention
+        self.on_change = on_change
+        self.store = store
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=poll_workers, thread_name_prefix="job-poll")
+        self._thread = None
+        self.sweeps = 0
+        self.upstream_polls = 0
+        self.restored = 0
+
+    def _ensure_thread_locked(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="job-manager", daemon=True)
+            self._thread.start()
+        self._wakeup.notify()
+
+    def _lookup(self, request_id):
+        """Return the job from memory, falling back to the store."""
+        with self._lock:
+            job = self._jobs.get(request_id)
+        if job is not None or self.store is None:
+            return job
+        record = self.store.load_job(request_id)
+        if record is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None:
+                job = self._jobs[request_id] = Job.from_record(record)
+                if not job.done:
+                    log.info(f"[JOBS] Resuming {job.kind} job {request_id} from the store")
+                    self._ensure_thread_locked()
+            return job
+
+    def restore(self):
+        """Resume polling every job the store still lists as in flight, e.g. after a restart."""
+        if self.store is None:
+            return 0
+        records = self.store.pending_jobs()
+        with self._lock:
+            for record in records:
+                if record["request_id"] not in self._jobs:
+                    self._jobs[record["request_id"]] = Job.from_record(record)
+                    self.restored += 1
+            if records:
+                self._ensure_thread_locked()
+        if records:
+            log.info(f"[JOBS] Resumed polling for {len(records)} in-flight jobs from {self.store.path}")
+        return len(records)
+
+    def _persist(self, record):
+        if self.store is None:
+            return
+        try:
+            self.store.save_job(record)
+        except sqlite3.Error as e:
+            log.error(f"[JOBS] Could not save job {record['request_id']}: {e}")
+
+    def track(self, request_id, kind, session_id=None, on_done=None):
+        """Start polling ``request_id``; ``on_done(job)`` runs once it is COMPLETED or FAILED."""
+        created = False
+        run_now = False
+        self._lookup(request_id)
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None:
+                job = self._jobs[request_id] = Job(request_id, kind, session_id)
+                created = True
+                log.info(f"[JOBS] Tracking {kind} job {request_id}")
+            if on_done is not None:
+                if job.done:
+                    run_now = True
+                else:
+                    job.on_done.append(on_done)
+            self._ensure_thread_locked()
+            snapshot = job.to_dict()
+            record = job.to_record()
+        if created:
+            self._persist(record)
+            self._notify(job, snapshot)
+        if run_now:
+            self._run_callbacks(job, [on_done])
+        return job
+
+    def _run_callbacks(self, job, callbacks):
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                log.error(f"[JOBS] on_done callback failed for {job.request_id}: {e}")
+
+    def _notify(self, job, snapshot):
+        if self.on_change is not None and job.session_id:
+            try:
+                self.on_change(job.session_id, job.kind, snapshot)
+            except Exception as e:
+                log.error(f"[JOBS] on_change listener failed: {e}")
+
+    def get(self, request_id):
+        return self._lookup(request_id)
+
+    def describe(self, request_id):
+        job = self._lookup(request_id)
+        if job is None:
+            return None
+        with self._lock:
+            return job.to_dict()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = [j for j in self._jobs.values() if not j.done and j.next_poll <= now]
+                if not due:
+                    pending = [j.next_poll for j in self._jobs.values() if not j.done]
+                    timeout = min(pending) - now if pending else 30.0
+                    self._wakeup.wait(timeout=max(timeout, 0.05))
+                    self._prune_locked()
+                    continue
+            self.sweeps += 1
+            for future in [self._executor.submit(self._poll, job) for job in due]:
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(f"[JOBS] Poll worker error: {e}")
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.retention
+        for request_id in [rid for rid, j in self._jobs.items() if j.done and j.updated < cutoff]:
+            del self._jobs[request_id]
+
+    def _poll(self, job):
+        cfg = JOB_KINDS[job.kind]
+        status, queue_position, result, error = job.status, job.queue_position, None, None
+        try:
+            response = self.fal.status(cfg["model"], job.request_id)
+            body = response.json()
+            upstream_status = body.get("status", status)
+            queue_position = body.get("queue_position")
+            if upstream_status != "COMPLETED":
+                status = upstream_status
+            else:
+                # Only report COMPLETED once the result is in hand; throttled or
+                # unavailable result fetches are retried on the next tick
+                result_resp = self.fal.result(cfg["model"], job.request_id)
+                if result_resp.status_code == 200:
+                    status, result = "COMPLETED", result_resp.json()
+                elif result_resp.status_code == 429 or result_resp.status_code >= 500:
+                    log.warning(f"[JOBS] Result fetch for {job.kind} job {job.request_id} returned "
+                                f"{result_resp.status_code}, retrying")
+                else:
+                    status, error = "FAILED", result_resp.text[:500]
+        except Exception as e:
+            # Transient upstream/network problems: keep the job and retry later
+            log.warning(f"[JOBS] Poll failed for {job.kind} job {job.request_id}: {e}")
+
+        if status not in JOB_TERMINAL_STATUSES and time.time() - job.created > cfg["deadline"]:
+            status, error = "FAILED", "Timed out waiting for fal.ai"
+
+        with self._lock:
+            self.upstream_polls += 1
+            job.polls += 1
+            changed = status != job.status
+            if changed:
+                log.info(f"[JOBS] {job.kind} job {job.request_id}: {job.status} -> {status}")
+                job.updated = time.time()
+                if status in JOB_TERMINAL_STATUSES:
+                    metrics.observe("job_seconds", job.updated - job.created, kind=job.kind, status=status)
+            job.status = status
+            job.queue_position = queue_position
+            job.result = result if result is not None else job.result
+            job.error = error if error is not None else job.error
+            job.interval = min(job.interval * 1.5, cfg["max_interval"])
+            job.next_poll = time.monotonic() + job.interval
+            snapshot = job.to_dict()
+            record = job.to_record()
+            callbacks = []
+            if job.done:
+                callbacks, job.on_done = job.on_done, []
+        if changed:
+            self._persist(record)
+            self._notify(job, snapshot)
+        self._run_callbacks(job, callbacks)
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for job in self._jobs.values():
+                key = f"{job.kind}:{job.status}"
+                by_status[key] = by_status.get(key, 0) + 1
+            return {
+                "tracked": len(self._jobs),
+                "by_status": by_status,
+                "sweeps": self.sweeps,
+                "upstream_polls": self.upstream_polls,
+                "restored": self.restored,
+            }
+
+
+job_store = JobStore(
+    path=JOB_STORE_PATH,
+    retention=float(os.environ.get("JOB_STORE_RETENTION", 24 * 60 * 60)),
+)
+
+jobs = JobManager(
+    fal_client=fal,
+    poll_workers=int(os.environ.get("JOB_POLL_WORKERS", 4)),
+    retention=float(os.environ.get("JOB_RETENTION", 60 * 60)),
+    on_change=session_bus.publish,
+    store=job_store,
+)
+
+
+@app.errorhandler(413)
+def handle_request_too_large(e):
+    return jsonify({"error": f"Request too large, photos are limited to "
+                             f"{PHOTO_MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
 
 
 @app.errorhandler(Exception)
@@ -54,155 +1931,506 @@ def health():
     })
 
 
-@app.route("/api/detect-gender", methods=["POST"])
-def detect_gender():
-    data = request.json
-    photo = data["photo"]  # base64 data URI
+@app.route("/api/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of upstream latency, in-flight, error and token metrics."""
+    metrics.clear("jobs_tracked")
+    for key, count in jobs.stats()["by_status"].items():
+        kind, status = key.split(":", 1)
+        metrics.set("jobs_tracked", count, kind=kind, status=status)
+    queue = merge_queue.stats()
+    metrics.set("merge_queue_depth", queue["queue_depth"])
+    metrics.set("merge_running", queue["running"])
+    metrics.clear("pipelines")
+    for status, count in pipelines.stats()["by_status"].items():
+        metrics.set("pipelines", count, status=status)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-    # Parse the data URI to extract media type and base64 data
-    # Format: data:image/jpeg;base64,/9j/4AAQ...
-    header, b64_data = photo.split(",", 1)
-    media_type = header.split(":")[1].split(";")[0]
 
-    client = Anthropic(api_key=ANTHROPIC_API_KEY, timeout=600.0)
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=10,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": b64_data,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": "Is the person in this photo male or female? Reply with only one word: male or female",
+@app.route("/api/stats")
+def stats():
+    return jsonify({
+        "photo_store": _photo_store.stats(),
+        "fal_pool": fal.stats(),
+        "llm": llm.stats(),
+        "response_cache": response_cache.stats(),
+        "jobs": jobs.stats(),
+        "job_store": job_store.stats(),
+        "session_events": session_bus.stats(),
+        "merged_cache": merged_cache.stats(),
+        "merge_queue": merge_queue.stats(),
+        "sanitizer": sora_sanitizer.stats(),
+        "pipelines": pipelines.stats(),
+        "admission": {
+            "fal": fal_admission.stats(),
+            "anthropic": anthropic_admission.stats(),
+        },
+        "coalesced": {
+            "llm": llm.flights.stats(),
+            "fal_status": fal.status_flights.stats(),
+            "photo_upload": _photo_uploads.stats(),
+        },
+    })
+
+
+def build_gender_messages(media_type, b64_data):
+    """Return the Haiku vision messages asking whether the photo shows a man or a woman."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": media_type,
+                        "data": b64_data,
                     },
-                ],
-            }
-        ],
-    )
+                },
+                {
+                    "type": "text",
+                    "text": "Is the person in this photo male or female? Reply with only one word: male or female",
+                },
+            ],
+        }
+    ]
 
-    gender = message.content[0].text.strip().lower()
-    # Normalize to "male" or "female"
-    if "female" in gender or "woman" in gender:
-        gender = "female"
+
+def gender_cache_key(digest):
+    return hashlib.sha256(json.dumps([HAIKU_MODEL, digest]).encode("utf-8")).hexdigest()
+
+
+def prepare_gender_detection(data):
+    """Return ``(detection, None)`` for a request body, or ``(None, (error_body, status))``.
+
+    ``detection`` holds the ``digest`` of the uploaded bytes and either the
+    cached ``gender`` for that digest or, on a miss, the thumbnail
+    (``media_type``, ``b64_data``) to send Haiku: the one cached for
+    ``photo_token``, or one made from the ``photo`` data URI. A cache hit
+    skips decoding the photo altogether.
+    """
+    photo_token = data.get("photo_token")
+    if photo_token and not data.get("photo"):
+        digest = _photo_store.get_digest(photo_token)
+        thumbnail = _photo_store.get_thumbnail(photo_token)
+        if thumbnail is None:
+            return None, ({
+                "error": "Photo token expired, please upload your photo again",
+                "code": "photo_token_expired",
+            }, 410)
+        photo_bytes = None
     else:
-        gender = "male"
+        try:
+            photo_bytes = decode_data_uri(data.get("photo") or "")[1]
+        except ValueError as e:
+            return None, ({"error": str(e)}, 400)
+        digest = hashlib.sha256(photo_bytes).hexdigest()
+    detection = {"digest": digest, "gender": None}
+    if digest is not None:
+        cached = response_cache.get("gender", gender_cache_key(digest))
+        if cached is not None:
+            detection["gender"] = cached["gender"]
+            return detection, None
+    if photo_bytes is not None:
+        try:
+            thumbnail = photo_thumbnail(photo_bytes)
+        except PhotoTooLarge as e:
+            return None, ({"error": str(e)}, 413)
+        except ValueError as e:
+            return None, ({"error": str(e)}, 400)
+    detection["media_type"] = thumbnail[0]
+    detection["b64_data"] = base64.b64encode(thumbnail[1]).decode("ascii")
+    return detection, None
 
-    log.info(f"[DETECT-GENDER] Detected: {gender}")
-    return jsonify({"gender": gender})
 
+def remember_gender(detection, gender):
+    if detection["digest"] is not None:
+        response_cache.set("gender", gender_cache_key(detection["digest"]), {"gender": gender})
 
-@app.route("/api/generate-storyboard", methods=["POST"])
-def generate_storyboard():
+
+def detect_photo_gender(detection):
+    """Return ``(gender, cached)`` for a prepared detection, asking Haiku on a cache miss."""
+    if detection["gender"] is not None:
+        return detection["gender"], True
+    message = llm.create_shared(
+        HAIKU_MODEL,
+        max_tokens=10,
+        messages=build_gender_messages(detection["media_type"], detection["b64_data"]),
+    )
+    gender = parse_gender(message.content[0].text)
+    remember_gender(detection, gender)
+    return gender, False
+
+
+def parse_gender(text):
+    """Normalize the model's reply to "male" or "female"."""
+    gender = text.strip().lower()
+    if "female" in gender or "woman" in gender:
+        return "female"
+    return "male"
+
+
+@app.route("/api/detect-gender", methods=["POST"])
+def detect_gender():
     data = request.json
-    show_name = data["show_name"]
-    gender = data.get("gender", "male")
-    user_name = data.get("user_name", "the protagonist")
+    detection, error = prepare_gender_detection(data)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    gender, cached = detect_photo_gender(detection)
+    log.info(f"[DETECT-GENDER] Detected: {gender}{' (cached)' if cached else ''}")
+    return jsonify({"gender": gender, "cached": cached})
 
+
+def build_storyboard_prompt(show_name, gender, user_name):
+    """Return the Opus prompt asking for a 5-act storyboard of ``show_name``."""
     if gender == "female":
         gender_upper = "FEMALE"
         pronoun_sub = "she"
-        pronoun_obj = "her"
         pronoun_pos = "her"
     else:
         gender_upper = "MALE"
         pronoun_sub = "he"
-        pronoun_obj = "him"
         pronoun_pos = "his"
 
-    client = Anthropic(api_key=ANTHROPIC_API_KEY, timeout=600.0)
+    return (
+        f"You are a storyboard artist for a short drama fan fiction of '{show_name}'. "
+        f"The user's name is '{user_name}' and {pronoun_sub} will be cast as the {gender_upper} lead/love interest character. "
+        f"A reference photo of {user_name} will be provided to the image generator.\n\n"
+        f"You must follow the ACTUAL plot, storyline, and iconic scenes of '{show_name}'. "
+        f"Use the real character names (except the {gender} lead, who is {user_name}), real locations, "
+        f"and real plot points from the show/movie. The 5 acts should retell the key dramatic beats "
+        f"of '{show_name}' faithfully — not a generic romance, but the specific story audiences know and love. "
+        f"Include signature moments, settings, and conflicts that are unique to '{show_name}'.\n\n"
+        f"Each act should build on the previous one and represent "
+        f"a major dramatic beat in the story.\n\n"
+        f"IMPORTANT RULES FOR SCENE DESCRIPTIONS ('scenes' field):\n"
+        f"- Use '{user_name}' to refer to the {gender} lead (the user), not 'the man'/'the woman'.\n"
+        f"- For the OTHER protagonist (love interest / co-lead), use their real character name "
+        f"from '{show_name}' (e.g. 'Rachel Chu', 'Edward Cullen', 'Ri Jeong-hyeok').\n\n"
+        f"IMPORTANT RULES FOR THE 'prompt' FIELD (image generation):\n"
+        f"- The prompt must depict SCENE 1 of the act — the opening/starting moment.\n"
+        f"- BOTH the {gender} lead AND the love interest must appear together in EVERY image. "
+        f"Always describe both characters' positions, actions, and expressions.\n"
+        f"- Refer to the {gender} lead as 'the {gender} from the reference photo'. "
+        f"Describe {pronoun_pos} actions, pose, and expression, "
+        f"but do NOT describe {pronoun_pos} physical appearance (hair color, skin tone, etc.) since "
+        f"{pronoun_pos} look comes from the reference photo.\n"
+        f"- For the OTHER protagonist (the love interest / co-lead), ALWAYS use their full character name "
+        f"from '{show_name}' (e.g. 'Rachel Chu', 'Edward Cullen', 'Ri Jeong-hyeok'). "
+        f"The image generator knows these characters and will generate them accurately by name. "
+        f"Include their name in every prompt.\n"
+        f"- You may also name other supporting characters from the show for accuracy.\n\n"
+        f"For each act, provide:\n"
+        f"- A 'title': a dramatic 3-6 word title for the act\n"
+        f"- A 'prompt': an image generation prompt (2-3 sentences) for SCENE 1 of this act. "
+        f"Describe the visual composition with BOTH protagonists together, "
+        f"setting, cinematic lighting/mood/camera angle, in 9:16 portrait format.\n"
+        f"- A 'scenes': an array of exactly 4 strings, each a short 1-sentence scene description "
+        f"summarizing what happens in that part of the act. Do NOT include 'Scene X:' prefixes — "
+        f"just the description itself, e.g. '{user_name} arrives at the grand estate for the first time'.\n\n"
+        f"Return ONLY a JSON array of 5 objects, each with 'act_number' (1-5), 'title', 'prompt', and 'scenes'. "
+        f"No markdown, no explanation, just the JSON array."
+    )
+
 
-    try:
-        log.info(f"[STORYBOARD] Calling Claude for show='{show_name}', gender={gender}, user_name='{user_name}'")
-        message = client.messages.create(
-            model="claude-opus-4-6",
-            max_tokens=2000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": (
-                        f"You are a storyboard artist for a short drama fan fiction of '{show_name}'. "
-                        f"The user's name is '{user_name}' and {pronoun_sub} will be cast as the {gender_upper} lead/love interest character. "
-                        f"A reference photo of {user_name} will be provided to the image generator.\n\n"
-                        f"You must follow the ACTUAL plot, storyline, and iconic scenes of '{show_name}'. "
-                        f"Use the real character names (except the {gender} lead, who is {user_name}), real locations, "
-                        f"and real plot points from the show/movie. The 5 acts should retell the key dramatic beats "
-                        f"of '{show_name}' faithfully — not a generic romance, but the specific story audiences know and love. "
-                        f"Include signature moments, settings, and conflicts that are unique to '{show_name}'.\n\n"
-                        f"Each act should build on the previous one and represent "
-                        f"a major dramatic beat in the story.\n\n"
-                        f"IMPORTANT RULES FOR SCENE DESCRIPTIONS ('scenes' field):\n"
-                        f"- Use '{user_name}' to refer to the {gender} lead (the user), not 'the man'/'the woman'.\n"
-                        f"- For the OTHER protagonist (love interest / co-lead), use their real character name "
-                        f"from '{show_name}' (e.g. 'Rachel Chu', 'Edward Cullen', 'Ri Jeong-hyeok').\n\n"
-                        f"IMPORTANT RULES FOR THE 'prompt' FIELD (image generation):\n"
-                        f"- The prompt must depict SCENE 1 of the act — the opening/starting moment.\n"
-                        f"- BOTH the {gender} lead AND the love interest must appear together in EVERY image. "
-                        f"Always describe both characters' positions, actions, and expressions.\n"
-                        f"- Refer to the {gender} lead as 'the {gender} from the reference photo'. "
-                        f"Describe {pronoun_pos} actions, pose, and expression, "
-                        f"but do NOT describe {pronoun_pos} physical appearance (hair color, skin tone, etc.) since "
-                        f"{pronoun_pos} look comes from the reference photo.\n"
-                        f"- For the OTHER protagonist (the love interest / co-lead), ALWAYS use their full character name "
-                        f"from '{show_name}' (e.g. 'Rachel Chu', 'Edward Cullen', 'Ri Jeong-hyeok'). "
-                        f"The image generator knows these characters and will generate them accurately by name. "
-                        f"Include their name in every prompt.\n"
-                        f"- You may also name other supporting characters from the show for accuracy.\n\n"
-                        f"For each act, provide:\n"
-                        f"- A 'title': a dramatic 3-6 word title for the act\n"
-                        f"- A 'prompt': an image generation prompt (2-3 sentences) for SCENE 1 of this act. "
-                        f"Describe the visual composition with BOTH protagonists together, "
-                        f"setting, cinematic lighting/mood/camera angle, in 9:16 portrait format.\n"
-                        f"- A 'scenes': an array of exactly 4 strings, each a short 1-sentence scene description "
-                        f"summarizing what happens in that part of the act. Do NOT include 'Scene X:' prefixes — "
-                        f"just the description itself, e.g. '{user_name} arrives at the grand estate for the first time'.\n\n"
-                        f"Return ONLY a JSON array of 5 objects, each with 'act_number' (1-5), 'title', 'prompt', and 'scenes'. "
-                        f"No markdown, no explanation, just the JSON array."
-                    ),
-                }
-            ],
-        )
-    except Exception as e:
-        log.error(f"[STORYBOARD] Claude API error: {e}")
-        log.error(traceback.format_exc())
-        return jsonify({"error": f"Claude API error: {str(e)}"}), 502
+def parse_storyboard(raw):
+    """Strip optional markdown code fences and parse the storyboard JSON array.
 
-    raw = message.content[0].text.strip()
-    # Strip markdown code fences if present
+    Raises json.JSONDecodeError if the text is not valid JSON.
+    """
+    raw = raw.strip()
     if raw.startswith("```"):
         raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
         if raw.endswith("```"):
             raw = raw[:-3].strip()
+    return json.loads(raw)
+
+
+class StoryboardStreamParser:
+    """Incrementally pull complete act objects out of a streamed storyboard JSON array.
+
+    Text before the opening ``[`` (e.g. a Markdown code fence) is skipped and
+    ``feed`` returns the acts whose closing brace arrived with that chunk, so
+    act 1 can be used while the model is still writing act 2. Raises
+    json.JSONDecodeError if a completed object is not valid JSON. ``complete``
+    tells a finished storyboard from one cut off at ``max_tokens``.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.acts = []
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self.closed = False
+
+    @property
+    def complete(self):
+        """True once the array has closed with every act of the storyboard."""
+        return self.closed and len(self.acts) == STORYBOARD_ACT_COUNT
+
+    def feed(self, chunk):
+        self.raw += chunk
+        completed = []
+        text = self.raw
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self.closed:
+                break
+            if not self._in_array:
+                self._in_array = ch == "["
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    act = json.loads(text[self._object_start:i + 1])
+                    self.acts.append(act)
+                    completed.append(act)
+            elif ch == "]" and self._depth == 0:
+                self.closed = True
+        self._pos = len(text)
+        return completed
 
-    log.info(f"[STORYBOARD] Raw Claude response: {raw[:500]}")
 
+def normalize_show_name(show_name):
+    """Fold case, punctuation and whitespace so trivially different spellings share a cache key."""
+    folded = re.sub(r"[^\w\s]", "", show_name.casefold())
+    return " ".join(folded.split())
+
+
+def _map_strings(value, fn):
+    if isinstance(value, str):
+        return fn(value)
+    if isinstance(value, list):
+        return [_map_strings(v, fn) for v in value]
+    if isinstance(value, dict):
+        return {k: _map_strings(v, fn) for k, v in value.items()}
+    return value
+
+
+def fill_user_name(acts, user_name):
+    """Substitute ``user_name`` for the placeholder in every string of a cached storyboard."""
+    return _map_strings(acts, lambda text: text.replace(USER_NAME_PLACEHOLDER, user_name))
+
+
+def template_user_name(acts, user_name):
+    """Inverse of ``fill_user_name``: put the placeholder back wherever ``user_name`` appears as a word."""
+    pattern = re.compile(rf"(?<!\w){re.escape(user_name)}(?!\w)")
+    return _map_strings(acts, lambda text: pattern.sub(USER_NAME_PLACEHOLDER, text))
+
+
+def store_storyboard(cache_key, acts, show_name, user_name):
+    """Cache a placeholder storyboard and return it with ``user_name`` filled in."""
+    # Only share the response if the model kept the placeholder intact
+    if USER_NAME_PLACEHOLDER in json.dumps(acts):
+        response_cache.set("storyboard", cache_key, acts)
+    else:
+        log.warning(f"[STORYBOARD] Placeholder missing from response for '{show_name}', not caching")
+    return fill_user_name(acts, user_name)
+
+
+def prepare_storyboard(data):
+    """Resolve a storyboard request body into a ``plan`` for either serving mode.
+
+    ``plan`` holds the show, gender and user name, the Opus ``prompt``, the
+    ``cache_key`` (None when the request opts out of the cache) and, on a
+    hit, the ``cached`` acts with the user's name filled in.
+    """
+    show_name = data["show_name"]
+    gender = data.get("gender", "male")
+    user_name = data.get("user_name", "the protagonist")
+    use_cache = STORYBOARD_CACHE_ENABLED and not data.get("no_cache")
+    plan = {"show_name": show_name, "gender": gender, "user_name": user_name, "cache_key": None, "cached": None}
+
+    # Storyboards are generated against a name placeholder so one Opus
+    # response can be shared by every user who picks the same show.
+    if use_cache:
+        plan["cache_key"] = storyboard_cache_key(show_name, gender)
+        cached = response_cache.get("storyboard", plan["cache_key"])
+        if cached is not None:
+            log.info(f"[STORYBOARD] Cache hit for show='{show_name}', gender={gender}")
+            plan["cached"] = fill_user_name(cached, user_name)
+    plan["prompt"] = build_storyboard_prompt(show_name, gender, USER_NAME_PLACEHOLDER if use_cache else user_name)
+    return plan
+
+
+def finish_storyboard(plan, raw):
+    """Parse a complete Opus response for ``plan`` and cache it, as a ``(body, status)`` pair."""
+    raw = raw.strip()
+    if LOG_PAYLOADS:
+        log.info(f"[STORYBOARD] Raw Claude response: {raw[:500]}")
     try:
-        acts = json.loads(raw)
+        acts = parse_storyboard(raw)
     except json.JSONDecodeError as e:
         log.error(f"[STORYBOARD] JSON parse error: {e}")
         log.error(f"[STORYBOARD] Raw text: {raw[:1000]}")
-        return jsonify({"error": "Failed to parse storyboard response"}), 502
+        return {"error": "Failed to parse storyboard response"}, 502
+    if plan["cache_key"] is not None:
+        acts = store_storyboard(plan["cache_key"], acts, plan["show_name"], plan["user_name"])
+    return {"acts": acts, "cached": False}, 200
 
-    return jsonify({"acts": acts})
 
+def finish_storyboard_stream(plan, parser):
+    """Return the closing ``(event, payload)`` of a streamed storyboard, caching it only if complete."""
+    if LOG_PAYLOADS:
+        log.info(f"[STORYBOARD] Raw Claude response: {parser.raw.strip()[:500]}")
+    if not parser.complete:
+        log.error(f"[STORYBOARD] Incomplete storyboard for show='{plan['show_name']}': {len(parser.acts)} acts, "
+                  f"array {'closed' if parser.closed else 'unterminated'}")
+        return "error", {"error": "Storyboard response was incomplete"}
+    acts = parser.acts
+    if plan["cache_key"] is not None:
+        acts = store_storyboard(plan["cache_key"], acts, plan["show_name"], plan["user_name"])
+    return "done", {"acts": acts, "cached": False}
 
-@app.route("/api/expand-video-prompt", methods=["POST"])
-def expand_video_prompt():
-    """Use Opus to expand 4 scene descriptions into a detailed Sora 2 video prompt."""
+
+def storyboard_stream_error(parser, e):
+    """Map an exception raised while streaming a storyboard to its ``error`` payload."""
+    if isinstance(e, LLMBusyError):
+        return {"error": str(e), "retry_after": 5}
+    if isinstance(e, json.JSONDecodeError):
+        log.error(f"[STORYBOARD] JSON parse error: {e}")
+        log.error(f"[STORYBOARD] Raw text: {parser.raw[:1000]}")
+        return {"error": "Failed to parse storyboard response"}
+    log.error(f"[STORYBOARD] Claude API error: {e}")
+    log.error(traceback.format_exc())
+    return {"error": f"Claude API error: {str(e)}"}
+
+
+@app.route("/api/generate-storyboard", methods=["POST"])
+def generate_storyboard():
     data = request.json
-    show_name = data["show_name"]
-    act_title = data["act_title"]
-    scenes = data["scenes"]  # array of 4 short scene strings
-    all_acts = data.get("all_acts", [])
+    if data.get("stream"):
+        # The body is generated after the request context is gone, so resolve
+        # the caller's fair-share key now
+        return Response(
+            _storyboard_ndjson(data, admission_key()),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    session_id = data.get("session_id")
+    session_bus.publish(session_id, "storyboard", {"status": "IN_PROGRESS"})
+    try:
+        body, status = _generate_storyboard(data)
+    except Exception as e:
+        session_bus.publish(session_id, "storyboard", {"status": "FAILED", "error": str(e)})
+        raise
+    if status == 200:
+        session_bus.publish(session_id, "storyboard", {"status": "COMPLETED", "acts": body["acts"]})
+    else:
+        session_bus.publish(session_id, "storyboard", {"status": "FAILED", "error": body["error"]})
+    return jsonify(body), status
+
+
+def _generate_storyboard(data):
+    """Produce the storyboard for a request body as a ``(body, status)`` pair."""
+    plan = prepare_storyboard(data)
+    if plan["cached"] is not None:
+        return {"acts": plan["cached"], "cached": True}, 200
+
+    try:
+        log.info(f"[STORYBOARD] Calling Claude for show='{plan['show_name']}', gender={plan['gender']}, "
+                 f"user_name='{plan['user_name']}'")
+        message = llm.create_shared(
+            OPUS_MODEL,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": plan["prompt"]}],
+        )
+    except LLMBusyError:
+        raise
+    except Exception as e:
+        log.error(f"[STORYBOARD] Claude API error: {e}")
+        log.error(traceback.format_exc())
+        return {"error": f"Claude API error: {str(e)}"}, 502
+
+    return finish_storyboard(plan, message.content[0].text)
 
+
+EXPAND_INSTRUCTIONS = (
+    "Expand each scene into a detailed video prompt with:\n"
+    "- Vivid description of the physical action, movement, and emotion\n"
+    "- Camera movement and angles (dolly, pan, close-up, wide shot, etc.)\n"
+    "- Dialogue written as 'the man says: \"...\"' or 'the woman says: \"...\"'\n"
+    "- Write original dialogue that captures the emotional essence — "
+    "do NOT use verbatim lines from any existing work\n\n"
+    "CRITICAL RULES:\n"
+    "- NO character names, NO show/movie titles, NO copyrighted references. "
+    "Use only 'the man', 'the woman', 'the older woman', 'the friend', etc.\n"
+    "- AVOID words that trigger content filters: no kiss, passionate, intimate, sexual, "
+    "naked, nude, blood, kill, death, gun, stab, drug, alcohol, profanity. "
+    "Use softer alternatives: 'lean close' instead of 'kiss', 'tender' instead of 'intimate', "
+    "'wounded' instead of 'bloody', 'defeat' instead of 'kill', 'yearning' instead of 'desire'.\n\n"
+    "Return the result as a single string with this exact format:\n"
+    "Scene 1: [detailed prompt]\nScene 2: [detailed prompt]\n"
+    "Scene 3: [detailed prompt]\nScene 4: [detailed prompt]\n\n"
+    "Each scene prompt should be 2-3 sentences. Return ONLY the formatted scenes, "
+    "no preamble or explanation."
+)
+
+
+def storyboard_stream_line(session_id, event, payload):
+    """Mirror one streamed storyboard event onto the session bus and return its NDJSON line."""
+    if event == "act":
+        session_bus.publish(session_id, "storyboard", {"status": "IN_PROGRESS", "act": payload["act"]})
+    elif event == "done":
+        session_bus.publish(session_id, "storyboard", {"status": "COMPLETED", "acts": payload["acts"]})
+    else:
+        session_bus.publish(session_id, "storyboard", {"status": "FAILED", "error": payload["error"]})
+    return json.dumps({"event": event, **payload}) + "\n"
+
+
+def _storyboard_ndjson(data, key):
+    session_id = data.get("session_id")
+    session_bus.publish(session_id, "storyboard", {"status": "IN_PROGRESS"})
+    with admission_session(key):
+        for event, payload in _stream_storyboard(data):
+            yield storyboard_stream_line(session_id, event, payload)
+
+
+def _stream_storyboard(data):
+    """Yield ``(event, payload)`` pairs for a storyboard request body.
+
+    One ``act`` event per act as soon as its JSON object is complete, then
+    either ``done`` with every act or a single ``error``.
+    """
+    plan = prepare_storyboard(data)
+    if plan["cached"] is not None:
+        for act in plan["cached"]:
+            yield "act", {"act": act}
+        yield "done", {"acts": plan["cached"], "cached": True}
+        return
+
+    parser = StoryboardStreamParser()
+    try:
+        log.info(f"[STORYBOARD] Streaming Claude for show='{plan['show_name']}', gender={plan['gender']}, "
+                 f"user_name='{plan['user_name']}'")
+        for text in llm.stream(OPUS_MODEL, max_tokens=2000, messages=[{"role": "user", "content": plan["prompt"]}]):
+            for act in parser.feed(text):
+                log.info(f"[STORYBOARD] Act {len(parser.acts)} streamed for show='{plan['show_name']}'")
+                yield "act", {"act": fill_user_name(act, plan["user_name"])}
+    except Exception as e:
+        yield "error", storyboard_stream_error(parser, e)
+        return
+    yield finish_storyboard_stream(plan, parser)
+
+
+def build_expand_prompt(show_name, act_title, scenes, all_acts):
+    """Return the Opus prompt expanding an act's 4 scenes into a Sora 2 video prompt."""
     acts_context = "\n".join(
         f"Act {a.get('act_number', i+1)}: {a.get('title', '')}"
         for i, a in enumerate(all_acts)
@@ -210,75 +2438,361 @@ def expand_video_prompt():
 
     scenes_text = "\n".join(f"Scene {i+1}: {s}" for i, s in enumerate(scenes))
 
-    client = Anthropic(api_key=ANTHROPIC_API_KEY, timeout=600.0)
-    message = client.messages.create(
-        model="claude-opus-4-6",
+    return (
+        f"You are creating a detailed video generation prompt for a 16-second drama clip.\n\n"
+        f"This is for Act '{act_title}' of a drama inspired by '{show_name}'.\n\n"
+        f"Full story context:\n{acts_context}\n\n"
+        f"The 4 scenes in this act:\n{scenes_text}\n\n"
+        + EXPAND_INSTRUCTIONS
+    )
+
+
+def build_expand_context(show_name, acts):
+    """Return the system blocks shared by every act of a batch expansion.
+
+    The whole storyboard and the instructions go into one block marked for
+    prompt caching, so only the first act's call pays full input price.
+    """
+    acts_context = "\n".join(
+        f"Act {a.get('act_number', i+1)}: {a.get('title', '')}\n"
+        + "\n".join(f"  Scene {j+1}: {s}" for j, s in enumerate(a.get("scenes", [])))
+        for i, a in enumerate(acts)
+    )
+    text = (
+        f"You are creating detailed video generation prompts for the 16-second drama clips "
+        f"of a drama inspired by '{show_name}'. Each clip covers one act.\n\n"
+        f"Full story context:\n{acts_context}\n\n"
+        f"You will be given one act at a time. "
+        + EXPAND_INSTRUCTIONS
+    )
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def build_expand_act_message(act, index):
+    """Return the per-act user message that follows ``build_expand_context``."""
+    scenes_text = "\n".join(f"Scene {i+1}: {s}" for i, s in enumerate(act.get("scenes", [])))
+    return (
+        f"Act {act.get('act_number', index + 1)}: '{act.get('title', '')}'\n\n"
+        f"The 4 scenes in this act:\n{scenes_text}"
+    )
+
+
+# Expanded prompts are cached per act with the user's name templated back
+# to the placeholder, so every user of a cached storyboard shares them
+EXPAND_CACHE_ENABLED = os.environ.get("EXPAND_CACHE", "1") != "0"
+EXPAND_PROMPT_VERSION = 1
+
+
+def expand_cache_key(show_name, inputs):
+    raw = json.dumps([EXPAND_PROMPT_VERSION, normalize_show_name(show_name), inputs], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _expand_cacheable(user_name):
+    return EXPAND_CACHE_ENABLED and bool(user_name and user_name.strip())
+
+
+def remember_expansion(namespace, key, entry, text):
+    """Cache an expansion made from placeholder inputs unless the model mangled the placeholder."""
+    if "USER_NAME" in text.replace(USER_NAME_PLACEHOLDER, ""):
+        log.warning("[EXPAND-VIDEO-PROMPTS] Placeholder mangled in expansion, not caching")
+        return
+    response_cache.set(namespace, key, entry)
+
+
+def prepare_expansion(data):
+    """Resolve a single-act expand request body into a ``plan`` for either serving mode.
+
+    ``plan`` holds the Opus ``prompt``, the ``cache_key`` (None unless the
+    request names its user) and, on a hit, the ``cached`` prompt with the
+    user's name filled in.
+    """
+    show_name = data["show_name"]
+    act_title = data["act_title"]
+    scenes = data["scenes"]  # array of 4 short scene strings
+    all_acts = data.get("all_acts", [])
+    user_name = data.get("user_name")
+    plan = {"user_name": user_name, "cache_key": None, "cached": None}
+    if _expand_cacheable(user_name):
+        act_title, scenes, all_acts = template_user_name([act_title, scenes, all_acts], user_name)
+        plan["cache_key"] = expand_cache_key(show_name, [act_title, scenes, all_acts])
+        cached = response_cache.get("expand_act", plan["cache_key"])
+        if cached is not None:
+            log.info(f"[EXPAND-VIDEO-PROMPT] Cache hit for '{show_name}' act '{act_title}'")
+            plan["cached"] = fill_user_name(cached, user_name)
+    plan["prompt"] = build_expand_prompt(show_name, act_title, scenes, all_acts)
+    return plan
+
+
+def finish_expansion(plan, video_prompt):
+    """Cache a fresh single-act expansion for ``plan`` and return the response body."""
+    video_prompt = video_prompt.strip()
+    if LOG_PAYLOADS:
+        log.info(f"[EXPAND-VIDEO-PROMPT] Response: {video_prompt[:500]}")
+    if plan["cache_key"] is not None:
+        remember_expansion("expand_act", plan["cache_key"], video_prompt, video_prompt)
+        video_prompt = fill_user_name(video_prompt, plan["user_name"])
+    return {"video_prompt": video_prompt, "cached": False}
+
+
+@app.route("/api/expand-video-prompt", methods=["POST"])
+def expand_video_prompt():
+    """Use Opus to expand 4 scene descriptions into a detailed Sora 2 video prompt."""
+    plan = prepare_expansion(request.json)
+    if plan["cached"] is not None:
+        return jsonify({"video_prompt": plan["cached"], "cached": True})
+    message = llm.create_shared(OPUS_MODEL, max_tokens=2000, messages=[{"role": "user", "content": plan["prompt"]}])
+    return jsonify(finish_expansion(plan, message.content[0].text))
+
+
+EXPAND_BATCH_WORKERS = int(os.environ.get("EXPAND_BATCH_WORKERS", 4))
+_expand_pool = ThreadPoolExecutor(max_workers=EXPAND_BATCH_WORKERS, thread_name_prefix="expand")
+
+
+def expand_act(system, act, index):
+    """Expand one act of a batch against the shared cached ``system`` context."""
+    message = llm.create_shared(
+        OPUS_MODEL,
         max_tokens=2000,
-        messages=[
-            {
-                "role": "user",
-                "content": (
-                    f"You are creating a detailed video generation prompt for a 16-second drama clip.\n\n"
-                    f"This is for Act '{act_title}' of a drama inspired by '{show_name}'.\n\n"
-                    f"Full story context:\n{acts_context}\n\n"
-                    f"The 4 scenes in this act:\n{scenes_text}\n\n"
-                    f"Expand each scene into a detailed video prompt with:\n"
-                    f"- Vivid description of the physical action, movement, and emotion\n"
-                    f"- Camera movement and angles (dolly, pan, close-up, wide shot, etc.)\n"
-                    f"- Dialogue written as 'the man says: \"...\"' or 'the woman says: \"...\"'\n"
-                    f"- Write original dialogue that captures the emotional essence — "
-                    f"do NOT use verbatim lines from any existing work\n\n"
-                    f"CRITICAL RULES:\n"
-                    f"- NO character names, NO show/movie titles, NO copyrighted references. "
-                    f"Use only 'the man', 'the woman', 'the older woman', 'the friend', etc.\n"
-                    f"- AVOID words that trigger content filters: no kiss, passionate, intimate, sexual, "
-                    f"naked, nude, blood, kill, death, gun, stab, drug, alcohol, profanity. "
-                    f"Use softer alternatives: 'lean close' instead of 'kiss', 'tender' instead of 'intimate', "
-                    f"'wounded' instead of 'bloody', 'defeat' instead of 'kill', 'yearning' instead of 'desire'.\n\n"
-                    f"Return the result as a single string with this exact format:\n"
-                    f"Scene 1: [detailed prompt]\nScene 2: [detailed prompt]\n"
-                    f"Scene 3: [detailed prompt]\nScene 4: [detailed prompt]\n\n"
-                    f"Each scene prompt should be 2-3 sentences. Return ONLY the formatted scenes, "
-                    f"no preamble or explanation."
-                ),
-            }
-        ],
+        system=system,
+        messages=[{"role": "user", "content": build_expand_act_message(act, index)}],
     )
+    return message.content[0].text.strip()
+
+
+def prepare_expansions(show_name, acts, user_name=None, refresh=False):
+    """Plan a batch expansion for either serving mode.
+
+    ``plan["acts"]`` are the acts to send, with the user's name templated out
+    when the batch can be cached; ``keys`` are their per-act cache keys (None
+    otherwise), ``results`` holds the cache hits (unless ``refresh``) and
+    ``todo`` the indexes still to expand. Only the fields the expand prompts
+    read take part in the keys, so the browser's trimmed acts and the
+    pipeline's full ones share entries.
+    """
+    plan = {"show_name": show_name, "user_name": user_name, "acts": acts, "keys": None}
+    if _expand_cacheable(user_name):
+        inputs = [
+            {"act_number": act.get("act_number", i + 1), "title": act.get("title", ""),
+             "scenes": act.get("scenes", [])}
+            for i, act in enumerate(acts)
+        ]
+        plan["acts"] = template_user_name(inputs, user_name)
+        plan["keys"] = [expand_cache_key(show_name, [plan["acts"], i]) for i in range(len(acts))]
+    plan["results"] = [None] * len(acts)
+    if plan["keys"] and not refresh:
+        plan["results"] = [response_cache.get("expand", key) for key in plan["keys"]]
+    plan["todo"] = [i for i, entry in enumerate(plan["results"]) if entry is None]
+    if not plan["todo"]:
+        log.info(f"[EXPAND-VIDEO-PROMPTS] {len(acts)} acts for '{show_name}' served from cache")
+    return plan
+
+
+def finish_expansions(plan):
+    """Cache the freshly expanded acts of ``plan`` and return its results with the user's name filled in."""
+    if plan["keys"] is None:
+        return plan["results"]
+    for i in plan["todo"]:
+        entry = plan["results"][i]
+        if "video_prompt" in entry:
+            remember_expansion("expand", plan["keys"][i], entry, entry["video_prompt"])
+    return fill_user_name(plan["results"], plan["user_name"])
+
+
+def expand_acts(show_name, acts, user_name=None, refresh=False):
+    """Expand every act of a storyboard into a sanitised Sora 2 video prompt.
+
+    The storyboard is sent once as a cached system prompt. The first act runs
+    alone so its response writes the prompt cache; the remaining acts then run
+    in parallel on the shared ``EXPAND_BATCH_WORKERS`` pool and read it.
+    Returns one entry per act; a failed act carries an ``error`` instead of a
+    ``video_prompt``.
+
+    With ``user_name`` the acts are expanded with the name templated out and
+    served from / stored in the response cache per act (``refresh`` skips
+    the lookup).
+    """
+    plan = prepare_expansions(show_name, acts, user_name, refresh)
+    acts, results, todo = plan["acts"], plan["results"], plan["todo"]
+    if not todo:
+        return finish_expansions(plan)
 
-    video_prompt = message.content[0].text.strip()
-    log.info(f"[EXPAND-VIDEO-PROMPT] Response: {video_prompt[:500]}")
+    system = build_expand_context(show_name, acts)
+    key = admission_key()
 
-    return jsonify({"video_prompt": video_prompt})
+    def run(index):
+        act = acts[index]
+        entry = {"act_number": act.get("act_number", index + 1)}
+        try:
+            with admission_session(key):
+                # Counted when build_video_payload sanitises it again on submit
+                entry["video_prompt"] = sanitize_sora_prompt(expand_act(system, act, index), record=False)
+        except Exception as e:
+            log.error(f"[EXPAND-VIDEO-PROMPTS] Act {entry['act_number']} failed: {e}")
+            entry["error"] = str(e)
+        results[index] = entry
+
+    start = time.monotonic()
+    run(todo[0])
+    list(_expand_pool.map(run, todo[1:]))
+    failed = sum(1 for r in results if "error" in r)
+    log.info(f"[EXPAND-VIDEO-PROMPTS] {len(todo)} of {len(acts)} acts for '{show_name}' in "
+             f"{time.monotonic() - start:.1f}s ({failed} failed)")
+    return finish_expansions(plan)
+
+
+@app.route("/api/expand-video-prompts", methods=["POST"])
+def expand_video_prompts():
+    """Expand every act of a storyboard into a sanitised Sora 2 video prompt (see ``expand_acts``)."""
+    data = request.json
+    acts = data.get("acts") or []
+    if not acts:
+        return jsonify({"error": "No acts provided"}), 400
+    return jsonify({"video_prompts": expand_acts(data["show_name"], acts, data.get("user_name"))})
+
+
+# Where image jobs fetch the reference photo from: "fal" uploads it once to
+# fal.ai storage, "local" serves it from /api/photos/<token> under
+# PHOTO_PUBLIC_BASE_URL (must be reachable by fal.ai), "inline" embeds the
+# data URI in every submission as before.
+PHOTO_HOSTING = os.environ.get("PHOTO_HOSTING", "fal")
+PHOTO_PUBLIC_BASE_URL = os.environ.get("PHOTO_PUBLIC_BASE_URL", "").rstrip("/")
+if PHOTO_HOSTING == "local" and not PHOTO_PUBLIC_BASE_URL:
+    log.warning("[UPLOAD-PHOTO] PHOTO_HOSTING=local needs PHOTO_PUBLIC_BASE_URL; inlining photos instead")
+    PHOTO_HOSTING = "inline"
+
+_photo_uploads = SingleFlight("photo_upload")
+_photo_hosting = ThreadPoolExecutor(max_workers=4, thread_name_prefix="photo-host")
+# After a failed fal.ai storage upload the token's image jobs inline the photo
+# for this long instead of each waiting out another upload attempt
+PHOTO_UPLOAD_RETRY_SECONDS = float(os.environ.get("PHOTO_UPLOAD_RETRY_SECONDS", 60))
+_photo_upload_failures = {}  # token -> monotonic time until which uploads are skipped
+_photo_upload_failures_lock = threading.Lock()
+
+
+def _photo_upload_failed_recently(token):
+    with _photo_upload_failures_lock:
+        until = _photo_upload_failures.get(token)
+        if until is not None and until <= time.monotonic():
+            del _photo_upload_failures[token]
+            until = None
+        return until is not None
+
+
+def _remember_photo_upload_failure(token):
+    now = time.monotonic()
+    with _photo_upload_failures_lock:
+        for stale in [t for t, until in _photo_upload_failures.items() if until <= now]:
+            del _photo_upload_failures[stale]
+        _photo_upload_failures[token] = now + PHOTO_UPLOAD_RETRY_SECONDS
+
+
+def hosted_photo_url(token):
+    """Return a URL fal.ai can fetch the token's photo from, hosting it on first use.
+
+    Concurrent image jobs for one token share a single upload. Returns None
+    if hosting is off, the token is gone or the upload failed (within the
+    last PHOTO_UPLOAD_RETRY_SECONDS); callers then inline the data URI.
+    """
+    if PHOTO_HOSTING == "inline":
+        return None
+    url = _photo_store.get_url(token)
+    if url is not None:
+        return url
+    if _photo_upload_failed_recently(token):
+        return None
+    return _photo_uploads.do(token, lambda: _host_photo(token))
+
+
+def _host_photo(token):
+    url = _photo_store.get_url(token)
+    if url is not None:
+        return url
+    entry = _photo_store.get(token)
+    if entry is None:
+        return None
+    media_type, photo_bytes = entry
+    if PHOTO_HOSTING == "local":
+        url = f"{PHOTO_PUBLIC_BASE_URL}/api/photos/{token}"
+    else:
+        try:
+            url = fal.upload(photo_bytes, media_type, f"{token}.{media_type.split('/')[-1]}")
+        except Exception as e:
+            log.warning(f"[UPLOAD-PHOTO] fal.ai storage upload failed for {token}, inlining instead: {e}")
+            _remember_photo_upload_failure(token)
+            return None
+        log.info(f"[UPLOAD-PHOTO] Uploaded {token} ({len(photo_bytes)} bytes) to fal.ai storage")
+    _photo_store.set_url(token, url)
+    return url
 
 
 @app.route("/api/upload-photo", methods=["POST"])
 def upload_photo():
-    """Cache the user's photo and return a token to reference it."""
-    import uuid
+    """Cache the user's photo, host it for fal.ai and return a token to reference it.
+
+    With ``detect_gender`` set the response also carries the detected
+    ``gender``, saving the separate /api/detect-gender round trip.
+    """
     data = request.json
     photo = data["photo"]
-    token = str(uuid.uuid4())
-    _photo_cache[token] = photo
-    log.info(f"[UPLOAD-PHOTO] Cached photo with token {token}, size {len(photo)}")
-    return jsonify({"photo_token": token})
+    try:
+        _, photo_bytes = decode_data_uri(photo)
+        (media_type, normalized), thumbnail = normalize_photo(photo_bytes)
+        token = _photo_store.put(
+            media_type, normalized, thumbnail=thumbnail, digest=hashlib.sha256(photo_bytes).hexdigest()
+        )
+    except PhotoTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    log.info(f"[UPLOAD-PHOTO] Cached photo with token {token}, {len(photo_bytes)} bytes uploaded, "
+             f"{len(normalized)} normalized, {len(thumbnail[1])} thumbnail")
+    # Image jobs asking before this finishes join the same upload
+    _photo_hosting.submit(hosted_photo_url, token)
+    out = {"photo_token": token, "expires_in": _photo_store.ttl}
+    if data.get("detect_gender"):
+        detection, error = prepare_gender_detection({"photo_token": token})
+        if error is None:
+            out["gender"], out["gender_cached"] = detect_photo_gender(detection)
+            log.info(f"[UPLOAD-PHOTO] Detected gender for {token}: {out['gender']}")
+    return jsonify(out)
 
 
-@app.route("/api/generate-image", methods=["POST"])
-def generate_image():
-    """Submit image generation to fal.ai queue, return request_id for client polling."""
-    data = request.json
-    # Support both direct photo and cached photo token
-    user_photo = data.get("photo")
-    if not user_photo:
-        photo_token = data.get("photo_token")
-        if photo_token and photo_token in _photo_cache:
-            user_photo = _photo_cache[photo_token]
-        else:
-            return jsonify({"error": "No photo provided"}), 400
-    prompt = data["prompt"]  # scene prompt from storyboard
-    scene_number = data.get("scene_number", 1)
-    gender = data.get("gender", "male")
+@app.route("/api/photos/<token>")
+def hosted_photo(token):
+    """Serve a cached photo to fal.ai when PHOTO_HOSTING=local."""
+    entry = _photo_store.get(token) if PHOTO_HOSTING == "local" else None
+    if entry is None:
+        return jsonify({"error": "Unknown photo"}), 404
+    media_type, photo_bytes = entry
+    return Response(photo_bytes, mimetype=media_type, headers={"Cache-Control": "private, max-age=600"})
+
 
+def resolve_user_photo(data):
+    """Return ``(photo, None)`` for a request body, or ``(None, (error_body, status))``.
+
+    Supports both a direct photo data URI and a cached photo token; a token
+    resolves to its hosted URL when there is one, so the photo is not
+    re-sent with every submission.
+    """
+    user_photo = data.get("photo")
+    if user_photo:
+        return user_photo, None
+    photo_token = data.get("photo_token")
+    if not photo_token:
+        return None, ({"error": "No photo provided"}, 400)
+    user_photo = hosted_photo_url(photo_token) or _photo_store.get_data_uri(photo_token)
+    if user_photo is None:
+        log.warning(f"[GENERATE-IMAGE] Photo token {photo_token} expired or unknown")
+        return None, ({
+            "error": "Photo token expired, please upload your photo again",
+            "code": "photo_token_expired",
+        }, 410)
+    return user_photo, None
+
+
+def build_image_payload(user_photo, prompt, gender):
+    """Return the nano-banana edit payload placing the reference photo's face into ``prompt``."""
     # Prepend instruction to use the reference photo's face for the lead character
     if gender == "female":
         role_desc = "female lead character"
@@ -291,34 +2805,48 @@ def generate_image():
         f"Keep {pronoun_obj} face, identity, and features exactly as shown in the reference photo. "
         f"Place them into this scene: {prompt}"
     )
-
-    log.info(f"[GENERATE-IMAGE] Scene {scene_number}, prompt: {full_prompt[:150]}...")
-    log.info(f"[GENERATE-IMAGE] Photo data URI length: {len(user_photo)}")
-
-    payload = {
+    return {
         "prompt": full_prompt,
         "image_urls": [user_photo],
         "aspect_ratio": "9:16",
         "num_images": 1,
     }
 
+
+@app.route("/api/generate-image", methods=["POST"])
+def generate_image():
+    """Submit image generation to fal.ai queue, return request_id for client polling."""
+    data = request.json
+    user_photo, error = resolve_user_photo(data)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    prompt = data["prompt"]  # scene prompt from storyboard
+    scene_number = data.get("scene_number", 1)
+    gender = data.get("gender", "male")
+
+    payload = build_image_payload(user_photo, prompt, gender)
+    if LOG_PAYLOADS:
+        log.info(f"[GENERATE-IMAGE] Scene {scene_number}, prompt: {payload['prompt'][:150]}...")
+    if user_photo.startswith("data:"):
+        log.info(f"[GENERATE-IMAGE] Photo data URI length: {len(user_photo)}")
+    else:
+        log.info(f"[GENERATE-IMAGE] Photo URL: {user_photo}")
+
     try:
-        submit_resp = requests.post(
-            "https://queue.fal.run/fal-ai/nano-banana-2/edit",
-            headers={
-                "Authorization": f"Key {FAL_KEY}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
-            timeout=60,
-        )
-        log.info(f"[GENERATE-IMAGE] Scene {scene_number} submit: {submit_resp.status_code} {submit_resp.text[:500]}")
+        submit_resp = fal.submit(f"{FAL_IMAGE_MODEL}/edit", payload)
+        if LOG_PAYLOADS:
+            log.info(f"[GENERATE-IMAGE] Scene {scene_number} submit: {submit_resp.status_code} {submit_resp.text[:500]}")
 
         if submit_resp.status_code != 200:
             return jsonify({"error": f"fal.ai submit error: {submit_resp.text[:500]}"}), submit_resp.status_code
 
-        return jsonify(submit_resp.json())
+        submit_data = submit_resp.json()
+        if submit_data.get("request_id"):
+            jobs.track(submit_data["request_id"], "image", data.get("session_id"))
+        return jsonify(submit_data)
 
+    except AdmissionTimeout:
+        raise
     except Exception as e:
         log.error(f"[GENERATE-IMAGE] Scene {scene_number} exception: {e}")
         log.error(traceback.format_exc())
@@ -327,12 +2855,9 @@ def generate_image():
 
 @app.route("/api/image-status/<request_id>")
 def image_status(request_id):
-    response = requests.get(
-        f"https://queue.fal.run/fal-ai/nano-banana-2/requests/{request_id}/status",
-        headers={"Authorization": f"Key {FAL_KEY}"},
-        timeout=30,
-    )
-    log.info(f"[IMAGE-STATUS] {request_id}: {response.text[:300]}")
+    response = fal.status(FAL_IMAGE_MODEL, request_id)
+    if LOG_PAYLOADS:
+        log.info(f"[IMAGE-STATUS] {request_id}: {response.text[:300]}")
     try:
         return jsonify(response.json())
     except Exception:
@@ -341,39 +2866,35 @@ def image_status(request_id):
 
 @app.route("/api/image-result/<request_id>")
 def image_result(request_id):
-    response = requests.get(
-        f"https://queue.fal.run/fal-ai/nano-banana-2/requests/{request_id}",
-        headers={"Authorization": f"Key {FAL_KEY}"},
-        timeout=30,
-    )
-    log.info(f"[IMAGE-RESULT] {request_id}: {response.status_code} {response.text[:500]}")
+    response = fal.result(FAL_IMAGE_MODEL, request_id)
+    if LOG_PAYLOADS:
+        log.info(f"[IMAGE-RESULT] {request_id}: {response.status_code} {response.text[:500]}")
     try:
         return jsonify(response.json())
     except Exception:
         return jsonify({"error": "Invalid response", "raw": response.text[:200]}), 502
 
 
+def build_scene_prompt(show_name):
+    """Return the Haiku prompt describing the opening scene of ``show_name``."""
+    return (
+        f"Describe the iconic opening/first scene of '{show_name}' in 2-3 sentences "
+        f"as a video generation prompt. Focus on: visual action, mood, camera movement, "
+        f"and cinematic style. Make it vivid and specific for generating a short 5-second "
+        f"video clip. The scene should feature the protagonist in a dramatic moment. "
+        f"Do not include any preamble - just output the scene description directly."
+    )
+
+
 @app.route("/api/generate-scene-prompt", methods=["POST"])
 def generate_scene_prompt():
     data = request.json
     show_name = data["show_name"]
 
-    client = Anthropic(api_key=ANTHROPIC_API_KEY, timeout=600.0)
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
+    message = llm.create_shared(
+        HAIKU_MODEL,
         max_tokens=300,
-        messages=[
-            {
-                "role": "user",
-                "content": (
-                    f"Describe the iconic opening/first scene of '{show_name}' in 2-3 sentences "
-                    f"as a video generation prompt. Focus on: visual action, mood, camera movement, "
-                    f"and cinematic style. Make it vivid and specific for generating a short 5-second "
-                    f"video clip. The scene should feature the protagonist in a dramatic moment. "
-                    f"Do not include any preamble - just output the scene description directly."
-                ),
-            }
-        ],
+        messages=[{"role": "user", "content": build_scene_prompt(show_name)}],
     )
 
     return jsonify({"prompt": message.content[0].text})
@@ -382,123 +2903,290 @@ def generate_scene_prompt():
 # ---------------------------------------------------------------------------
 # Sora 2 prompt sanitiser — replace words likely to trigger content filters
 # ---------------------------------------------------------------------------
-_SORA_REPLACEMENTS = [
-    # Romantic / sexual
-    (r'\bkiss(?:es|ed|ing)?\b', 'lean close'),
-    (r'\bmaking out\b', 'embracing tenderly'),
-    (r'\bpassionate(?:ly)?\b', 'intense'),
-    (r'\bseduc(?:e|es|ed|ing|tion|tive)\b', 'captivat\\1' if False else 'alluring'),
-    (r'\bseduc\w*', 'alluring'),
-    (r'\blust(?:ful|ing)?\b', 'longing'),
-    (r'\bintimate(?:ly)?\b', 'tender'),
-    (r'\bintimacy\b', 'closeness'),
-    (r'\bsexual(?:ly)?\b', 'romantic'),
-    (r'\bsex\b', 'romance'),
-    (r'\bnaked\b', 'bare-shouldered'),
-    (r'\bnude\b', 'bare-shouldered'),
-    (r'\bundress(?:es|ed|ing)?\b', 'loosening clothes'),
-    (r'\bstrip(?:s|ped|ping)?\b(?!\s+(?:of|away|down))', 'disrobe'),
-    (r'\blingerie\b', 'elegant attire'),
-    (r'\bbra\b', 'top'),
-    (r'\bcleavage\b', 'neckline'),
-    (r'\bcaress(?:es|ed|ing)?\b', 'gently touch'),
-    (r'\bmoan(?:s|ed|ing)?\b', 'sigh'),
-    (r'\bgroan(?:s|ed|ing)?\b', 'exhale deeply'),
-    (r'\berotica?\b', 'romantic'),
-    (r'\bdesire\b', 'yearning'),
-    (r'\bsensual(?:ly)?\b', 'gentle'),
-    (r'\bbed\s*room\s*scene\b', 'private moment'),
-    (r'\bbed\s*scene\b', 'private moment'),
-    (r'\bmake\s+love\b', 'share a tender moment'),
-    # Violence / weapons
-    (r'\bkill(?:s|ed|ing)?\b', 'defeat'),
-    (r'\bmurder(?:s|ed|ing)?\b', 'eliminate'),
-    (r'\bstab(?:s|bed|bing)?\b', 'strike'),
-    (r'\bblood(?:y|ied|iest)?\b', 'red-stained'),
-    (r'\bbleed(?:s|ing)?\b', 'wounded'),
-    (r'\bgun(?:s|fire|shot)?\b', 'weapon'),
-    (r'\brifle(?:s)?\b', 'weapon'),
-    (r'\bpistol(?:s)?\b', 'weapon'),
-    (r'\bshotgun(?:s)?\b', 'weapon'),
-    (r'\bbullet(?:s)?\b', 'projectile'),
-    (r'\bshoot(?:s|ing)?\b(?!\s+(?:a look|glance))', 'fire'),
-    (r'\bshot\b(?!\s+(?:of|glass))', 'blast'),
-    (r'\bknife\b', 'blade'),
-    (r'\bsword(?:s)?\b', 'blade'),
-    (r'\bexplosion(?:s)?\b', 'burst of light'),
-    (r'\bexplod(?:e|es|ed|ing)\b', 'burst apart'),
-    (r'\bbomb(?:s|ed|ing)?\b', 'blast'),
-    (r'\bsuicid\w*\b', 'sacrifice'),
-    (r'\bdeath\b', 'loss'),
-    (r'\bdie(?:s|d)?\b', 'fall'),
-    (r'\bdying\b', 'fading'),
-    (r'\bcorpse(?:s)?\b', 'fallen figure'),
-    (r'\bdead\b', 'fallen'),
-    (r'\btortur(?:e|es|ed|ing)\b', 'suffering'),
-    (r'\bstrangle(?:s|d)?\b', 'restrain'),
-    (r'\bchoke(?:s|d|ing)?\b', 'gasp'),
-    (r'\bpoison(?:s|ed|ing)?\b', 'taint'),
-    # Substances
-    (r'\bdrunk(?:en)?\b', 'tipsy'),
-    (r'\balcohol\b', 'drink'),
-    (r'\bdrug(?:s|ged)?\b', 'substance'),
-    (r'\bcocaine\b', 'powder'),
-    (r'\bheroin\b', 'substance'),
-    (r'\bsmoking\b', 'exhaling'),
-    (r'\bcigarette(?:s)?\b', 'thin stick'),
-    # Profanity (catch common ones)
-    (r'\bf+u+c+k\w*\b', ''),
-    (r'\bsh[i!]+t\w*\b', ''),
-    (r'\bass(?:hole)?\b', ''),
-    (r'\bbitch\w*\b', ''),
-    (r'\bdamn(?:ed)?\b', ''),
-    (r'\bhell\b(?!\s*o)', ''),
-    # IP / copyright safety net (in case Claude leaks names)
-    (r'\bfifty\s+shades\b', 'the story'),
-    (r'\btwilight\b', 'the story'),
-    (r'\bbridgerton\b', 'the story'),
-    (r'\bgrey\s*(?:\'s)?\s*anatomy\b', 'the story'),
-    (r'\bchristian\s+grey\b', 'the man'),
-    (r'\banastasia\s+steele?\b', 'the woman'),
-    (r'\bedward\s+cullen\b', 'the man'),
-    (r'\bbella\s+swan\b', 'the woman'),
-    (r'\bjacob\s+black\b', 'the friend'),
-    (r'\bnick\s+young\b', 'the man'),
-    (r'\brachel\s+chu\b', 'the woman'),
-]
-
-# Pre-compile patterns for performance
-_SORA_COMPILED = [(re.compile(pat, re.IGNORECASE), repl) for pat, repl in _SORA_REPLACEMENTS]
-
-
-def sanitize_sora_prompt(prompt: str) -> str:
-    """Filter and replace sensitive words that might trigger Sora 2 content filters."""
-    sanitized = prompt
-    for pattern, replacement in _SORA_COMPILED:
-        sanitized = pattern.sub(replacement, sanitized)
-    # Collapse multiple spaces left by removals
-    sanitized = re.sub(r'  +', ' ', sanitized).strip()
-    # Remove empty quotes left behind
-    sanitized = re.sub(r'says:\s*""', 'says: "..."', sanitized)
-    return sanitized
+SORA_RULES_PATH = os.environ.get(
+    "SORA_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sora_rules.json")
+)
 
 
-@app.route("/api/generate-video", methods=["POST"])
-def generate_video():
-    data = request.json
-    image_url = data["image_url"]
-    prompt = data.get("prompt", "")
+class SoraSanitizer:
+    """Prompt sanitiser compiled from the JSON rule table at ``path``.
+
+    Rules are applied in table order, each to the output of the ones before
+    it, exactly like the chain of ``pattern.sub`` calls they replace, so a
+    rule can still see text an earlier rule rewrote. Two cheap checks keep
+    that from costing one scan per rule: one combined alternation of every
+    rule rejects prompts no rule can touch in a single pass, and for the
+    rest a rule only runs if the literal text its pattern starts with is in
+    the current prompt. The file is re-read when its mtime changes; a
+    broken edit is logged and the previous rules stay active. Process-wide
+    hit counters are kept per rule pattern so dead and over-matching rules
+    can be found.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._compiled = None  # (prefilter, steps, rules), swapped atomically on reload
+        self._stats_lock = threading.Lock()
+        self._hits = {}  # rule pattern -> matches replaced
+        self.prompts = 0
+        self.prompts_changed = 0
+        self.counting_since = time.time()
+        self.loaded_at = None
+        self.loads = 0
+        self.reload_errors = 0
+        self.last_error = None
+        self._maybe_reload()
+        if self._compiled is None:
+            raise RuntimeError(f"Could not load Sora sanitiser rules from {path}: {self.last_error}")
+
+    # ``\b`` followed by a literal letter that is not optional, e.g. ``\bkiss`` or ``\bf+u+c+k``
+    _LEADING_LETTER_RE = re.compile(r'\\b([A-Za-z])(?![?*{])')
+    # The literal run a pattern starts with, and what follows it
+    _LEADING_LITERAL_RE = re.compile(r'(?:\\b)?([A-Za-z0-9 ]+)(.?)')
+    # Non-ASCII characters that IGNORECASE matches against ASCII letters
+    _ASCII_FOLDS = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+    @staticmethod
+    def _has_top_level_alternation(pattern):
+        depth, in_class, i = 0, False, 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == "\\":
+                i += 1
+            elif in_class:
+                in_class = c != "]"
+            elif c == "[":
+                in_class = True
+            elif c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+            elif c == "|" and depth == 0:
+                return True
+            i += 1
+        return False
+
+    @classmethod
+    def required_literal(cls, pattern):
+        """Lower-cased text every match of ``pattern`` starts with, or "" when none can be read off safely."""
+        if cls._has_top_level_alternation(pattern) or re.search(r"\(\?[aiLmsux]", pattern):
+            return ""
+        m = cls._LEADING_LITERAL_RE.match(pattern)
+        if m is None:
+            return ""
+        literal = m.group(1)
+        if m.group(2) and m.group(2) in "?*{":
+            literal = literal[:-1]  # the last character is optional
+        return literal.lower()
+
+    @classmethod
+    def _probe(cls, text):
+        return text.translate(cls._ASCII_FOLDS).lower()
+
+    @classmethod
+    def compile_rules(cls, rules):
+        """Return ``(prefilter, steps)`` for a list of rule dicts, raising ValueError if invalid.
+
+        ``steps`` holds ``(index, pattern, literal, replacement)`` per rule in
+        table order. ``prefilter`` matches wherever any rule would match.
+        When every rule starts with ``\b`` and a literal letter, its rules are
+        bucketed by that letter behind ``\b(?=[letters])`` lookaheads so most
+        positions are rejected without trying each alternative.
+        """
+        steps, alternatives, buckets = [], [], {}
+        for i, rule in enumerate(rules):
+            try:
+                compiled = re.compile(rule["pattern"], re.IGNORECASE)
+                replacement = rule["replacement"]
+            except (KeyError, TypeError, re.error) as e:
+                raise ValueError(f"rule {i}: {e!r}") from e
+            if not isinstance(replacement, str):
+                raise ValueError(f"rule {i}: replacement must be a string")
+            steps.append((i, compiled, cls.required_literal(rule["pattern"]), replacement))
+            alternatives.append(f"(?:{rule['pattern']})")
+            leading = cls._LEADING_LETTER_RE.match(rule["pattern"])
+            if buckets is not None and leading:
+                buckets.setdefault(leading.group(1).lower(), []).append(f"(?:{rule['pattern'][2:]})")
+            else:
+                buckets = None
+        if buckets:
+            combined = r"\b(?=[%s])(?:%s)" % (
+                "".join(buckets),
+                "|".join(f"(?={letter})(?:{'|'.join(group)})" for letter, group in buckets.items()),
+            )
+        else:
+            combined = "|".join(alternatives) or r"(?!)"
+        return re.compile(combined, re.IGNORECASE), steps
+
+    def _maybe_reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            self.last_error = str(e)
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path) as f:
+                    rules = json.load(f)["rules"]
+                prefilter, steps = self.compile_rules(rules)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self._mtime = mtime  # don't retry a broken file on every prompt
+                self.reload_errors += 1
+                self.last_error = str(e)
+                log.error(f"[SANITIZE] Failed to load {self.path}, keeping previous rules: {e}")
+                return
+            self._compiled = (prefilter, steps, rules)
+            self._mtime = mtime
+            self.loaded_at = time.time()
+            self.last_error = None
+            if self.loads:
+                log.info(f"[SANITIZE] Reloaded {len(rules)} rules from {self.path}")
+            self.loads += 1
+
+    def sanitize(self, prompt, audit=False, record=True):
+        """Return the sanitised prompt, or ``(prompt, matches)`` when ``audit`` is set.
+
+        ``matches`` lists every replacement made, in the order the rules ran,
+        with the rule index, pattern, span, matched text and replacement. The
+        span is in the prompt as the earlier rules left it, which is the
+        original prompt unless one of them already fired. ``record=False``
+        leaves the hit counters untouched.
+        """
+        start = time.perf_counter()
+        self._maybe_reload()
+        prefilter, steps, rules = self._compiled
+        matches = []  # (rule index, match)
+        sanitized = prompt
+
+        if prefilter.search(prompt):
+            probe = self._probe(prompt)
+            for index, pattern, literal, replacement in steps:
+                if literal not in probe:
+                    continue
+
+                def replace(m, index=index, replacement=replacement):
+                    matches.append((index, m))
+                    return replacement
+
+                rewritten = pattern.sub(replace, sanitized)
+                if rewritten != sanitized:
+                    sanitized = rewritten
+                    probe = self._probe(sanitized)
+        # Collapse multiple spaces left by removals
+        sanitized = re.sub(r'  +', ' ', sanitized).strip()
+        # Remove empty quotes left behind
+        sanitized = re.sub(r'says:\s*""', 'says: "..."', sanitized)
+        metrics.observe("sanitizer_seconds", time.perf_counter() - start)
+
+        if record:
+            with self._stats_lock:
+                self.prompts += 1
+                if matches:
+                    self.prompts_changed += 1
+                for index, _ in matches:
+                    key = rules[index]["pattern"]
+                    self._hits[key] = self._hits.get(key, 0) + 1
+        if not audit:
+            return sanitized
+        report = [
+            {
+                "rule": index,
+                "group": rules[index].get("group"),
+                "pattern": rules[index]["pattern"],
+                "span": [m.start(), m.end()],
+                "match": m.group(),
+                "replacement": rules[index]["replacement"],
+            }
+            for index, m in matches
+        ]
+        return sanitized, report
+
+    def rule_hits(self):
+        """Return the current rules in table order with their process-wide hit counts."""
+        rules = self._compiled[2]
+        with self._stats_lock:
+            hits = dict(self._hits)
+            prompts, prompts_changed = self.prompts, self.prompts_changed
+        return {
+            "since": self.counting_since,
+            "prompts": prompts,
+            "prompts_changed": prompts_changed,
+            "rules": [
+                {
+                    "rule": i,
+                    "group": rule.get("group"),
+                    "pattern": rule["pattern"],
+                    "replacement": rule["replacement"],
+                    "hits": hits.get(rule["pattern"], 0),
+                }
+                for i, rule in enumerate(rules)
+            ],
+        }
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "rules": len(self._compiled[2]),
+            "prompts": self.prompts,
+            "prompts_changed": self.prompts_changed,
+            "loaded_at": self.loaded_at,
+            "reloads": max(self.loads - 1, 0),
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error,
+        }
+
+
+sora_sanitizer = SoraSanitizer(SORA_RULES_PATH)
+
+
+def sanitize_sora_prompt(prompt: str, audit: bool = False, record: bool = True):
+    """Filter and replace sensitive words that might trigger Sora 2 content filters.
+
+    With ``audit=True`` returns ``(sanitized, matches)``; see ``SoraSanitizer.sanitize``.
+    Pass ``record=False`` for previews of prompts that will be sanitised again
+    when they are submitted, so each prompt is only counted once.
+    """
+    return sora_sanitizer.sanitize(prompt, audit=audit, record=record)
+
+
+@app.route("/api/sanitizer/rules")
+def sanitizer_rules():
+    """Per-rule hit counters since process start, in rule-table order."""
+    return jsonify(sora_sanitizer.rule_hits())
+
+
+@app.route("/api/sanitizer/audit", methods=["POST"])
+def sanitizer_audit():
+    """Dry-run the sanitiser on ``prompt`` and report every rule that fired (not counted in hits)."""
+    prompt = (request.json or {}).get("prompt", "")
+    sanitized, matches = sora_sanitizer.sanitize(prompt, audit=True, record=False)
+    return jsonify({"prompt": sanitized, "changed": sanitized != prompt, "matches": matches})
+
 
-    log.info(f"[GENERATE-VIDEO] Received prompt ({len(prompt)} chars): '{prompt[:300]}'")
-    log.info(f"[GENERATE-VIDEO] Image URL: {image_url[:100] if image_url else 'NONE'}...")
+def build_video_payload(prompt, image_url):
+    """Sanitize and truncate ``prompt`` and return the Sora 2 image-to-video payload."""
+    if LOG_PAYLOADS:
+        log.info(f"[GENERATE-VIDEO] Received prompt ({len(prompt)} chars): '{prompt[:300]}'")
+        log.info(f"[GENERATE-VIDEO] Image URL: {image_url[:100] if image_url else 'NONE'}...")
 
     if not prompt:
         log.warning("[GENERATE-VIDEO] Empty prompt received!")
 
-    # Sanitize prompt to avoid triggering Sora 2 content filters
-    original_prompt = prompt
-    prompt = sanitize_sora_prompt(prompt)
-    if prompt != original_prompt:
+    # Sanitize prompt to avoid triggering Sora 2 content filters; the audit
+    # report is only built when it is going to be logged
+    if LOG_PAYLOADS:
+        prompt, matches = sanitize_sora_prompt(prompt, audit=True)
+    else:
+        prompt, matches = sanitize_sora_prompt(prompt), []
+    if matches:
+        fired = ", ".join(f"'{m['match']}'->'{m['replacement']}'" for m in matches[:20])
+        log.info(f"[GENERATE-VIDEO] Sanitizer replaced {len(matches)} match(es): {fired}")
         log.info(f"[GENERATE-VIDEO] Sanitized prompt ({len(prompt)} chars): '{prompt[:300]}'")
 
     # Truncate prompt to 4900 chars to stay within Sora 2's 5000 char limit
@@ -506,39 +3194,43 @@ def generate_video():
         log.warning(f"[GENERATE-VIDEO] Prompt too long ({len(prompt)} chars), truncating to 4900")
         prompt = prompt[:4900]
 
-    payload = {
+    return {
         "prompt": prompt,
         "image_url": image_url,
         "duration": 16,
         "aspect_ratio": "9:16",
     }
 
-    log.info(f"[GENERATE-VIDEO] Full payload JSON: {json.dumps(payload)[:600]}")
 
-    response = requests.post(
-        "https://queue.fal.run/fal-ai/sora-2/image-to-video",
-        headers={
-            "Authorization": f"Key {FAL_KEY}",
-            "Content-Type": "application/json",
-        },
-        json=payload,
-    )
+@app.route("/api/generate-video", methods=["POST"])
+def generate_video():
+    data = request.json
+    image_url = data["image_url"]
+    prompt = data.get("prompt", "")
 
-    log.info(f"[GENERATE-VIDEO] Queue submission response ({response.status_code}): {response.text[:500]}")
+    payload = build_video_payload(prompt, image_url)
+    if LOG_PAYLOADS:
+        log.info(f"[GENERATE-VIDEO] Full payload JSON: {json.dumps(payload)[:600]}")
+
+    response = fal.submit(f"{FAL_VIDEO_MODEL}/image-to-video", payload)
+
+    if LOG_PAYLOADS:
+        log.info(f"[GENERATE-VIDEO] Queue submission response ({response.status_code}): {response.text[:500]}")
 
     if response.status_code != 200:
         return jsonify({"error": response.text}), response.status_code
 
-    return jsonify(response.json())
+    submit_data = response.json()
+    if submit_data.get("request_id"):
+        jobs.track(submit_data["request_id"], "video", data.get("session_id"))
+    return jsonify(submit_data)
 
 
 @app.route("/api/video-status/<request_id>")
 def video_status(request_id):
-    response = requests.get(
-        f"https://queue.fal.run/fal-ai/sora-2/requests/{request_id}/status",
-        headers={"Authorization": f"Key {FAL_KEY}"},
-    )
-    log.info(f"[VIDEO-STATUS] raw response ({response.status_code}): {response.text[:300]}")
+    response = fal.status(FAL_VIDEO_MODEL, request_id)
+    if LOG_PAYLOADS:
+        log.info(f"[VIDEO-STATUS] raw response ({response.status_code}): {response.text[:300]}")
     try:
         return jsonify(response.json())
     except Exception:
@@ -547,76 +3239,1235 @@ def video_status(request_id):
 
 @app.route("/api/video-result/<request_id>")
 def video_result(request_id):
-    response = requests.get(
-        f"https://queue.fal.run/fal-ai/sora-2/requests/{request_id}",
-        headers={"Authorization": f"Key {FAL_KEY}"},
-    )
-    log.info(f"[VIDEO-RESULT] raw response ({response.status_code}): {response.text[:500]}")
+    response = fal.result(FAL_VIDEO_MODEL, request_id)
+    if LOG_PAYLOADS:
+        log.info(f"[VIDEO-RESULT] raw response ({response.status_code}): {response.text[:500]}")
     try:
         return jsonify(response.json())
     except Exception:
         return jsonify({"error": "Invalid response", "raw": response.text[:200]}), 502
 
 
-@app.route("/api/merge-clips", methods=["POST"])
-def merge_clips():
-    """Download clip videos and merge them into a single MP4 using ffmpeg."""
-    data = request.json
-    clip_urls = data.get("clip_urls", [])
+@app.route("/api/jobs/<request_id>")
+def job_status(request_id):
+    """Return the locally tracked status (and result, once done) of a fal.ai job.
+
+    Only jobs this app submitted are served: ids missing from memory are
+    looked up in the job store (which survives restarts), and anything else
+    is a 404 rather than a job we would poll fal.ai for on the caller's behalf.
+    """
+    job = jobs.describe(request_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/sessions/<session_id>/jobs")
+def session_jobs(session_id):
+    """Every fal.ai job submitted for a session, with status and result URL, from the job store."""
+    if not SESSION_ID_RE.match(session_id):
+        return jsonify({"error": "Invalid session id"}), 400
+    return jsonify({"session_id": session_id, "jobs": job_store.session_jobs(session_id)})
+
+
+@app.route("/api/sessions/<session_id>/events")
+def session_event_stream(session_id):
+    """Server-Sent Events stream of storyboard/image/video transitions for a session.
+
+    Streams wait on the session's event log rather than calling upstream, and
+    close after SSE_STREAM_SECONDS so EventSource reconnects (resuming from
+    Last-Event-ID) instead of pinning a gthread worker indefinitely.  At most
+    SSE_MAX_STREAMS (by default a quarter of WORKER_THREADS) run at once;
+    beyond that clients get 503 and fall back to polling /api/jobs.  The
+    ASGI mode that the Procfile runs serves this route on its event loop
+    instead, without holding a thread.
+    """
+    if not SESSION_ID_RE.match(session_id):
+        return jsonify({"error": "Invalid session id"}), 400
+    if not _sse_slots.acquire(blocking=False):
+        response = jsonify({"error": "Too many open event streams"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "10"
+        return response
+
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0)
+    except ValueError:
+        last_id = 0
+
+    def stream():
+        after_id = last_id
+        deadline = time.monotonic() + SSE_STREAM_SECONDS
+        yield "retry: 1000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = session_bus.wait(session_id, after_id, min(SSE_HEARTBEAT_SECONDS, remaining))
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, event, data in events:
+                after_id = event_id
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    # WSGI servers always close() the response iterable, even on disconnect
+    response.call_on_close(_sse_slots.release)
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Clip merging — parallel streamed downloads, ffmpeg concat, file response
+# ---------------------------------------------------------------------------
+CLIP_DOWNLOAD_CHUNK = 1024 * 1024
+_clip_downloads = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CLIP_DOWNLOAD_WORKERS", 8)), thread_name_prefix="clip-download",
+)
 
-    if len(clip_urls) < 2:
-        return jsonify({"error": "Need at least 2 clips to merge"}), 400
 
-    tmpdir = tempfile.mkdtemp()
+class MergedVideoCache:
+    """Disk cache of merged MP4s keyed by a hash of the ordered clip URLs.
+
+    Files live in ``directory`` and are evicted least-recently-used (by mtime,
+    refreshed on every hit) once their total size exceeds ``max_bytes``.
+    Merges are staged in a sibling temp dir on the same filesystem so that
+    publishing a result is an atomic rename.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(clip_urls):
+        return hashlib.sha256("\n".join(clip_urls).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.mp4")
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return path
+
+    def put(self, key, src_path):
+        path = self._path(key)
+        with self._lock:
+            os.replace(src_path, path)
+            self._evict_locked(keep=path)
+        return path
+
+    def staging_dir(self):
+        return tempfile.mkdtemp(dir=self.directory)
+
+    def _files_locked(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".mp4"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _evict_locked(self, keep):
+        files = sorted(self._files_locked())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            files = self._files_locked()
+            return {
+                "entries": len(files),
+                "bytes": sum(size for _, size, _ in files),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+merged_cache = MergedVideoCache(
+    directory=os.path.join(CACHE_DIR, "merged"),
+    max_bytes=int(os.environ.get("MERGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+)
+
+# Hosts (and their subdomains) clip URLs may point at: the server downloads
+# whatever it is asked to merge, so anything else is refused
+MERGE_CLIP_HOSTS = tuple(
+    host.strip().lower() for host in os.environ.get("MERGE_CLIP_HOSTS", "fal.media").split(",") if host.strip()
+)
+
+
+def is_allowed_clip_url(url):
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    host = (parts.hostname or "").lower()
+    return parts.scheme in ("http", "https") and any(
+        host == allowed or host.endswith("." + allowed) for allowed in MERGE_CLIP_HOSTS
+    )
+
+
+def download_clip(url, path):
+    """Stream ``url`` to ``path`` chunk by chunk, never holding the whole clip in memory."""
+    with fal.download(url, stream=True) as resp:
+        if resp.status_code != 200:
+            raise Exception(f"HTTP {resp.status_code}")
+        with open(path, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=CLIP_DOWNLOAD_CHUNK):
+                f.write(chunk)
+    return path
+
+
+def download_clips(clip_urls, tmpdir):
+    """Download all clips concurrently into ``tmpdir`` and return their paths in order.
+
+    Fails fast: the first failed download cancels the ones not yet started.
+    """
+    futures = [
+        _clip_downloads.submit(download_clip, url, os.path.join(tmpdir, f"clip_{i}.mp4"))
+        for i, url in enumerate(clip_urls)
+    ]
+    try:
+        for i, future in enumerate(futures):
+            try:
+                future.result()
+            except Exception as e:
+                raise Exception(f"Failed to download clip {i + 1}: {e}") from e
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    return [future.result() for future in futures]
+
+
+class FfmpegNotFound(RuntimeError):
+    """Raised when the ffmpeg binary itself cannot be found."""
+
+
+def concat_clips(clip_files, output_path):
+    """Losslessly concatenate MP4 clips with ffmpeg's concat demuxer."""
+    concat_path = os.path.join(os.path.dirname(output_path), "concat.txt")
+    with open(concat_path, "w") as f:
+        for cp in clip_files:
+            f.write(f"file '{cp}'\n")
+
     try:
-        # Download all clips
-        clip_files = []
-        for i, url in enumerate(clip_urls):
-            clip_path = os.path.join(tmpdir, f"clip_{i}.mp4")
-            resp = requests.get(url, timeout=120)
-            if resp.status_code != 200:
-                raise Exception(f"Failed to download clip {i + 1}")
-            with open(clip_path, "wb") as f:
-                f.write(resp.content)
-            clip_files.append(clip_path)
-
-        # Create ffmpeg concat file
-        concat_path = os.path.join(tmpdir, "concat.txt")
-        with open(concat_path, "w") as f:
-            for cp in clip_files:
-                f.write(f"file '{cp}'\n")
-
-        # Merge with ffmpeg
-        output_path = os.path.join(tmpdir, "merged.mp4")
         result = subprocess.run(
             ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_path,
              "-c", "copy", output_path],
             capture_output=True, text=True, timeout=300,
         )
+    except FileNotFoundError as e:
+        raise FfmpegNotFound("ffmpeg is not installed on the server") from e
+
+    if result.returncode != 0:
+        log.error(f"[MERGE] ffmpeg stderr: {result.stderr}")
+        raise Exception("Failed to merge clips with ffmpeg")
+
 
-        if result.returncode != 0:
-            log.error(f"[MERGE] ffmpeg stderr: {result.stderr}")
-            raise Exception("Failed to merge clips with ffmpeg")
+class MergeQueueFull(Exception):
+    """Raised when the merge queue is at capacity."""
 
-        with open(output_path, "rb") as f:
-            merged_data = f.read()
+    def __init__(self, retry_after):
+        super().__init__("Too many merges in progress, please retry shortly")
+        self.retry_after = retry_after
 
-        response = make_response(merged_data)
-        response.headers["Content-Type"] = "video/mp4"
-        response.headers["Content-Disposition"] = "attachment; filename=SoraShorts-merged.mp4"
+
+class MergeJob:
+    def __init__(self, key, clip_urls):
+        self.job_id = key
+        self.clip_urls = clip_urls
+        self.status = "QUEUED"
+        self.error = None
+        self.path = None
+        self.submitted = time.time()
+        self.started = None
+        self.downloaded = None
+        self.finished = None
+        self.done = threading.Event()
+        self.on_done = []  # callables run once with the MergeJob when it finishes
+
+    def to_dict(self):
+        out = {"job_id": self.job_id, "status": self.status, "submitted": self.submitted}
+        if self.started is not None:
+            out["queue_wait_s"] = round(self.started - self.submitted, 3)
+        if self.downloaded is not None:
+            out["download_s"] = round(self.downloaded - self.started, 3)
+        if self.finished is not None and self.downloaded is not None:
+            out["ffmpeg_s"] = round(self.finished - self.downloaded, 3)
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+
+class MergeQueue:
+    """Bounded pool of merge workers in front of ffmpeg.
+
+    At most ``workers`` merges (download + ffmpeg) run at once and at most
+    ``max_queued`` more may wait; beyond that submissions are rejected with
+    MergeQueueFull so callers can answer 429 instead of forking ever more
+    ffmpeg processes.  Jobs are keyed by the merged-cache key, so identical
+    concurrent submissions share one job and finished merges are served
+    from the cache without queueing.
+    """
+
+    def __init__(self, cache, workers, max_queued, retention):
+        self.cache = cache
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="merge")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._metrics = {
+            "completed": 0, "failed": 0, "rejected": 0,
+            "queue_wait_total_s": 0.0, "queue_wait_max_s": 0.0,
+            "download_total_s": 0.0, "ffmpeg_total_s": 0.0, "duration_total_s": 0.0,
+        }
+
+    def _avg_duration_locked(self):
+        finished = self._metrics["completed"] + self._metrics["failed"]
+        return self._metrics["duration_total_s"] / finished if finished else 30.0
+
+    def submit(self, clip_urls, on_done=None):
+        """Return the merge job for ``clip_urls``; ``on_done(job)`` runs once it is COMPLETED or FAILED."""
+        key = self.cache.key(clip_urls)
+        with self._lock:
+            self._prune_locked()
+            job = self._jobs.get(key)
+            if job is not None and job.status in ("QUEUED", "RUNNING"):
+                if on_done is not None:
+                    job.on_done.append(on_done)
+                return job
+            cached_path = self.cache.get(key)
+            if cached_path is not None:
+                job = MergeJob(key, clip_urls)
+                job.status, job.path, job.finished = "COMPLETED", cached_path, time.time()
+                job.done.set()
+                self._jobs[key] = job
+            else:
+                if self._queued >= self.max_queued:
+                    self._metrics["rejected"] += 1
+                    waves = (self._queued + self._running) / self.workers
+                    raise MergeQueueFull(retry_after=max(5, int(waves * self._avg_duration_locked())))
+                job = self._jobs[key] = MergeJob(key, clip_urls)
+                if on_done is not None:
+                    job.on_done.append(on_done)
+                self._queued += 1
+        if cached_path is not None:
+            if on_done is not None:
+                self._run_callbacks(job, [on_done])
+            return job
+        log.info(f"[MERGE] Queued {key[:12]} ({len(clip_urls)} clips)")
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run_callbacks(self, job, callbacks):
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                log.error(f"[MERGE] on_done callback failed for {job.job_id[:12]}: {e}")
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.retention
+        for key in [k for k, j in self._jobs.items() if j.done.is_set() and j.finished < cutoff]:
+            del self._jobs[key]
+
+    def _run(self, job):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            job.status = "RUNNING"
+            job.started = time.time()
+        workdir = self.cache.staging_dir()
+        try:
+            clip_files = download_clips(job.clip_urls, workdir)
+            job.downloaded = time.time()
+            output_path = os.path.join(workdir, "merged.mp4")
+            concat_clips(clip_files, output_path)
+            job.path = self.cache.put(job.job_id, output_path)
+            status, error = "COMPLETED", None
+        except FfmpegNotFound as e:
+            log.error("[MERGE] ffmpeg not found on system")
+            status, error = "FAILED", str(e)
+        except Exception as e:
+            log.error(f"[MERGE] Error: {e}")
+            log.error(traceback.format_exc())
+            status, error = "FAILED", str(e)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        metrics.observe("merge_seconds", time.time() - job.started, step="total")
+        if job.downloaded is not None:
+            metrics.observe("merge_seconds", job.downloaded - job.started, step="download")
+            if status == "COMPLETED":
+                metrics.observe("merge_seconds", time.time() - job.downloaded, step="ffmpeg")
+        if status != "COMPLETED":
+            metrics.inc("merge_errors_total")
+        with self._lock:
+            job.status, job.error, job.finished = status, error, time.time()
+            self._running -= 1
+            m = self._metrics
+            m["completed" if status == "COMPLETED" else "failed"] += 1
+            wait = job.started - job.submitted
+            m["queue_wait_total_s"] += wait
+            m["queue_wait_max_s"] = max(m["queue_wait_max_s"], wait)
+            m["duration_total_s"] += job.finished - job.started
+            if job.downloaded is not None:
+                m["download_total_s"] += job.downloaded - job.started
+                m["ffmpeg_total_s"] += job.finished - job.downloaded
+            callbacks, job.on_done = job.on_done, []
+        log.info(f"[MERGE] {job.job_id[:12]} {status}: {job.to_dict()}")
+        job.done.set()
+        self._run_callbacks(job, callbacks)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._metrics)
+            out.update({
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "avg_duration_s": self._avg_duration_locked(),
+            })
+            return out
+
+
+merge_queue = MergeQueue(
+    cache=merged_cache,
+    workers=int(os.environ.get("MERGE_WORKERS", 2)),
+    max_queued=int(os.environ.get("MERGE_QUEUE_MAX", 8)),
+    retention=float(os.environ.get("MERGE_JOB_RETENTION", 60 * 60)),
+)
+# How long POST /api/merge-clips holds its request thread before answering 202
+MERGE_WAIT_SECONDS = float(os.environ.get("MERGE_WAIT_SECONDS", 30))
+
+
+@app.errorhandler(MergeQueueFull)
+def handle_merge_queue_full(e):
+    log.warning(f"[MERGE] Queue full, rejecting (retry after {e.retry_after}s)")
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def _merge_clip_urls():
+    """Return ``(clip_urls, error)`` for a merge request body; ``error`` is a ready ``(body, status)``."""
+    clip_urls = (request.json or {}).get("clip_urls", [])
+    if not isinstance(clip_urls, list) or len(clip_urls) < 2:
+        return None, (jsonify({"error": "Need at least 2 clips to merge"}), 400)
+    for url in clip_urls:
+        if not isinstance(url, str) or not is_allowed_clip_url(url):
+            log.warning(f"[MERGE] Refusing clip URL outside MERGE_CLIP_HOSTS: {str(url)[:200]}")
+            return None, (jsonify({"error": "Clip URLs must point at the fal.ai CDN"}), 400)
+    return clip_urls, None
+
+
+def send_merged(job):
+    """Stream a finished merge from disk with ETag and Range support."""
+    response = send_file(
+        job.path,
+        mimetype="video/mp4",
+        as_attachment=True,
+        download_name="SoraShorts-merged.mp4",
+        etag=job.job_id,
+        conditional=True,
+        max_age=0,
+    )
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@app.route("/api/merge-clips", methods=["POST"])
+def merge_clips():
+    """Download clip videos and merge them into a single MP4 using ffmpeg.
+
+    Takes ``{"clip_urls": [...]}`` with every URL on the fal.ai CDN. The
+    merge runs on the bounded merge queue and this request waits up to
+    MERGE_WAIT_SECONDS for it; a slower merge is answered 202 with its
+    merge job to poll at /api/merge-jobs, so merges can't pin every request
+    thread.
+    """
+    clip_urls, error = _merge_clip_urls()
+    if error is not None:
+        return error
+    job = merge_queue.submit(clip_urls)
+    if not job.done.wait(timeout=MERGE_WAIT_SECONDS):
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers["Location"] = f"/api/merge-jobs/{job.job_id}"
         return response
+    if job.status != "COMPLETED":
+        return jsonify({"error": job.error}), 500
+    return send_merged(job)
 
-    except FileNotFoundError:
-        log.error("[MERGE] ffmpeg not found on system")
-        return jsonify({"error": "ffmpeg is not installed on the server"}), 500
-    except Exception as e:
-        log.error(f"[MERGE] Error: {e}")
-        log.error(traceback.format_exc())
-        return jsonify({"error": str(e)}), 500
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+
+@app.route("/api/merge-clips", methods=["GET"])
+def merged_clips():
+    """Serve an already merged video by its repeated ``clip_url`` parameters, with ETag and Range support.
+
+    Only the merged-video cache is consulted, so a plain link or embed can
+    revalidate (304) or replay a merge but never start downloads or ffmpeg;
+    merges are started with POST.
+    """
+    clip_urls = request.args.getlist("clip_url")
+    if len(clip_urls) < 2:
+        return jsonify({"error": "Need at least 2 clips to merge"}), 400
+    key = merged_cache.key(clip_urls)
+    path = merged_cache.get(key)
+    if path is None:
+        return jsonify({"error": "Not merged yet, POST the clips to /api/merge-jobs"}), 404
+    if request.if_none_match.contains(key):
+        log.info(f"[MERGE] {key[:12]} not modified")
+        return Response(status=304, headers={"ETag": f'"{key}"'})
+    job = MergeJob(key, clip_urls)
+    job.status, job.path = "COMPLETED", path
+    return send_merged(job)
+
+
+@app.route("/api/merge-jobs", methods=["POST"])
+def submit_merge_job():
+    """Queue a merge and return its job id immediately (429 when the queue is full)."""
+    clip_urls, error = _merge_clip_urls()
+    if error is not None:
+        return error
+    job = merge_queue.submit(clip_urls)
+    return jsonify(job.to_dict()), 200 if job.done.is_set() else 202
+
+
+@app.route("/api/merge-jobs/<job_id>")
+def merge_job_status(job_id):
+    job = merge_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown merge job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/merge-jobs/<job_id>/result")
+def merge_job_result(job_id):
+    job = merge_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown merge job"}), 404
+    if job.status == "FAILED":
+        return jsonify({"error": job.error}), 500
+    if job.status != "COMPLETED":
+        return jsonify({"error": "Merge not finished yet", "status": job.status}), 409
+    if not os.path.exists(job.path):
+        return jsonify({"error": "Merged video expired, please merge again"}), 410
+    return send_merged(job)
+
+
+
+# ---------------------------------------------------------------------------
+# Server-side pipeline — photo → storyboard → images → videos → merge as a DAG
+# ---------------------------------------------------------------------------
+PIPELINE_DEFERRED = object()  # stage returned after handing off to a fal.ai or merge job
+PIPELINE_MERGE_TIMEOUT = 20 * 60  # how long the merge stage keeps retrying a full merge queue
+
+
+class PipelineStage:
+    def __init__(self, name):
+        self.name = name
+        self.status = "PENDING"
+        self.started = None
+        self.finished = None
+        self.request_id = None
+        self.error = None
+
+    def to_dict(self):
+        out = {"status": self.status}
+        if self.started is not None:
+            out["started"] = self.started
+            end = self.finished if self.finished is not None else time.time()
+            out["duration_s"] = round(end - self.started, 3)
+        if self.request_id is not None:
+            out["request_id"] = self.request_id
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+    def to_record(self):
+        return {
+            "status": self.status, "started": self.started, "finished": self.finished,
+            "request_id": self.request_id, "error": self.error,
+        }
+
+    @classmethod
+    def from_record(cls, name, record):
+        stage = cls(name)
+        for field in ("status", "started", "finished", "request_id", "error"):
+            setattr(stage, field, record.get(field))
+        return stage
+
+
+class Pipeline:
+    """One session's end-to-end run. All fields are guarded by ``lock``."""
+
+    FIXED_STAGES = ("photo", "gender", "storyboard", "expand", "merge")
+
+    def __init__(self, session_id, params):
+        self.session_id = session_id
+        self.show_name = params["show_name"]
+        self.user_name = params.get("user_name") or "the protagonist"
+        self.gender = params.get("gender")
+        self.photo = params.get("photo")
+        self.photo_token = params.get("photo_token")
+        self.make_videos = bool(params.get("videos", True))
+        self.merge = self.make_videos and bool(params.get("merge", True))
+        self.created = time.time()
+        self.updated = self.created
+        self.lock = threading.Lock()
+        self.stages = {name: PipelineStage(name) for name in self.FIXED_STAGES}
+        self.acts = []  # [{"act": {...}, "image_url", "video_prompt", "video_url"}]
+        self.storyboard_done = False
+        self.merged = None
+
+    @property
+    def status(self):
+        statuses = [stage.status for stage in self.stages.values()]
+        if "RUNNING" in statuses:
+            return "RUNNING"
+        if "FAILED" in statuses:
+            return "FAILED"
+        if self.storyboard_done and all(s in ("COMPLETED", "SKIPPED") for s in statuses):
+            return "COMPLETED"
+        return "RUNNING"
+
+    def to_dict(self):
+        order = ["photo", "gender", "storyboard"]
+        order += [f"image_{n}" for n in range(1, len(self.acts) + 1)]
+        order += ["expand"] + [f"video_{n}" for n in range(1, len(self.acts) + 1)] + ["merge"]
+        return {
+            "session_id": self.session_id,
+            "status": self.status,
+            "show_name": self.show_name,
+            "gender": self.gender,
+            "created": self.created,
+            "updated": self.updated,
+            "elapsed_s": round(self.updated - self.created, 3),
+            "stages": {name: self.stages[name].to_dict() for name in order if name in self.stages},
+            "acts": [
+                dict(
+                    entry["act"],
+                    image_url=entry["image_url"],
+                    video_prompt=entry["video_prompt"],
+                    video_url=entry["video_url"],
+                )
+                for entry in self.acts
+            ],
+            "merged": self.merged,
+        }
+
+    def to_record(self):
+        """Everything needed to rebuild the pipeline, for the job store (the photo itself is not kept)."""
+        return {
+            "show_name": self.show_name,
+            "user_name": self.user_name,
+            "gender": self.gender,
+            "photo_token": self.photo_token,
+            "videos": self.make_videos,
+            "merge": self.merge,
+            "created": self.created,
+            "updated": self.updated,
+            "stages": {name: stage.to_record() for name, stage in self.stages.items()},
+            "acts": [dict(entry) for entry in self.acts],
+            "storyboard_done": self.storyboard_done,
+            "merged": self.merged,
+        }
+
+    @classmethod
+    def from_record(cls, session_id, record):
+        pipeline = cls(session_id, record)
+        pipeline.created = record["created"]
+        pipeline.updated = record["updated"]
+        pipeline.stages = {
+            name: PipelineStage.from_record(name, stage) for name, stage in record["stages"].items()
+        }
+        pipeline.acts = record["acts"]
+        pipeline.storyboard_done = record["storyboard_done"]
+        pipeline.merged = record["merged"]
+        return pipeline
+
+
+class PipelineRunner:
+    """Run pipelines as a DAG of stages, starting each one as soon as its inputs exist.
+
+    ``_advance`` is the scheduler: under the pipeline lock it marks every
+    runnable PENDING stage RUNNING and hands it to the worker pool, and each
+    finished stage calls it again. Gender detection overlaps photo storage,
+    images start as storyboard acts stream in, and each act's video starts
+    when its image and the expanded prompts are ready. Image and video stages
+    finish from JobManager ``on_done`` callbacks and the merge stage from a
+    MergeQueue one, so no thread waits on fal.ai or ffmpeg. Starting a
+    session that already failed re-queues only the failed stages.
+
+    Each scheduling step saves a snapshot to ``store``. After a restart the
+    snapshot is revived: stages waiting on a fal.ai job re-attach to it and
+    any other stage that was mid-run is queued again.
+    """
+
+    def __init__(self, workers, retention, on_change=None, store=None):
+        self.retention = retention
+        self.on_change = on_change
+        self.store = store
+        self._lock = threading.Lock()
+        self._pipelines = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        self.started = 0
+        self.resumed = 0
+        self.restored = 0
+        self._stage_totals = {}  # stage kind -> [count, total seconds]
+
+    def _lookup(self, session_id):
+        """Return the pipeline from memory, reviving it from the store if needed."""
+        with self._lock:
+            pipeline = self._pipelines.get(session_id)
+        if pipeline is not None or self.store is None:
+            return pipeline
+        record = self.store.load_session(session_id)
+        return self._revive(session_id, record) if record is not None else None
+
+    def _revive(self, session_id, record):
+        pipeline = Pipeline.from_record(session_id, record)
+        with self._lock:
+            existing = self._pipelines.get(session_id)
+            if existing is not None:
+                return existing
+            self._pipelines[session_id] = pipeline
+            self.restored += 1
+        reattach = []
+        with pipeline.lock:
+            for name, stage in pipeline.stages.items():
+                if stage.status != "RUNNING":
+                    continue
+                kind, _, n = name.partition("_")
+                if kind in JOB_KINDS and stage.request_id:
+                    reattach.append((kind, int(n), stage.request_id))
+                else:
+                    stage.status, stage.started, stage.request_id = "PENDING", None, None
+        log.info(f"[PIPELINE] {session_id}: restored from the store, re-attaching {len(reattach)} jobs")
+        for kind, n, request_id in reattach:
+            entry = pipeline.acts[n - 1]
+            done = self._image_done if kind == "image" else self._video_done
+            jobs.track(request_id, kind, session_id,
+                       on_done=lambda job, entry=entry, n=n, done=done: done(pipeline, entry, n, job))
+        self._advance(pipeline)
+        return pipeline
+
+    def restore(self):
+        """Revive every pipeline the store still lists as RUNNING, e.g. after a restart."""
+        if self.store is None:
+            return 0
+        revived = 0
+        for session_id, record in self.store.running_sessions():
+            with self._lock:
+                if session_id in self._pipelines:
+                    continue
+            try:
+                self._revive(session_id, record)
+                revived += 1
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                log.error(f"[PIPELINE] {session_id}: could not restore from the store: {e}")
+        return revived
+
+    def start(self, session_id, params):
+        """Return ``(pipeline, created)``, resuming an existing pipeline's failed stages."""
+        self._lookup(session_id)
+        with self._lock:
+            self._prune_locked()
+            pipeline = self._pipelines.get(session_id)
+            created = pipeline is None
+            if created:
+                pipeline = self._pipelines[session_id] = Pipeline(session_id, params)
+                self.started += 1
+        if created:
+            log.info(f"[PIPELINE] {session_id}: started for show='{pipeline.show_name}'")
+        else:
+            with pipeline.lock:
+                pipeline.photo = params.get("photo") or pipeline.photo
+                pipeline.photo_token = params.get("photo_token") or pipeline.photo_token
+                failed = [stage for stage in pipeline.stages.values() if stage.status == "FAILED"]
+                for stage in failed:
+                    stage.status, stage.started, stage.finished = "PENDING", None, None
+                    stage.request_id = stage.error = None
+            if failed:
+                with self._lock:
+                    self.resumed += 1
+                log.info(f"[PIPELINE] {session_id}: resuming {', '.join(s.name for s in failed)}")
+        self._advance(pipeline)
+        return pipeline, created
+
+    def describe(self, session_id):
+        pipeline = self._lookup(session_id)
+        if pipeline is None:
+            return None
+        with pipeline.lock:
+            return pipeline.to_dict()
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.retention
+        for session_id, pipeline in list(self._pipelines.items()):
+            if pipeline.updated < cutoff and pipeline.status != "RUNNING":
+                del self._pipelines[session_id]
+
+    # -- scheduling -----------------------------------------------------------
+
+    def _advance(self, p):
+        launch = []
+        with p.lock:
+            stages = p.stages
+
+            def pending(name):
+                return name in stages and stages[name].status == "PENDING"
+
+            def ok(name):
+                return stages[name].status in ("COMPLETED", "SKIPPED")
+
+            def settle(name, status, error=None):
+                stage = stages[name]
+                stage.status, stage.error = status, error
+                stage.started = stage.started or time.time()
+                stage.finished = time.time()
+
+            if pending("photo"):
+                launch.append(("photo", self._run_photo, ()))
+            if pending("gender"):
+                if p.gender:
+                    settle("gender", "SKIPPED")
+                else:
+                    launch.append(("gender", self._run_gender, (p.photo,)))
+            if pending("storyboard") and ok("gender"):
+                launch.append(("storyboard", self._run_storyboard, ()))
+            for n, entry in enumerate(p.acts, start=1):
+                if pending(f"image_{n}") and ok("photo"):
+                    launch.append((f"image_{n}", self._run_image, (entry, n)))
+            if pending("expand") and p.storyboard_done:
+                if p.make_videos:
+                    launch.append(("expand", self._run_expand, ()))
+                else:
+                    settle("expand", "SKIPPED")
+            for n, entry in enumerate(p.acts, start=1):
+                if pending(f"video_{n}") and ok(f"image_{n}") and ok("expand"):
+                    if entry["video_prompt"]:
+                        launch.append((f"video_{n}", self._run_video, (entry, n)))
+                    else:
+                        settle(f"video_{n}", "FAILED", "Video prompt expansion failed for this act")
+            if pending("merge") and p.storyboard_done:
+                if not p.merge:
+                    settle("merge", "SKIPPED")
+                elif all(ok(f"video_{n}") for n in range(1, len(p.acts) + 1)):
+                    launch.append(("merge", self._run_merge, ()))
+
+            for name, _, _ in launch:
+                stages[name].status = "RUNNING"
+                stages[name].started = time.time()
+            p.updated = time.time()
+            snapshot = p.to_dict()
+
+        self._save(p)
+        for name, fn, args in launch:
+            self._executor.submit(self._run_stage, p, name, fn, args)
+        if self.on_change is not None:
+            try:
+                self.on_change(p.session_id, "pipeline", snapshot)
+            except Exception as e:
+                log.error(f"[PIPELINE] on_change listener failed: {e}")
+
+    def _save(self, p):
+        if self.store is None:
+            return
+        with p.lock:
+            status, record = p.status, p.to_record()
+        try:
+            self.store.save_session(p.session_id, status, record)
+        except sqlite3.Error as e:
+            log.error(f"[PIPELINE] {p.session_id}: could not save snapshot: {e}")
+
+    def _run_stage(self, p, name, fn, args):
+        try:
+            with admission_session(p.session_id):
+                if fn(p, *args) is PIPELINE_DEFERRED:
+                    return
+        except Exception as e:
+            log.error(f"[PIPELINE] {p.session_id}: stage {name} failed: {e}")
+            self._finish(p, name, error=str(e) or e.__class__.__name__)
+            return
+        self._finish(p, name)
+
+    def _finish(self, p, name, error=None):
+        with p.lock:
+            stage = p.stages.get(name)
+            if stage is None or stage.status != "RUNNING":
+                return
+            stage.status = "FAILED" if error is not None else "COMPLETED"
+            stage.error = error
+            stage.finished = time.time()
+            elapsed = stage.finished - stage.started
+        metrics.observe("pipeline_stage_seconds", elapsed, stage=name.split("_")[0], status=stage.status)
+        log.info(f"[PIPELINE] {p.session_id}: {name} {stage.status} in {elapsed:.1f}s")
+        with self._lock:
+            totals = self._stage_totals.setdefault(name.split("_")[0], [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+        self._advance(p)
+
+    # -- stages ---------------------------------------------------------------
+
+    def _run_photo(self, p):
+        with p.lock:
+            photo, token = p.photo, p.photo_token
+        if photo:
+            photo_bytes = decode_data_uri(photo)[1]
+            (media_type, normalized), thumbnail = normalize_photo(photo_bytes)
+            token = _photo_store.put(
+                media_type, normalized, thumbnail=thumbnail, digest=hashlib.sha256(photo_bytes).hexdigest()
+            )
+        elif not token or _photo_store.get(token) is None:
+            raise ValueError("Photo token expired, please upload your photo again")
+        hosted_photo_url(token)
+        with p.lock:
+            p.photo, p.photo_token = None, token
+
+    def _run_gender(self, p, photo):
+        detection, error = prepare_gender_detection({"photo": photo} if photo else {"photo_token": p.photo_token})
+        if error is not None:
+            raise ValueError(error[0]["error"])
+        gender, _ = detect_photo_gender(detection)
+        with p.lock:
+            p.gender = gender
+
+    def _run_storyboard(self, p):
+        with p.lock:
+            # A re-run starts over; callbacks from the old acts' jobs are ignored
+            for name in [n for n in p.stages if n.startswith(("image_", "video_"))]:
+                del p.stages[name]
+            p.acts, p.storyboard_done = [], False
+            data = {"show_name": p.show_name, "gender": p.gender, "user_name": p.user_name}
+        for event, payload in _stream_storyboard(data):
+            if event == "error":
+                raise RuntimeError(payload["error"])
+            with p.lock:
+                if event == "act":
+                    p.acts.append({"act": payload["act"], "image_url": None, "video_prompt": None, "video_url": None})
+                    n = len(p.acts)
+                    p.stages[f"image_{n}"] = PipelineStage(f"image_{n}")
+                    if p.make_videos:
+                        p.stages[f"video_{n}"] = PipelineStage(f"video_{n}")
+                else:
+                    for entry, act in zip(p.acts, payload["acts"]):
+                        entry["act"] = act
+                    p.storyboard_done = bool(p.acts)
+            if event == "act":
+                self._advance(p)
+        if not p.storyboard_done:
+            raise RuntimeError("Storyboard returned no acts")
+
+    def _is_current(self, p, entry):
+        return any(e is entry for e in p.acts)
+
+    def _run_image(self, p, entry, n):
+        with p.lock:
+            token, gender, prompt = p.photo_token, p.gender, entry["act"].get("prompt", "")
+        user_photo = hosted_photo_url(token) or _photo_store.get_data_uri(token)
+        if user_photo is None:
+            raise ValueError("Photo token expired, please upload your photo again")
+        response = fal.submit(f"{FAL_IMAGE_MODEL}/edit", build_image_payload(user_photo, prompt, gender))
+        if response.status_code != 200:
+            raise RuntimeError(f"fal.ai submit error: {response.text[:500]}")
+        request_id = response.json()["request_id"]
+        with p.lock:
+            p.stages[f"image_{n}"].request_id = request_id
+        self._save(p)  # a restart from here on re-attaches instead of re-submitting
+        jobs.track(request_id, "image", p.session_id, on_done=lambda job: self._image_done(p, entry, n, job))
+        return PIPELINE_DEFERRED
+
+    def _image_done(self, p, entry, n, job):
+        with p.lock:
+            if not self._is_current(p, entry):
+                return
+            image_url = extract_image_url(job.result or {}) if job.status == "COMPLETED" else None
+            entry["image_url"] = image_url
+        if image_url:
+            self._finish(p, f"image_{n}")
+        else:
+            self._finish(p, f"image_{n}", error=job.error or "No image returned")
+
+    def _run_expand(self, p):
+        with p.lock:
+            entries = list(p.acts)
+            acts = [entry["act"] for entry in entries]
+        results = expand_acts(p.show_name, acts, p.user_name)
+        with p.lock:
+            for entry, result in zip(entries, results):
+                entry["video_prompt"] = result.get("video_prompt")
+        if not any(result.get("video_prompt") for result in results):
+            raise RuntimeError(results[0].get("error", "Video prompt expansion failed"))
+
+    def _run_video(self, p, entry, n):
+        with p.lock:
+            payload = build_video_payload(entry["video_prompt"], entry["image_url"])
+        response = fal.submit(f"{FAL_VIDEO_MODEL}/image-to-video", payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"fal.ai submit error: {response.text[:500]}")
+        request_id = response.json()["request_id"]
+        with p.lock:
+            p.stages[f"video_{n}"].request_id = request_id
+        self._save(p)
+        jobs.track(request_id, "video", p.session_id, on_done=lambda job: self._video_done(p, entry, n, job))
+        return PIPELINE_DEFERRED
+
+    def _video_done(self, p, entry, n, job):
+        with p.lock:
+            if not self._is_current(p, entry):
+                return
+            video_url = extract_video_url(job.result or {}) if job.status == "COMPLETED" else None
+            entry["video_url"] = video_url
+        if video_url:
+            self._finish(p, f"video_{n}")
+        else:
+            self._finish(p, f"video_{n}", error=job.error or "No video returned")
+
+    def _run_merge(self, p, deadline=None):
+        with p.lock:
+            clip_urls = [entry["video_url"] for entry in p.acts]
+        deadline = deadline or time.monotonic() + PIPELINE_MERGE_TIMEOUT
+        try:
+            merge_queue.submit(clip_urls, on_done=lambda job: self._merge_done(p, job))
+        except MergeQueueFull as e:
+            if time.monotonic() + e.retry_after > deadline:
+                raise
+            log.info(f"[PIPELINE] {p.session_id}: merge queue full, retrying in {e.retry_after}s")
+            retry = threading.Timer(e.retry_after, self._executor.submit,
+                                    (self._run_stage, p, "merge", self._run_merge, (deadline,)))
+            retry.daemon = True
+            retry.start()
+        return PIPELINE_DEFERRED
+
+    def _merge_done(self, p, job):
+        if job.status != "COMPLETED":
+            self._finish(p, "merge", error=job.error or "Merge failed")
+            return
+        with p.lock:
+            p.merged = {"job_id": job.job_id, "url": f"/api/merge-jobs/{job.job_id}/result"}
+        self._finish(p, "merge")
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for pipeline in self._pipelines.values():
+                by_status[pipeline.status] = by_status.get(pipeline.status, 0) + 1
+            return {
+                "tracked": len(self._pipelines),
+                "by_status": by_status,
+                "started": self.started,
+                "resumed": self.resumed,
+                "restored": self.restored,
+                "stage_avg_s": {
+                    kind: round(total / count, 3) for kind, (count, total) in self._stage_totals.items()
+                },
+            }
+
+
+pipelines = PipelineRunner(
+    workers=int(os.environ.get("PIPELINE_WORKERS", 16)),
+    retention=float(os.environ.get("PIPELINE_RETENTION", 2 * 60 * 60)),
+    on_change=session_bus.publish,
+    store=job_store,
+)
+
+_resume_lock = threading.Lock()
+_resumed_from_store = False
+
+
+def resume_from_store():
+    """Pick up jobs and pipelines that were in flight when the process last stopped.
+
+    Runs once per process when the server starts (the ASGI lifespan, or the
+    development server below) rather than at import, so CLI commands and
+    scripts that import the app do not start polling.
+    """
+    global _resumed_from_store
+    with _resume_lock:
+        if _resumed_from_store:
+            return
+        _resumed_from_store = True
+    jobs.restore()
+    revived = pipelines.restore()
+    if revived:
+        log.info(f"[PIPELINE] Restored {revived} running pipelines from {job_store.path}")
+
+
+@app.route("/api/pipelines", methods=["POST"])
+def start_pipeline():
+    """Start the full photo → merged video pipeline for a session, or resume it.
+
+    Body: ``show_name``, ``photo`` (data URI) or ``photo_token``, optional
+    ``user_name``, ``gender``, ``session_id``, ``videos`` and ``merge``.
+    Progress is also published as ``pipeline`` events on the session stream.
+    """
+    data = request.json or {}
+    session_id = data.get("session_id") or uuid.uuid4().hex
+    if not SESSION_ID_RE.match(session_id):
+        return jsonify({"error": "Invalid session id"}), 400
+    if not data.get("show_name") or not (data.get("photo") or data.get("photo_token")):
+        return jsonify({"error": "show_name and photo or photo_token are required"}), 400
+    pipeline, created = pipelines.start(session_id, data)
+    return jsonify(pipelines.describe(pipeline.session_id)), 202 if created else 200
+
+
+@app.route("/api/pipelines/<session_id>")
+def pipeline_status(session_id):
+    state = pipelines.describe(session_id)
+    if state is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify(state)
+
+
+# ---------------------------------------------------------------------------
+# Cache warming — `flask --app app warm-cache` precomputes storyboards and
+# expanded video prompts for popular shows off-peak
+# ---------------------------------------------------------------------------
+def default_warm_shows():
+    """The shows offered on the landing page, in page order."""
+    with open(os.path.join(app.root_path, "templates", "index.html"), encoding="utf-8") as f:
+        page = f.read()
+    shows = [html.unescape(show) for show in re.findall(r'data-show="([^"]+)"', page)]
+    return list(dict.fromkeys(shows))
+
+
+def warm_act_expansions(show_name, acts, refresh=False):
+    """Warm /api/expand-video-prompt for every act, with the body the browser sends; returns the failed acts."""
+    all_acts = [{"act_number": act.get("act_number"), "title": act.get("title")} for act in acts]
+
+    def run(act):
+        plan = prepare_expansion({
+            "show_name": show_name,
+            "act_title": act.get("title"),
+            "scenes": act.get("scenes") or [],
+            "all_acts": all_acts,
+            "user_name": USER_NAME_PLACEHOLDER,
+        })
+        if plan["cached"] is not None and not refresh:
+            return None
+        try:
+            message = llm.create(OPUS_MODEL, max_tokens=2000, messages=[{"role": "user", "content": plan["prompt"]}])
+        except Exception as e:
+            log.error(f"[WARM-CACHE] Act {act.get('act_number')} of '{show_name}' failed: {e}")
+            return act.get("act_number")
+        finish_expansion(plan, message.content[0].text)
+        return None
+
+    return [n for n in _expand_pool.map(run, acts) if n is not None]
+
+
+def warm_show(show_name, gender, refresh=False, expand=True):
+    """Fill the storyboard and expand caches for one show and gender.
+
+    Everything is generated against the name placeholder, so the entries are
+    exactly the ones a user's first request looks up: the storyboard, the
+    batch expansion and the per-act expansions the browser falls back to.
+    Returns a short summary.
+    """
+    cache_key = storyboard_cache_key(show_name, gender)
+    acts = None if refresh else response_cache.get("storyboard", cache_key)
+    storyboard = "cached"
+    if acts is None:
+        message = llm.create(
+            OPUS_MODEL,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": build_storyboard_prompt(show_name, gender, USER_NAME_PLACEHOLDER)}],
+        )
+        acts = parse_storyboard(message.content[0].text)
+        if USER_NAME_PLACEHOLDER not in json.dumps(acts):
+            raise ValueError("placeholder missing from storyboard, not cached")
+        response_cache.set("storyboard", cache_key, acts)
+        storyboard = "generated"
+    if not expand:
+        return f"storyboard {storyboard}"
+    results = expand_acts(show_name, acts, USER_NAME_PLACEHOLDER, refresh=refresh)
+    failed = [r["act_number"] for r in results if "error" in r]
+    if failed:
+        raise RuntimeError(f"storyboard {storyboard}, expansion failed for acts {failed}")
+    failed = warm_act_expansions(show_name, acts, refresh=refresh)
+    if failed:
+        raise RuntimeError(f"storyboard {storyboard}, per-act expansion failed for acts {failed}")
+    return f"storyboard {storyboard}, {len(results)} prompts expanded (batch and per act)"
+
+
+@app.cli.command("warm-cache")
+@click.argument("shows", nargs=-1)
+@click.option("--shows-file", type=click.File("r"), help="File with one show name per line.")
+@click.option("--gender", "genders", type=click.Choice(["male", "female"]), multiple=True,
+              help="Gender(s) to warm; both by default.")
+@click.option("--workers", default=2, show_default=True, help="Shows warmed in parallel.")
+@click.option("--refresh", is_flag=True, help="Regenerate entries that are already cached.")
+@click.option("--no-expand", is_flag=True, help="Only warm storyboards.")
+def warm_cache_command(shows, shows_file, genders, workers, refresh, no_expand):
+    """Precompute storyboards and video prompts for SHOWS (default: the landing page shows)."""
+    shows = list(shows)
+    if shows_file is not None:
+        shows += [line.strip() for line in shows_file if line.strip() and not line.startswith("#")]
+    shows = shows or default_warm_shows()
+    targets = [(show, gender) for show in shows for gender in (genders or ("female", "male"))]
+    click.echo(f"Warming {len(targets)} storyboards with {workers} workers")
+
+    def run(target):
+        start = time.monotonic()
+        try:
+            return target, True, warm_show(*target, refresh=refresh, expand=not no_expand), time.monotonic() - start
+        except Exception as e:
+            log.error(f"[WARM-CACHE] {target[0]} ({target[1]}) failed: {e}")
+            return target, False, str(e), time.monotonic() - start
+
+    failures = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="warm") as pool:
+        for (show, gender), ok, summary, elapsed in pool.map(run, targets):
+            failures += not ok
+            click.echo(f"  {'ok  ' if ok else 'FAIL'} {show} ({gender}): {summary} [{elapsed:.1f}s]")
+    click.echo(f"Done in {time.monotonic() - start:.1f}s: {len(targets) - failures} warmed, {failures} failed")
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 3000))
+    # The reloader runs this file twice; only its serving child resumes work
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        resume_from_store()
     app.run(debug=True, host="0.0.0.0", port=port, threaded=True)
@@ -0,0 +1,617 @@
+"""Async (ASGI) serving mode for the I/O-bound proxy endpoints.
+
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --workers 1
+
+This is what the Procfile runs.  The endpoints that spend nearly all their
+time waiting on Anthropic or fal.ai are served natively on the event loop
+with httpx.AsyncClient and AsyncAnthropic, so one process can hold
+thousands of upstream waits instead of being capped at a gthread worker's
+threads.  Session event streams are served here too, so open EventSources
+don't hold bridge threads.  Routes and JSON contracts match app.py.  Every
+other route (index, photo upload, jobs, merge) falls through to the Flask
+app via a WSGI bridge of WORKER_THREADS threads and shares its in-process
+state: photo store, storyboard cache, job manager and session events.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+import traceback
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from anthropic import AsyncAnthropic, RateLimitError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app
+from app import (
+    ADMISSION_MAX_DEFERRALS,
+    AdmissionTimeout,
+    FAL_IMAGE_MODEL,
+    FAL_TIMEOUTS,
+    FAL_VIDEO_MODEL,
+    HAIKU_MODEL,
+    LLMBusyError,
+    LOG_PAYLOADS,
+    OPUS_MODEL,
+    SharedResponse,
+    admission_key,
+    log,
+    metrics,
+    retry_after_seconds,
+)
+
+
+# ---------------------------------------------------------------------------
+# Async upstream clients
+# ---------------------------------------------------------------------------
+class AsyncSingleFlight:
+    """asyncio counterpart of app.SingleFlight.
+
+    The leader's call runs as its own task, so a disconnecting client doesn't
+    cancel it for the callers sharing it. Calls are counted against the
+    given app.SingleFlight so /api/stats covers both serving modes.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+        self._flights = {}  # key -> [task, finished monotonic time or None]
+
+    async def do(self, key, fn):
+        entry = self._flights.get(key)
+        if entry is not None and entry[1] is not None and time.monotonic() - entry[1] > self.shared.linger:
+            entry = None
+        leader = entry is None
+        if leader:
+            if len(self._flights) > 1000:
+                self._prune()
+            entry = self._flights[key] = [asyncio.ensure_future(fn()), None]
+            entry[0].add_done_callback(lambda task, key=key: self._finished(key, task))
+        self.shared.note(leader)
+        return await asyncio.shield(entry[0])
+
+    def _finished(self, key, task):
+        entry = self._flights.get(key)
+        if entry is None or entry[0] is not task:
+            return
+        if self.shared.linger <= 0 or task.cancelled() or task.exception() is not None:
+            del self._flights[key]
+        else:
+            entry[1] = time.monotonic()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, (task, finished) in list(self._flights.items()):
+            if finished is not None and now - finished > self.shared.linger:
+                del self._flights[key]
+
+
+class AsyncFalClient:
+    """httpx counterpart of app.FalClient with the same timeouts and retry policy.
+
+    GETs are retried on 429/5xx and transport errors; POST submits never, so
+    a job is never submitted twice. Submissions share app.FalClient's
+    admission controller, which defers them on 429.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, api_key, pool_size, retries, admission, status_flights):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.retries = retries
+        self.admission = admission
+        self.status_flights = AsyncSingleFlight(status_flights)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(30.0, pool=None),
+        )
+
+    def _headers(self):
+        return {"Authorization": f"Key {self.api_key}"}
+
+    async def request(self, method, url, kind, endpoint="", **kwargs):
+        metrics.inc("fal_in_flight", kind=kind)
+        start = time.monotonic()
+        try:
+            response = await self._request(method, url, kind, **kwargs)
+        except Exception:
+            metrics.inc("fal_errors_total", kind=kind, endpoint=endpoint)
+            raise
+        finally:
+            metrics.inc("fal_in_flight", -1, kind=kind)
+            metrics.observe("fal_request_seconds", time.monotonic() - start, kind=kind, endpoint=endpoint)
+        if response.status_code >= 400:
+            metrics.inc("fal_errors_total", kind=kind, endpoint=endpoint)
+        return response
+
+    async def _request(self, method, url, kind, **kwargs):
+        connect, read = FAL_TIMEOUTS[kind]
+        kwargs.setdefault("timeout", httpx.Timeout(read, connect=connect, pool=None))
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if method != "GET" or last_attempt:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            retryable = method == "GET" and response.status_code in self.RETRY_STATUSES
+            if not retryable or last_attempt:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else 0.5 * 2 ** attempt
+            await asyncio.sleep(delay)
+
+    async def submit(self, model, payload):
+        bucket = self.admission.model_for(model)
+        key = admission_key()
+        deadline = time.monotonic() + self.admission.queue_timeout
+        for attempt in range(ADMISSION_MAX_DEFERRALS + 1):
+            await self.admission.acquire_async(bucket, key, timeout=deadline - time.monotonic())
+            response = await self.request(
+                "POST", f"{self.base_url}/{model}", "submit", model, headers=self._headers(), json=payload,
+            )
+            if response.status_code != 429 or attempt == ADMISSION_MAX_DEFERRALS:
+                return response
+            delay = retry_after_seconds(response.headers.get("Retry-After"), attempt)
+            log.warning(f"[ADMISSION] fal.ai 429 on {model}, deferring {bucket} submissions {delay:.1f}s")
+            self.admission.defer(bucket, delay)
+
+    async def status(self, model, request_id):
+        return await self.status_flights.do((model, request_id), lambda: self._status(model, request_id))
+
+    async def _status(self, model, request_id):
+        return SharedResponse.of(await self.request(
+            "GET", f"{self.base_url}/{model}/requests/{request_id}/status", "status", model,
+            headers=self._headers(),
+        ))
+
+    async def result(self, model, request_id):
+        return await self.request(
+            "GET", f"{self.base_url}/{model}/requests/{request_id}", "result", model,
+            headers=self._headers(),
+        )
+
+
+class AsyncLLMClient:
+    """AsyncAnthropic counterpart of app.LLMClient.
+
+    Uses the same admission controller, per-model concurrency slots and
+    timeouts, and records into the shared app.llm counters so /api/stats
+    covers both serving modes. Calls made here and calls made through the
+    WSGI bridge (pipelines, batch expansion, warm-cache) share one limit.
+    """
+
+    def __init__(self, sync_llm):
+        self.sync_llm = sync_llm
+        self.client = AsyncAnthropic(api_key=sync_llm.api_key, max_retries=2)
+        self.flights = AsyncSingleFlight(sync_llm.flights)
+
+    async def _acquire(self, model):
+        cfg = self.sync_llm.limits[model]
+        start = time.monotonic()
+        try:
+            await self.sync_llm.admission.acquire_async(model, admission_key(), timeout=cfg["queue_timeout"])
+            remaining = cfg["queue_timeout"] - (time.monotonic() - start)
+            acquired = await self.sync_llm.acquire_slot_async(model, max(remaining, 0))
+        except AdmissionTimeout:
+            acquired = False
+        if not acquired:
+            metrics.inc("llm_busy_rejections_total", model=model)
+            raise LLMBusyError(f"Too many concurrent {model} requests, please retry shortly")
+        metrics.inc("llm_in_flight", model=model)
+        return cfg
+
+    def _release(self, model, elapsed, message):
+        self.sync_llm.release_slot(model)
+        metrics.inc("llm_in_flight", -1, model=model)
+        self.sync_llm.record(model, elapsed, message)
+
+    async def create(self, model, **kwargs):
+        for attempt in range(ADMISSION_MAX_DEFERRALS + 1):
+            cfg = await self._acquire(model)
+            start = time.monotonic()
+            message = None
+            try:
+                message = await self.client.messages.create(model=model, timeout=cfg["timeout"], **kwargs)
+                return message
+            except RateLimitError as e:
+                self.sync_llm.defer(model, e, attempt)
+            finally:
+                self._release(model, time.monotonic() - start, message)
+
+    async def stream(self, model, **kwargs):
+        """Yield the text deltas of a streamed ``messages`` call within ``model``'s admission and concurrency limits."""
+        for attempt in range(ADMISSION_MAX_DEFERRALS + 1):
+            cfg = await self._acquire(model)
+            start = time.monotonic()
+            message = None
+            try:
+                async with self.client.messages.stream(model=model, timeout=cfg["timeout"], **kwargs) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    message = await stream.get_final_message()
+                return
+            except RateLimitError as e:
+                self.sync_llm.defer(model, e, attempt)
+            finally:
+                self._release(model, time.monotonic() - start, message)
+
+    async def create_shared(self, model, **kwargs):
+        """Like ``create``, but identical concurrent calls share one upstream request."""
+        key = hashlib.sha256(json.dumps([model, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+        return await self.flights.do(key, lambda: self.create(model, **kwargs))
+
+
+fal = AsyncFalClient(
+    base_url=flask_app.FAL_QUEUE_URL,
+    api_key=flask_app.FAL_KEY,
+    pool_size=int(os.environ.get("FAL_ASYNC_POOL_SIZE", 200)),
+    retries=int(os.environ.get("FAL_MAX_RETRIES", 3)),
+    admission=flask_app.fal_admission,
+    status_flights=flask_app.fal.status_flights,
+)
+llm = AsyncLLMClient(flask_app.llm)
+
+
+# ---------------------------------------------------------------------------
+# Async route handlers — same contracts as the Flask views in app.py
+# ---------------------------------------------------------------------------
+async def request_json(request):
+    """Parse the JSON body and queue the request's upstream calls under its session, as app.admission_key does."""
+    data = await request.json()
+    flask_app.current_admission_key.set(data.get("session_id") or (request.client and request.client.host))
+    return data
+
+
+async def detect_gender(request: Request):
+    data = await request_json(request)
+    # Hashing and thumbnailing the photo is CPU work, keep it off the loop
+    detection, error = await asyncio.to_thread(flask_app.prepare_gender_detection, data)
+    if error is not None:
+        return JSONResponse(error[0], status_code=error[1])
+    cached = detection["gender"] is not None
+    gender = detection["gender"]
+    if not cached:
+        message = await llm.create_shared(
+            HAIKU_MODEL,
+            max_tokens=10,
+            messages=flask_app.build_gender_messages(detection["media_type"], detection["b64_data"]),
+        )
+        gender = flask_app.parse_gender(message.content[0].text)
+        await asyncio.to_thread(flask_app.remember_gender, detection, gender)
+    log.info(f"[DETECT-GENDER] Detected: {gender}{' (cached)' if cached else ''}")
+    return JSONResponse({"gender": gender, "cached": cached})
+
+
+async def generate_storyboard(request: Request):
+    data = await request_json(request)
+    if data.get("stream"):
+        return StreamingResponse(
+            _storyboard_ndjson(data),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    session_id = data.get("session_id")
+    flask_app.session_bus.publish(session_id, "storyboard", {"status": "IN_PROGRESS"})
+    try:
+        body, status = await _generate_storyboard(data)
+    except Exception as e:
+        flask_app.session_bus.publish(session_id, "storyboard", {"status": "FAILED", "error": str(e)})
+        raise
+    if status == 200:
+        flask_app.session_bus.publish(session_id, "storyboard", {"status": "COMPLETED", "acts": body["acts"]})
+    else:
+        flask_app.session_bus.publish(session_id, "storyboard", {"status": "FAILED", "error": body["error"]})
+    return JSONResponse(body, status_code=status)
+
+
+async def _generate_storyboard(data):
+    # Cache reads and writes hit SQLite, so they run off the loop
+    plan = await asyncio.to_thread(flask_app.prepare_storyboard, data)
+    if plan["cached"] is not None:
+        return {"acts": plan["cached"], "cached": True}, 200
+
+    try:
+        log.info(f"[STORYBOARD] Calling Claude for show='{plan['show_name']}', gender={plan['gender']}, "
+                 f"user_name='{plan['user_name']}'")
+        message = await llm.create_shared(
+            OPUS_MODEL,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": plan["prompt"]}],
+        )
+    except LLMBusyError:
+        raise
+    except Exception as e:
+        log.error(f"[STORYBOARD] Claude API error: {e}")
+        log.error(traceback.format_exc())
+        return {"error": f"Claude API error: {str(e)}"}, 502
+
+    return await asyncio.to_thread(flask_app.finish_storyboard, plan, message.content[0].text)
+
+
+async def _storyboard_ndjson(data):
+    session_id = data.get("session_id")
+    flask_app.session_bus.publish(session_id, "storyboard", {"status": "IN_PROGRESS"})
+    async for event, payload in _stream_storyboard(data):
+        yield flask_app.storyboard_stream_line(session_id, event, payload)
+
+
+async def _stream_storyboard(data):
+    plan = await asyncio.to_thread(flask_app.prepare_storyboard, data)
+    if plan["cached"] is not None:
+        for act in plan["cached"]:
+            yield "act", {"act": act}
+        yield "done", {"acts": plan["cached"], "cached": True}
+        return
+
+    parser = flask_app.StoryboardStreamParser()
+    try:
+        log.info(f"[STORYBOARD] Streaming Claude for show='{plan['show_name']}', gender={plan['gender']}, "
+                 f"user_name='{plan['user_name']}'")
+        async for text in llm.stream(
+            OPUS_MODEL, max_tokens=2000, messages=[{"role": "user", "content": plan["prompt"]}],
+        ):
+            for act in parser.feed(text):
+                log.info(f"[STORYBOARD] Act {len(parser.acts)} streamed for show='{plan['show_name']}'")
+                yield "act", {"act": flask_app.fill_user_name(act, plan["user_name"])}
+    except Exception as e:
+        yield "error", flask_app.storyboard_stream_error(parser, e)
+        return
+    yield await asyncio.to_thread(flask_app.finish_storyboard_stream, plan, parser)
+
+
+async def expand_video_prompt(request: Request):
+    data = await request_json(request)
+    plan = await asyncio.to_thread(flask_app.prepare_expansion, data)
+    if plan["cached"] is not None:
+        return JSONResponse({"video_prompt": plan["cached"], "cached": True})
+    message = await llm.create_shared(
+        OPUS_MODEL, max_tokens=2000, messages=[{"role": "user", "content": plan["prompt"]}],
+    )
+    return JSONResponse(await asyncio.to_thread(flask_app.finish_expansion, plan, message.content[0].text))
+
+
+_expand_slots = asyncio.Semaphore(flask_app.EXPAND_BATCH_WORKERS)
+
+
+async def expand_video_prompts(request: Request):
+    data = await request_json(request)
+    show_name = data["show_name"]
+    if not data.get("acts"):
+        return JSONResponse({"error": "No acts provided"}, status_code=400)
+
+    plan = await asyncio.to_thread(flask_app.prepare_expansions, show_name, data["acts"], data.get("user_name"))
+    acts, results, todo = plan["acts"], plan["results"], plan["todo"]
+    if not todo:
+        return JSONResponse({"video_prompts": await asyncio.to_thread(flask_app.finish_expansions, plan)})
+
+    system = flask_app.build_expand_context(show_name, acts)
+
+    async def run(index):
+        act = acts[index]
+        entry = {"act_number": act.get("act_number", index + 1)}
+        try:
+            async with _expand_slots:
+                message = await llm.create_shared(
+                    OPUS_MODEL,
+                    max_tokens=2000,
+                    system=system,
+                    messages=[{"role": "user", "content": flask_app.build_expand_act_message(act, index)}],
+                )
+            entry["video_prompt"] = flask_app.sanitize_sora_prompt(message.content[0].text.strip(), record=False)
+        except Exception as e:
+            log.error(f"[EXPAND-VIDEO-PROMPTS] Act {entry['act_number']} failed: {e}")
+            entry["error"] = str(e)
+        results[index] = entry
+
+    # First act alone so its response writes the prompt cache the others read
+    await run(todo[0])
+    await asyncio.gather(*[run(i) for i in todo[1:]])
+    return JSONResponse({"video_prompts": await asyncio.to_thread(flask_app.finish_expansions, plan)})
+
+
+async def generate_scene_prompt(request: Request):
+    data = await request_json(request)
+    message = await llm.create_shared(
+        HAIKU_MODEL,
+        max_tokens=300,
+        messages=[{"role": "user", "content": flask_app.build_scene_prompt(data["show_name"])}],
+    )
+    return JSONResponse({"prompt": message.content[0].text})
+
+
+async def generate_image(request: Request):
+    data = await request_json(request)
+    # May upload the photo to fal.ai storage on first use, so keep it off the loop
+    user_photo, error = await asyncio.to_thread(flask_app.resolve_user_photo, data)
+    if error is not None:
+        return JSONResponse(error[0], status_code=error[1])
+    scene_number = data.get("scene_number", 1)
+    payload = flask_app.build_image_payload(user_photo, data["prompt"], data.get("gender", "male"))
+    if LOG_PAYLOADS:
+        log.info(f"[GENERATE-IMAGE] Scene {scene_number}, prompt: {payload['prompt'][:150]}...")
+
+    try:
+        submit_resp = await fal.submit(f"{FAL_IMAGE_MODEL}/edit", payload)
+        if LOG_PAYLOADS:
+            log.info(f"[GENERATE-IMAGE] Scene {scene_number} submit: {submit_resp.status_code} {submit_resp.text[:500]}")
+
+        if submit_resp.status_code != 200:
+            return JSONResponse(
+                {"error": f"fal.ai submit error: {submit_resp.text[:500]}"},
+                status_code=submit_resp.status_code,
+            )
+
+        submit_data = submit_resp.json()
+        if submit_data.get("request_id"):
+            # Tracking writes the job through to the SQLite job store
+            await asyncio.to_thread(flask_app.jobs.track, submit_data["request_id"], "image", data.get("session_id"))
+        return JSONResponse(submit_data)
+
+    except AdmissionTimeout:
+        raise
+    except Exception as e:
+        log.error(f"[GENERATE-IMAGE] Scene {scene_number} exception: {e}")
+        log.error(traceback.format_exc())
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def generate_video(request: Request):
+    data = await request_json(request)
+    payload = flask_app.build_video_payload(data.get("prompt", ""), data["image_url"])
+
+    response = await fal.submit(f"{FAL_VIDEO_MODEL}/image-to-video", payload)
+    if LOG_PAYLOADS:
+        log.info(f"[GENERATE-VIDEO] Queue submission response ({response.status_code}): {response.text[:500]}")
+
+    if response.status_code != 200:
+        return JSONResponse({"error": response.text}, status_code=response.status_code)
+
+    submit_data = response.json()
+    if submit_data.get("request_id"):
+        await asyncio.to_thread(flask_app.jobs.track, submit_data["request_id"], "video", data.get("session_id"))
+    return JSONResponse(submit_data)
+
+
+def _status_view(model, tag, fallback):
+    async def view(request: Request):
+        request_id = request.path_params["request_id"]
+        response = await fal.status(model, request_id)
+        if LOG_PAYLOADS:
+            log.info(f"[{tag}] {request_id}: {response.text[:300]}")
+        try:
+            return JSONResponse(response.json())
+        except ValueError:
+            return JSONResponse(fallback(response))
+    return view
+
+
+def _result_view(model, tag):
+    async def view(request: Request):
+        request_id = request.path_params["request_id"]
+        response = await fal.result(model, request_id)
+        if LOG_PAYLOADS:
+            log.info(f"[{tag}] {request_id}: {response.status_code} {response.text[:500]}")
+        try:
+            return JSONResponse(response.json())
+        except ValueError:
+            return JSONResponse({"error": "Invalid response", "raw": response.text[:200]}, status_code=502)
+    return view
+
+
+# ---------------------------------------------------------------------------
+# Session events — SSE on the event loop, woken by app.session_bus listeners
+# ---------------------------------------------------------------------------
+ASGI_SSE_MAX_STREAMS = int(os.environ.get("ASGI_SSE_MAX_STREAMS", 1000))
+_sse_open = 0
+
+
+async def session_event_stream(request: Request):
+    session_id = request.path_params["session_id"]
+    if not flask_app.SESSION_ID_RE.match(session_id):
+        return JSONResponse({"error": "Invalid session id"}, status_code=400)
+    if _sse_open >= ASGI_SSE_MAX_STREAMS:
+        return JSONResponse({"error": "Too many open event streams"}, status_code=503,
+                            headers={"Retry-After": "10"})
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id") or 0)
+    except ValueError:
+        last_id = 0
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    def notify():
+        loop.call_soon_threadsafe(wake.set)
+
+    async def stream():
+        global _sse_open
+        # Counted from the first iteration: a client gone before then never
+        # runs this body, so there is nothing to undo
+        _sse_open += 1
+        flask_app.session_bus.listen(session_id, notify)
+        after_id = last_id
+        deadline = time.monotonic() + flask_app.SSE_STREAM_SECONDS
+        try:
+            yield "retry: 1000\n\n"
+            while True:
+                wake.clear()
+                events = flask_app.session_bus.wait(session_id, after_id, 0)
+                for event_id, event, data in events:
+                    after_id = event_id
+                    yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                if events:
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(wake.wait(), min(flask_app.SSE_HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            flask_app.session_bus.unlisten(session_id, notify)
+            _sse_open -= 1
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def handle_llm_busy(request: Request, exc: LLMBusyError):
+    log.warning(f"[LLM] {exc}")
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "5"})
+
+
+async def handle_admission_timeout(request: Request, exc: AdmissionTimeout):
+    log.warning(f"[ADMISSION] {exc}")
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "5"})
+
+
+async def handle_exception(request: Request, exc: Exception):
+    log.error(f"Unhandled exception: {exc}")
+    log.error(traceback.format_exc())
+    return JSONResponse({"error": f"Server error: {str(exc)}"}, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Resume jobs and pipelines left in flight by the previous process
+    await asyncio.to_thread(flask_app.resume_from_store)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/api/detect-gender", detect_gender, methods=["POST"]),
+        Route("/api/generate-storyboard", generate_storyboard, methods=["POST"]),
+        Route("/api/expand-video-prompt", expand_video_prompt, methods=["POST"]),
+        Route("/api/expand-video-prompts", expand_video_prompts, methods=["POST"]),
+        Route("/api/generate-scene-prompt", generate_scene_prompt, methods=["POST"]),
+        Route("/api/generate-image", generate_image, methods=["POST"]),
+        Route("/api/generate-video", generate_video, methods=["POST"]),
+        Route("/api/image-status/{request_id}", _status_view(
+            FAL_IMAGE_MODEL, "IMAGE-STATUS", lambda r: {"status": "IN_PROGRESS"})),
+        Route("/api/image-result/{request_id}", _result_view(FAL_IMAGE_MODEL, "IMAGE-RESULT")),
+        Route("/api/video-status/{request_id}", _status_view(
+            FAL_VIDEO_MODEL, "VIDEO-STATUS", lambda r: {"status": "IN_PROGRESS", "raw": r.text[:200]})),
+        Route("/api/video-result/{request_id}", _result_view(FAL_VIDEO_MODEL, "VIDEO-RESULT")),
+        Route("/api/sessions/{session_id}/events", session_event_stream),
+        # Everything else (index, uploads, jobs, merge) is served by Flask
+        Mount("/", WSGIMiddleware(flask_app.app, workers=int(os.environ.get("ASGI_WSGI_THREADS",
+                                                                            flask_app.WORKER_THREADS)))),
+    ],
+    exception_handlers={
+        LLMBusyError: handle_llm_busy,
+        AdmissionTimeout: handle_admission_timeout,
+        Exception: handle_exception,
+    },
+    lifespan=lifespan,
+)
@@ -0,0 +1,77 @@
+"""Time the Sora sanitiser against a plain sequential reference.
+
+    python bench_sanitizer.py --repeat 200
+
+The reference runs one ``pattern.sub`` per rule from the same
+sora_rules.json, the way the sanitiser used to. Both are timed on the
+sanitizer_golden.jsonl prompts and on prompts padded to the 4900-char Sora
+limit. Output equivalence is checked by tests/test_sanitizer.py.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from app import SORA_RULES_PATH, SoraSanitizer  # noqa: E402
+
+
+def load_golden(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sequential_reference(rules):
+    """The pre-compiled-list engine the sanitiser used to run: one scan per rule."""
+    compiled = [(re.compile(rule["pattern"], re.IGNORECASE), rule["replacement"]) for rule in rules]
+
+    def sanitize(prompt):
+        for pattern, replacement in compiled:
+            prompt = pattern.sub(replacement, prompt)
+        prompt = re.sub(r'  +', ' ', prompt).strip()
+        return re.sub(r'says:\s*""', 'says: "..."', prompt)
+
+    return sanitize
+
+
+def time_per_prompt(fn, prompts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for prompt in prompts:
+            fn(prompt)
+    return (time.perf_counter() - start) / (repeat * len(prompts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--golden", default=os.path.join(HERE, "sanitizer_golden.jsonl"))
+    parser.add_argument("--rules", default=SORA_RULES_PATH)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    sanitizer = SoraSanitizer(args.rules)
+    golden = load_golden(args.golden)
+
+    with open(args.rules) as f:
+        sequential = sequential_reference(json.load(f)["rules"])
+    prompts = [g["prompt"] for g in golden]
+    long_prompts = []
+    for i in range(0, len(prompts), 8):
+        padded = " ".join(prompts[i:] + prompts[:i])
+        long_prompts.append(padded[:4900])
+
+    print(f"\n{'corpus':<14}{'n':>6}{'avg chars':>11}{'sequential':>14}{'sanitizer':>14}{'speedup':>10}")
+    for label, batch in (("golden", prompts), ("4900-char", long_prompts)):
+        before = time_per_prompt(sequential, batch, args.repeat)
+        after = time_per_prompt(sanitizer.sanitize, batch, args.repeat)
+        avg_chars = sum(map(len, batch)) / len(batch)
+        print(f"{label:<14}{len(batch):>6}{avg_chars:>11.0f}"
+              f"{before * 1e6:>12.1f}us{after * 1e6:>12.1f}us{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
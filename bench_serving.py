@@ -0,0 +1,151 @@
+"""Benchmark the gthread (WSGI) and ASGI serving modes against stubbed upstreams.
+
+    python bench_serving.py --users 100 --llm-latency 2
+
+Starts stub_upstream.py, then for each serving mode boots the app pointed at
+the stub, runs ``--users`` concurrent simulated users (one storyboard call
+plus a burst of image status polls each) and prints latency percentiles and
+throughput per mode.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SERVING_MODES = {
+    "gthread": lambda port, threads=12: [
+        "gunicorn", "app:app", "-k", "gthread", "--workers", "1", "--threads", str(threads),
+        "--timeout", "900", "-b", f"127.0.0.1:{port}",
+    ],
+    # Thread count is the WSGI bridge's, set through ASGI_WSGI_THREADS
+    "asgi": lambda port, threads=12: [
+        "uvicorn", "asgi_app:app", "--workers", "1", "--port", str(port), "--log-level", "warning",
+    ],
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_until_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def simulated_user(client, base, polls, latencies, errors):
+    async def timed(kind, method, path, **kwargs):
+        start = time.monotonic()
+        try:
+            response = await client.request(method, base + path, **kwargs)
+            if response.status_code >= 400:
+                errors[kind] = errors.get(kind, 0) + 1
+            return response
+        except httpx.HTTPError:
+            errors[kind] = errors.get(kind, 0) + 1
+            return None
+        finally:
+            latencies.setdefault(kind, []).append(time.monotonic() - start)
+
+    await timed("storyboard", "POST", "/api/generate-storyboard",
+                json={"show_name": "Twilight", "gender": "female", "user_name": "Bench", "no_cache": True})
+    submit = await timed("generate-image", "POST", "/api/generate-image",
+                         json={"photo": "data:image/jpeg;base64,AAAA", "prompt": "bench"})
+    request_id = submit.json().get("request_id", "missing") if submit is not None and submit.status_code == 200 else "missing"
+    for _ in range(polls):
+        await timed("image-status", "GET", f"/api/image-status/{request_id}")
+
+
+async def run_mode(mode, port, args, env):
+    server = subprocess.Popen(SERVING_MODES[mode](port), cwd=HERE, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        await wait_until_up(base + "/api/health")
+        latencies, errors = {}, {}
+        limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users)
+        async with httpx.AsyncClient(limits=limits, timeout=900) as client:
+            start = time.monotonic()
+            await asyncio.gather(*[
+                simulated_user(client, base, args.polls, latencies, errors) for _ in range(args.users)
+            ])
+            wall = time.monotonic() - start
+        return wall, latencies, errors
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def report(mode, wall, latencies, errors):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n=== {mode}: {total} requests in {wall:.2f}s ({total / wall:.1f} req/s) ===")
+    print(f"{'endpoint':<16}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'errors':>8}")
+    for kind, values in latencies.items():
+        print(f"{kind:<16}{len(values):>6}"
+              f"{percentile(values, 50):>9.3f}{percentile(values, 95):>9.3f}"
+              f"{percentile(values, 99):>9.3f}{max(values):>9.3f}{errors.get(kind, 0):>8}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=5, help="image status polls per user")
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--fal-latency", type=float, default=0.1)
+    parser.add_argument("--modes", nargs="+", default=list(SERVING_MODES), choices=list(SERVING_MODES))
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--port", type=int, default=9101)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, "stub_upstream.py", "--port", str(args.stub_port),
+         "--llm-latency", str(args.llm_latency), "--fal-latency", str(args.fal_latency)],
+        cwd=HERE,
+    )
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env = dict(
+        os.environ,
+        FAL_QUEUE_URL=stub_url,
+        ANTHROPIC_BASE_URL=stub_url,
+        FAL_KEY="stub",
+        ANTHROPIC_API_KEY="stub",
+        CACHE_DIR=tempfile.mkdtemp(prefix="sorashorts-bench-"),
+        # Measure the serving model, not the per-model LLM caps or admission rates
+        LLM_OPUS_CONCURRENCY=str(args.users),
+        LLM_HAIKU_CONCURRENCY=str(args.users),
+        ANTHROPIC_RATE="0",
+        LLM_OPUS_RATE="0",
+        LLM_HAIKU_RATE="0",
+        FAL_SUBMIT_RATE="0",
+        FAL_IMAGE_SUBMIT_RATE="0",
+    )
+    try:
+        await wait_until_up(stub_url + "/health")
+        for mode in args.modes:
+            report(mode, *await run_mode(mode, args.port, args, env))
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,458 @@
+"""Load-test the full /api/* flow at N concurrent simulated users per serving configuration.
+
+    python loadtest.py --users 50 --llm-latency 2 --job-seconds 5 --fal-error-rate 0.02
+
+Starts stub_upstream.py, then for every serving mode and ``--threads`` value
+boots the app against the stub and runs ``--users`` simulated users doing what
+the browser does: upload the photo (with gender detection), stream the
+storyboard, submit one image per act and wait for it, expand the video
+prompts, submit one clip per act and wait for it, and optionally merge
+(``--merge``, needs ffmpeg and ``--clip`` pointing at a real MP4). Users keep a
+session event stream open like the browser and poll /api/jobs as a fallback.
+
+While users run, the server's process tree is sampled from /proc (RSS and OS
+threads, Linux only), together with the number of requests the users have
+outstanding (open streams included) and the latency of a /api/health probe.
+The users are the server's only clients, so outstanding requests beyond the
+request threads are queued. Each configuration reports p50/p95/p99 latency and
+errors per endpoint, per-user flow time, peak RSS, and thread saturation: the
+share of samples in which every request thread was taken. Under asgi the
+native async endpoints need no thread, so saturation is an upper bound there.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+from PIL import Image
+
+from bench_serving import SERVING_MODES, percentile, wait_until_up
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JOB_DONE = ("COMPLETED", "FAILED")
+
+
+def user_photo(index):
+    """A distinct 1024x1536 JPEG per user, so photo digests (and the gender cache) differ."""
+    image = Image.new("RGB", (1024, 1536), ((index * 37) % 256, (index * 91) % 256, (index * 53) % 256))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode()
+
+
+class Recorder:
+    """Per-endpoint latencies and error counts shared by every simulated user."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.flows = []
+        self.failed_flows = {}
+        self.outstanding = 0  # requests sent and not yet answered in full, streams included
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def call(self, client, kind, method, url, **kwargs):
+        start = time.monotonic()
+        self.outstanding += 1
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code >= 400:
+                self.error(kind)
+            return response
+        except httpx.HTTPError:
+            self.error(kind)
+            return None
+        finally:
+            self.outstanding -= 1
+            self.latencies.setdefault(kind, []).append(time.monotonic() - start)
+
+
+class FlowFailed(Exception):
+    pass
+
+
+class SessionEvents:
+    """Job snapshots pushed over /api/sessions/<id>/events, mirroring the browser's EventSource."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.updates = 0
+        self.changed = asyncio.Event()
+
+    async def follow(self, client, url, recorder):
+        last_id = 0
+        while True:
+            recorder.outstanding += 1
+            try:
+                headers = {"Last-Event-ID": str(last_id)} if last_id else {}
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code != 200:
+                        await asyncio.sleep(10)
+                        continue
+                    event = None
+                    async for line in response.aiter_lines():
+                        if line.startswith("id: "):
+                            last_id = int(line[4:])
+                        elif line.startswith("event: "):
+                            event = line[7:]
+                        elif line.startswith("data: ") and event in ("image", "video"):
+                            job = json.loads(line[6:])
+                            self.jobs[job["request_id"]] = job
+                            self.updates += 1
+                            self.changed.set()
+            except httpx.HTTPError:
+                await asyncio.sleep(1)
+            finally:
+                recorder.outstanding -= 1
+
+    async def wait(self, seen, timeout):
+        """Wait up to ``timeout`` for an update after the ``seen``-th one."""
+        if self.updates != seen:
+            return
+        self.changed.clear()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wait_for_job(client, base, recorder, events, request_id, kind, args):
+    """Wait for pushed job updates like the browser, polling /api/jobs when none arrive in time."""
+    interval = args.event_poll_interval if events else args.poll_interval
+    deadline = time.monotonic() + args.job_timeout
+    last_poll = time.monotonic()
+    while time.monotonic() < deadline:
+        seen = events.updates if events else 0
+        job = events.jobs.get(request_id) if events else None
+        if (job is None or job["status"] not in JOB_DONE) and time.monotonic() - last_poll >= interval:
+            last_poll = time.monotonic()
+            response = await recorder.call(client, "job-status", "GET", f"{base}/api/jobs/{request_id}",
+                                           params={"kind": kind})
+            if response is not None and response.status_code == 200:
+                job = response.json()
+        if job is not None and job["status"] in JOB_DONE:
+            if job["status"] == "FAILED":
+                raise FlowFailed(f"{kind}-job")
+            return job.get("result") or {}
+        remaining = max(0.0, last_poll + interval - time.monotonic())
+        if events:
+            await events.wait(seen, remaining)
+        else:
+            await asyncio.sleep(remaining)
+    raise FlowFailed(f"{kind}-timeout")
+
+
+async def stream_storyboard(client, base, recorder, body):
+    start = time.monotonic()
+    acts, first_act = [], None
+    recorder.outstanding += 1
+    try:
+        async with client.stream("POST", f"{base}/api/generate-storyboard", json=body) as response:
+            if response.status_code != 200:
+                recorder.error("storyboard")
+                raise FlowFailed("storyboard")
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if message.get("event") == "act" and first_act is None:
+                    first_act = time.monotonic() - start
+                elif message.get("event") == "done":
+                    acts = message["acts"]
+                elif message.get("event") == "error":
+                    recorder.error("storyboard")
+                    raise FlowFailed("storyboard")
+    except httpx.HTTPError:
+        recorder.error("storyboard")
+        raise FlowFailed("storyboard")
+    finally:
+        recorder.outstanding -= 1
+        recorder.latencies.setdefault("storyboard", []).append(time.monotonic() - start)
+    if first_act is not None:
+        recorder.latencies.setdefault("storyboard-first-act", []).append(first_act)
+    if not acts:
+        raise FlowFailed("storyboard")
+    return acts
+
+
+async def simulated_user(index, client, base, recorder, args):
+    session_id = str(uuid.uuid4())
+    events = follower = None
+    if args.events:
+        events = SessionEvents()
+        follower = asyncio.ensure_future(events.follow(client, f"{base}/api/sessions/{session_id}/events", recorder))
+    start = time.monotonic()
+    try:
+        upload = await recorder.call(client, "upload-photo", "POST", f"{base}/api/upload-photo",
+                                     json={"photo": user_photo(index), "detect_gender": True})
+        if upload is None or upload.status_code != 200:
+            raise FlowFailed("upload-photo")
+        uploaded = upload.json()
+        gender = uploaded.get("gender", "female")
+
+        acts = await stream_storyboard(client, base, recorder, {
+            "show_name": args.show, "gender": gender, "user_name": f"User {index}",
+            "stream": True, "session_id": session_id, "no_cache": not args.cache,
+        })
+
+        async def image(act):
+            response = await recorder.call(client, "generate-image", "POST", f"{base}/api/generate-image", json={
+                "photo_token": uploaded["photo_token"], "prompt": act["prompt"], "gender": gender,
+                "scene_number": act["act_number"], "session_id": session_id,
+            })
+            if response is None or response.status_code != 200:
+                raise FlowFailed("generate-image")
+            result = await wait_for_job(client, base, recorder, events, response.json()["request_id"], "image", args)
+            return result["images"][0]["url"]
+
+        image_urls = await asyncio.gather(*[image(act) for act in acts])
+
+        expanded = await recorder.call(client, "expand-video-prompts", "POST", f"{base}/api/expand-video-prompts",
+                                       json={"show_name": args.show, "acts": acts})
+        if expanded is None or expanded.status_code != 200:
+            raise FlowFailed("expand-video-prompts")
+        prompts = {p["act_number"]: p.get("video_prompt", "") for p in expanded.json()["video_prompts"]}
+
+        async def video(act, image_url):
+            response = await recorder.call(client, "generate-video", "POST", f"{base}/api/generate-video", json={
+                "image_url": image_url, "prompt": prompts.get(act["act_number"], act["prompt"]),
+                "session_id": session_id,
+            })
+            if response is None or response.status_code != 200:
+                raise FlowFailed("generate-video")
+            result = await wait_for_job(client, base, recorder, events, response.json()["request_id"], "video", args)
+            return result["video"]["url"]
+
+        clip_urls = await asyncio.gather(*[video(act, url) for act, url in zip(acts, image_urls)])
+
+        if args.merge:
+            merge = await recorder.call(client, "merge-submit", "POST", f"{base}/api/merge-jobs",
+                                        json={"clip_urls": clip_urls})
+            if merge is None or merge.status_code not in (200, 202):
+                raise FlowFailed("merge")
+            job_id = merge.json()["job_id"]
+            while True:
+                status = await recorder.call(client, "merge-status", "GET", f"{base}/api/merge-jobs/{job_id}")
+                state = status.json().get("status") if status is not None and status.status_code == 200 else None
+                if state == "COMPLETED":
+                    break
+                if state == "FAILED":
+                    raise FlowFailed("merge")
+                await asyncio.sleep(args.poll_interval)
+            result = await recorder.call(client, "merge-result", "GET", f"{base}/api/merge-jobs/{job_id}/result")
+            if result is None or result.status_code != 200:
+                raise FlowFailed("merge")
+        recorder.flows.append(time.monotonic() - start)
+    except FlowFailed as e:
+        step = str(e)
+        recorder.failed_flows[step] = recorder.failed_flows.get(step, 0) + 1
+    finally:
+        if follower is not None:
+            follower.cancel()
+
+
+def process_tree(root):
+    """PIDs of ``root`` and all its descendants, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after its ")"
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def tree_usage(root):
+    """``(rss_bytes, os_threads)`` summed over a process tree."""
+    rss = threads = 0
+    for pid in process_tree(root):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+                    elif line.startswith("Threads:"):
+                        threads += int(line.split()[1])
+        except OSError:
+            continue
+    return rss, threads
+
+
+async def sample_server(server, base, recorder, samples, interval):
+    """Append ``(rss, os_threads, outstanding, probe_seconds)`` every ``interval`` seconds until cancelled.
+
+    The /api/health probe waits behind every queued request, so its latency
+    is the time a new request spends waiting for a free thread.
+    """
+    async with httpx.AsyncClient(timeout=None) as client:
+        while True:
+            rss, threads = tree_usage(server.pid) if os.path.isdir("/proc") else (0, 0)
+            outstanding = recorder.outstanding
+            start = time.monotonic()
+            try:
+                await client.get(base + "/api/health")
+                probe = time.monotonic() - start
+            except httpx.HTTPError:
+                probe = None
+            samples.append((rss, threads, outstanding, probe))
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+async def run_config(mode, threads, port, args, env):
+    env = dict(env, ASGI_WSGI_THREADS=str(threads), WORKER_THREADS=str(threads))
+    server = subprocess.Popen(SERVING_MODES[mode](port, threads), cwd=HERE, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        await wait_until_up(base + "/api/health")
+        recorder, samples = Recorder(), []
+        sampler = asyncio.ensure_future(sample_server(server, base, recorder, samples, args.sample_interval))
+        limits = httpx.Limits(max_connections=args.users * 4, max_keepalive_connections=args.users * 2)
+        async with httpx.AsyncClient(limits=limits, timeout=args.job_timeout) as client:
+            start = time.monotonic()
+
+            async def ramped(index):
+                await asyncio.sleep(args.ramp * index / max(1, args.users))
+                await simulated_user(index, client, base, recorder, args)
+
+            await asyncio.gather(*[ramped(i) for i in range(args.users)])
+            wall = time.monotonic() - start
+        sampler.cancel()
+        return wall, recorder, samples
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            # Open event streams hold gthread workers until the next heartbeat;
+            # kill the workers too so they release the port
+            for pid in process_tree(server.pid):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            server.wait()
+
+
+def report(label, threads, wall, recorder, samples):
+    total = sum(len(v) for v in recorder.latencies.values())
+    print(f"\n=== {label}: {total} requests in {wall:.2f}s ({total / wall:.1f} req/s) ===")
+    print(f"{'endpoint':<22}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'errors':>8}")
+    for kind, values in recorder.latencies.items():
+        print(f"{kind:<22}{len(values):>6}"
+              f"{percentile(values, 50):>9.3f}{percentile(values, 95):>9.3f}"
+              f"{percentile(values, 99):>9.3f}{max(values):>9.3f}{recorder.errors.get(kind, 0):>8}")
+
+    flows = recorder.flows
+    failed = sum(recorder.failed_flows.values())
+    print(f"\nflows: {len(flows)} completed, {failed} failed"
+          + (f" ({', '.join(f'{k}: {v}' for k, v in sorted(recorder.failed_flows.items()))})" if failed else ""))
+    if flows:
+        print(f"flow seconds: p50 {percentile(flows, 50):.2f}  p99 {percentile(flows, 99):.2f}  max {max(flows):.2f}")
+
+    rss = [s[0] for s in samples if s[0]]
+    os_threads = [s[1] for s in samples if s[1]]
+    if rss:
+        print(f"rss MB: peak {max(rss) / 2**20:.1f}  mean {sum(rss) / len(rss) / 2**20:.1f}"
+              f"    os threads: peak {max(os_threads)}")
+    if samples:
+        outstanding = [s[2] for s in samples]
+        probes = [s[3] for s in samples if s[3] is not None]
+        saturated = sum(1 for o in outstanding if o >= threads) / len(samples)
+        print(f"request threads: {threads}  outstanding peak {max(outstanding)}"
+              f"  mean {sum(outstanding) / len(outstanding):.1f}"
+              f"  saturated {saturated:.0%} of {len(samples)} samples")
+        if probes:
+            print(f"health probe seconds: p50 {percentile(probes, 50):.3f}  p99 {percentile(probes, 99):.3f}"
+                  f"  max {max(probes):.3f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which users start")
+    parser.add_argument("--show", default="Twilight")
+    parser.add_argument("--cache", action="store_true", help="allow storyboard cache hits")
+    parser.add_argument("--no-events", dest="events", action="store_false",
+                        help="poll /api/jobs only, without a session event stream per user")
+    parser.add_argument("--merge", action="store_true", help="merge each user's clips (needs ffmpeg)")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--event-poll-interval", type=float, default=15.0,
+                        help="fallback poll interval while the event stream is open")
+    parser.add_argument("--job-timeout", type=float, default=900.0)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--fal-latency", type=float, default=0.1)
+    parser.add_argument("--job-seconds", type=float, default=5.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--fal-error-rate", type=float, default=0.0)
+    parser.add_argument("--job-failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="fraction of upstream calls the stub answers with 429")
+    parser.add_argument("--clip", help="MP4 the stub serves as every clip (for --merge)")
+    parser.add_argument("--modes", nargs="+", default=list(SERVING_MODES), choices=list(SERVING_MODES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[12],
+                        help="request threads per configuration (gthread threads / ASGI WSGI bridge)")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--port", type=int, default=9101)
+    args = parser.parse_args()
+
+    stub_args = [
+        "--port", str(args.stub_port), "--llm-latency", str(args.llm_latency),
+        "--fal-latency", str(args.fal_latency), "--job-seconds", str(args.job_seconds),
+        "--llm-error-rate", str(args.llm_error_rate), "--fal-error-rate", str(args.fal_error_rate),
+        "--job-failure-rate", str(args.job_failure_rate), "--throttle-rate", str(args.throttle_rate),
+    ]
+    if args.clip:
+        stub_args += ["--clip", args.clip]
+    stub = subprocess.Popen([sys.executable, "stub_upstream.py", *stub_args], cwd=HERE)
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env = dict(
+        os.environ,
+        FAL_QUEUE_URL=stub_url,
+        FAL_STORAGE_URL=stub_url,
+        ANTHROPIC_BASE_URL=stub_url,
+        # The stub serves the generated clips itself
+        MERGE_CLIP_HOSTS="127.0.0.1",
+        FAL_KEY="stub",
+        ANTHROPIC_API_KEY="stub",
+        LOG_PAYLOADS="0",
+        # Measure the serving model, not the per-model LLM caps
+        LLM_OPUS_CONCURRENCY=str(args.users),
+        LLM_HAIKU_CONCURRENCY=str(args.users),
+    )
+    try:
+        await wait_until_up(stub_url + "/health")
+        for mode in args.modes:
+            for threads in args.threads:
+                run_env = dict(env, CACHE_DIR=tempfile.mkdtemp(prefix="sorashorts-load-"))
+                report(f"{mode} x{threads} threads", threads,
+                       *await run_config(mode, threads, args.port, args, run_env))
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,8 +8,10 @@ let videoURL = null;
 let generatedClips = []; // array of video URLs per clip
 let currentClipIndex = 0; // which clip we're generating
 let actData = []; // [{act_number, title, prompt, scenes, imageURL}, ...]
+let expandedPrompts = null; // Promise of {act_number: video prompt} from the batch expand call
 let photoToken = null; // cached for image gen calls
 let userName = null; // user's name for storyboard
+let sessionId = null; // groups this generation's server-side events
 
 // ===== DOM REFS =====
 const screens = {
@@ -117,6 +119,7 @@ function handleFile(file) {
     reader.onload = async (e) => {
         // Compress to max 800px, 80% JPEG quality to keep payload small
         userPhotoDataURI = await compressImage(e.target.result, 800, 0.8);
+        photoToken = null;
         els.photoPreview.src = userPhotoDataURI;
         els.uploadArea.style.display = "none";
         els.previewContainer.style.display = "block";
@@ -170,6 +173,7 @@ els.cameraCaptureBtn.addEventListener("click", async () => {
 
     const dataURI = canvas.toDataURL("image/jpeg", 0.9);
     userPhotoDataURI = await compressImage(dataURI, 800, 0.8);
+    photoToken = null;
     els.photoPreview.src = userPhotoDataURI;
     els.previewContainer.style.display = "block";
 });
@@ -207,6 +211,7 @@ els.uploadArea.addEventListener("drop", (e) => {
 // Retake / Continue
 els.retakeBtn.addEventListener("click", () => {
     userPhotoDataURI = null;
+    photoToken = null;
     els.photoPreview.src = "";
     els.previewContainer.style.display = "none";
     els.uploadArea.style.display = "block";
@@ -225,20 +230,22 @@ els.continueBtn.addEventListener("click", async () => {
     }
     userName = nameVal;
 
-    // Detect gender from photo
+    // Upload the photo and detect gender from it in one round trip; the
+    // token is reused for every show tried with this photo
     const origText = els.continueBtn.textContent;
     els.continueBtn.textContent = "Analyzing...";
     els.continueBtn.disabled = true;
 
     try {
-        const resp = await fetch("/api/detect-gender", {
+        const resp = await fetch("/api/upload-photo", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ photo: userPhotoDataURI }),
+            body: JSON.stringify({ photo: userPhotoDataURI, detect_gender: true }),
         });
         if (resp.ok) {
             const data = await resp.json();
-            detectedGender = data.gender;
+            photoToken = data.photo_token;
+            detectedGender = data.gender || "male";
             console.log("Detected gender:", detectedGender);
         } else {
             detectedGender = "male"; // fallback
@@ -384,7 +391,7 @@ function resetStoryboard() {
     generatedImages = [];
     scenePrompts = [];
     actData = [];
-    photoToken = null;
+    expandedPrompts = null;
     els.storyboard.innerHTML = "";
 }
 
@@ -476,6 +483,53 @@ function showActImage(actNumber, imageURL) {
     img.onclick = () => openLightbox(imageURL, actData.find(a => a.act_number === actNumber)?.prompt || "");
 }
 
+// Expand every act's video prompt in one batch request shared by all the
+// per-act Generate buttons. Resolves to {} on failure so callers fall back per act.
+function expandAllActs() {
+    if (!expandedPrompts) {
+        expandedPrompts = fetch("/api/expand-video-prompts", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+                show_name: selectedShow,
+                user_name: userName,
+                acts: actData.map(a => ({ act_number: a.act_number, title: a.title, scenes: a.scenes || [] })),
+            }),
+        })
+            .then((resp) => (resp.ok ? resp.json() : { video_prompts: [] }))
+            .then((data) => Object.fromEntries(
+                (data.video_prompts || []).filter(p => p.video_prompt).map(p => [p.act_number, p.video_prompt])
+            ))
+            .catch(() => ({}));
+    }
+    return expandedPrompts;
+}
+
+async function expandActPrompt(act) {
+    const expanded = await expandAllActs();
+    if (expanded[act.act_number]) return expanded[act.act_number];
+
+    const expandResp = await fetch("/api/expand-video-prompt", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+            show_name: selectedShow,
+            act_title: act.title,
+            scenes: act.scenes || [],
+            all_acts: actData.map(a => ({ act_number: a.act_number, title: a.title })),
+            user_name: userName,
+        }),
+    });
+
+    if (!expandResp.ok) {
+        const err = await expandResp.json().catch(() => ({}));
+        throw new Error(err.error || "Failed to expand video prompt");
+    }
+
+    const expandData = await expandResp.json();
+    return expandData.video_prompt;
+}
+
 async function generateActVideo(actNumber) {
     const act = actData.find(a => a.act_number === actNumber);
     if (!act) return;
@@ -491,24 +545,7 @@ async function generateActVideo(actNumber) {
 
     try {
         // Step 1: Call Opus to expand scene descriptions into detailed video prompt
-        const expandResp = await fetch("/api/expand-video-prompt", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-                show_name: selectedShow,
-                act_title: act.title,
-                scenes: act.scenes || [],
-                all_acts: actData.map(a => ({ act_number: a.act_number, title: a.title })),
-            }),
-        });
-
-        if (!expandResp.ok) {
-            const err = await expandResp.json().catch(() => ({}));
-            throw new Error(err.error || "Failed to expand video prompt");
-        }
-
-        const expandData = await expandResp.json();
-        const videoPrompt = expandData.video_prompt;
+        const videoPrompt = await expandActPrompt(act);
 
         console.log(`[VIDEO] Act ${actNumber} expanded prompt (${videoPrompt ? videoPrompt.length : 0} chars):`, videoPrompt);
 
@@ -530,6 +567,7 @@ async function generateActVideo(actNumber) {
         const videoPayload = {
             image_url: act.imageURL,
             prompt: videoPrompt,
+            session_id: sessionId,
         };
         console.log(`[VIDEO] Act ${actNumber} sending to /api/generate-video:`, JSON.stringify(videoPayload).substring(0, 500));
 
@@ -591,25 +629,72 @@ async function generateActVideo(actNumber) {
     }
 }
 
+// ===== JOB STATUS =====
+// The server polls fal.ai itself; job transitions are pushed over one
+// Server-Sent Events stream per session, with /api/jobs as the fallback.
+let eventSource = null;
+const jobStates = {}; // request_id -> latest job snapshot pushed by the server
+const jobWaiters = {}; // request_id -> [callback]
+
+function newSessionId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function openSessionEvents() {
+    if (eventSource) eventSource.close();
+    sessionId = newSessionId();
+    eventSource = new EventSource(`/api/sessions/${sessionId}/events`);
+    const onJob = (e) => {
+        const job = JSON.parse(e.data);
+        jobStates[job.request_id] = job;
+        (jobWaiters[job.request_id] || []).slice().forEach((cb) => cb(job));
+    };
+    eventSource.addEventListener("image", onJob);
+    eventSource.addEventListener("video", onJob);
+}
+
+async function fetchJob(requestId, kind) {
+    const resp = await fetch(`/api/jobs/${requestId}?kind=${kind}`);
+    if (!resp.ok) throw new Error(`Job lookup returned ${resp.status}`);
+    return resp.json();
+}
+
+// Wait for the next pushed update of a job, or fall back to a poll after
+// pollMs (a much longer safety-net interval while the event stream is open).
+async function nextJobState(requestId, kind, pollMs) {
+    const known = jobStates[requestId];
+    if (known && (known.status === "COMPLETED" || known.status === "FAILED")) return known;
+
+    const live = eventSource && eventSource.readyState === EventSource.OPEN;
+    const pushed = await new Promise((resolve) => {
+        const waiters = (jobWaiters[requestId] = jobWaiters[requestId] || []);
+        const done = (job) => {
+            clearTimeout(timer);
+            waiters.splice(waiters.indexOf(done), 1);
+            resolve(job);
+        };
+        const timer = setTimeout(() => done(null), live ? 15000 : pollMs);
+        waiters.push(done);
+    });
+    return pushed || fetchJob(requestId, kind);
+}
+
 async function pollVideoForAct(requestId) {
     const maxAttempts = 180;
     for (let attempt = 0; attempt < maxAttempts; attempt++) {
-        await new Promise(resolve => setTimeout(resolve, 3000));
-
         try {
-            const statusResp = await fetch(`/api/video-status/${requestId}`);
-            const statusData = await statusResp.json();
+            const job = await nextJobState(requestId, "video", 3000);
 
-            if (statusData.status === "COMPLETED") {
-                const resultResp = await fetch(`/api/video-result/${requestId}`);
-                const resultData = await resultResp.json();
+            if (job.status === "COMPLETED") {
+                const resultData = job.result || {};
                 if (resultData.video && resultData.video.url) {
                     return resultData.video.url;
                 }
                 return null;
             }
 
-            if (statusData.status === "FAILED") {
+            if (job.status === "FAILED") {
                 return null;
             }
         } catch (error) {
@@ -622,16 +707,12 @@ async function pollVideoForAct(requestId) {
 async function pollImageStatus(requestId, sceneNum) {
     const maxAttempts = 180;
     for (let attempt = 0; attempt < maxAttempts; attempt++) {
-        await new Promise((resolve) => setTimeout(resolve, 2000));
-
         try {
-            const statusResp = await fetch(`/api/image-status/${requestId}`);
-            const statusData = await statusResp.json();
-            const status = statusData.status;
+            const job = await nextJobState(requestId, "image", 2000);
+            const status = job.status;
 
             if (status === "COMPLETED") {
-                const resultResp = await fetch(`/api/image-result/${requestId}`);
-                const resultData = await resultResp.json();
+                const resultData = job.result || {};
                 const imageURL = extractImageURL(resultData);
                 if (!imageURL) {
                     console.log(`Scene ${sceneNum} result:`, JSON.stringify(resultData));
@@ -653,157 +734,178 @@ async function pollImageStatus(requestId, sceneNum) {
     throw new Error(`Scene ${sceneNum} timed out`);
 }
 
-async function startGeneration() {
-    showScreen("generate");
-    resetStoryboard();
-    els.generateStatus.style.display = "";
-    els.statusText.textContent = "Writing your storyboard...";
-    els.statusDetail.textContent =
-        "AI is crafting a 5-act plot for " + selectedShow;
-
-    try {
-        // Step 1: Generate 5 act prompts with Claude
-        const storyboardResponse = await fetch("/api/generate-storyboard", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ show_name: selectedShow, gender: detectedGender, user_name: userName }),
-        });
+// Stream the storyboard as NDJSON, calling onAct(act, index) as each act
+// arrives. Resolves to the full act list once the server reports "done".
+async function streamStoryboard(onAct) {
+    const resp = await fetch("/api/generate-storyboard", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+            show_name: selectedShow,
+            gender: detectedGender,
+            user_name: userName,
+            session_id: sessionId,
+            stream: true,
+        }),
+    });
 
-        if (!storyboardResponse.ok) {
-            let errMsg = "Failed to generate storyboard";
-            try {
-                const err = await storyboardResponse.json();
-                errMsg = err.error || errMsg;
-            } catch {
-                errMsg += ` (server returned ${storyboardResponse.status})`;
-            }
-            throw new Error(errMsg);
+    if (!resp.ok) {
+        let errMsg = "Failed to generate storyboard";
+        try {
+            const err = await resp.json();
+            errMsg = err.error || errMsg;
+        } catch {
+            errMsg += ` (server returned ${resp.status})`;
         }
+        throw new Error(errMsg);
+    }
 
-        let storyboardData;
+    let count = 0;
+    const handle = (line) => {
+        if (!line.trim()) return null;
+        let msg;
         try {
-            storyboardData = await storyboardResponse.json();
+            msg = JSON.parse(line);
         } catch {
             throw new Error("Invalid response from storyboard API");
         }
-        const acts = storyboardData.acts;
+        if (msg.event === "act") {
+            onAct(msg.act, count++);
+            return null;
+        }
+        if (msg.event === "error") throw new Error(msg.error || "Failed to generate storyboard");
+        return msg.acts; // "done"
+    };
 
-        if (!acts || acts.length === 0) {
-            throw new Error("No acts returned from storyboard generation");
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+    for (;;) {
+        const { value, done } = await reader.read();
+        buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffered.split("\n");
+        buffered = done ? "" : lines.pop();
+        for (const line of lines) {
+            const acts = handle(line);
+            if (acts) return acts;
         }
+        if (done) throw new Error("Storyboard stream ended early");
+    }
+}
+
+// Submit one act's image to fal.ai and resolve to its URL once generated.
+async function submitActImage(act, actNum, photoTokenReady) {
+    const submitResponse = await fetch("/api/generate-image", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+            photo_token: await photoTokenReady,
+            prompt: act.prompt,
+            show_name: selectedShow,
+            scene_number: actNum,
+            gender: detectedGender,
+            session_id: sessionId,
+        }),
+    });
 
-        // Build act cards in the DOM
-        for (const act of acts) {
-            createActCard(act);
+    if (!submitResponse.ok) {
+        if (submitResponse.status === 410) photoToken = null; // expired: the next run re-uploads
+        let errMsg = `Failed to submit act ${actNum}`;
+        try {
+            const text = await submitResponse.text();
+            try {
+                const err = JSON.parse(text);
+                errMsg = err.error || errMsg;
+            } catch {
+                errMsg += `: ${text.substring(0, 200)}`;
+            }
+        } catch {
+            errMsg += ` (server returned ${submitResponse.status})`;
         }
+        throw new Error(errMsg);
+    }
 
-        // Step 2: Upload photo once, then submit ALL images in parallel
-        let completedCount = 0;
+    let submitData;
+    try {
+        submitData = await submitResponse.json();
+    } catch {
+        throw new Error(`Invalid response submitting act ${actNum}`);
+    }
 
-        els.statusText.textContent = `Generating ${acts.length} act images...`;
-        els.statusDetail.textContent = "Preparing image requests...";
+    if (!submitData.request_id) {
+        const imageURL = extractImageURL(submitData);
+        if (!imageURL) throw new Error(`No image returned for act ${actNum}`);
+        return imageURL;
+    }
+    return pollImageStatus(submitData.request_id, actNum);
+}
+
+async function startGeneration() {
+    showScreen("generate");
+    resetStoryboard();
+    openSessionEvents();
+    els.generateStatus.style.display = "";
+    els.statusText.textContent = "Writing your storyboard...";
+    els.statusDetail.textContent =
+        "AI is crafting a 5-act plot for " + selectedShow;
 
-        // Upload photo once
-        const uploadResp = await fetch("/api/upload-photo", {
+    try {
+        // Reuse the token from the photo screen, or upload the photo once
+        // while the storyboard is being written
+        const photoTokenReady = photoToken ? Promise.resolve(photoToken) : fetch("/api/upload-photo", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ photo: userPhotoDataURI }),
+        }).then(async (uploadResp) => {
+            if (!uploadResp.ok) throw new Error("Failed to upload photo");
+            const uploadData = await uploadResp.json();
+            photoToken = uploadData.photo_token;
+            return photoToken;
         });
-        if (!uploadResp.ok) throw new Error("Failed to upload photo");
-        const uploadData = await uploadResp.json();
-        photoToken = uploadData.photo_token;
-
-        els.statusDetail.textContent = "Submitting image requests...";
-
-        // Submit all acts to fal.ai queue simultaneously
-        const submissions = await Promise.all(
-            acts.map(async (act, i) => {
-                const actNum = act.act_number || i + 1;
-                const submitResponse = await fetch("/api/generate-image", {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({
-                        photo_token: photoToken,
-                        prompt: act.prompt,
-                        show_name: selectedShow,
-                        scene_number: actNum,
-                        gender: detectedGender,
-                    }),
-                });
-
-                if (!submitResponse.ok) {
-                    let errMsg = `Failed to submit act ${actNum}`;
-                    try {
-                        const text = await submitResponse.text();
-                        try {
-                            const err = JSON.parse(text);
-                            errMsg = err.error || errMsg;
-                        } catch {
-                            errMsg += `: ${text.substring(0, 200)}`;
-                        }
-                    } catch {
-                        errMsg += ` (server returned ${submitResponse.status})`;
-                    }
-                    throw new Error(errMsg);
-                }
+        photoTokenReady.catch(() => {}); // surfaced by the first act that awaits it
 
-                let submitData;
-                try {
-                    submitData = await submitResponse.json();
-                } catch {
-                    throw new Error(`Invalid response submitting act ${actNum}`);
-                }
+        let completedCount = 0;
+        let displayChain = Promise.resolve(); // reveals images in act order
+
+        // As each act arrives: add its card, submit its image and queue its reveal
+        const startAct = (act, idx) => {
+            const actNum = act.act_number || idx + 1;
+            createActCard({ ...act, act_number: actNum });
+            actData[idx] = {
+                act_number: actNum,
+                title: act.title || "",
+                prompt: act.prompt,
+                scenes: act.scenes || [],
+                imageURL: null,
+            };
+            els.statusText.textContent = `Generating act ${actNum} image...`;
+            els.statusDetail.textContent = act.prompt;
 
-                return { act, actNum, submitData };
-            })
-        );
+            const imageReady = submitActImage(act, actNum, photoTokenReady).then((imageURL) => {
+                actData[idx].imageURL = imageURL;
+                return imageURL;
+            });
+            imageReady.catch(() => {}); // surfaced through displayChain
+            displayChain = displayChain.then(async () => {
+                showActImage(actNum, await imageReady);
+                completedCount++;
+                const dots = ".".repeat((completedCount % 3) + 1);
+                els.statusText.textContent = `${completedCount} of ${actData.length} acts ready${dots}`;
+                els.statusDetail.textContent = act.prompt;
+            });
+        };
 
-        els.statusDetail.textContent = "All acts submitted, waiting for results...";
+        // Stream the 5 act prompts from Claude
+        expandedPrompts = null;
+        actData = [];
+        const acts = await streamStoryboard(startAct);
 
-        // Pre-allocate actData
-        actData = acts.map((act, i) => ({
-            act_number: act.act_number || i + 1,
-            title: act.title || "",
-            prompt: act.prompt,
-            scenes: act.scenes || [],
-            imageURL: null,
-        }));
-
-        // Poll all acts in parallel, but reveal images sequentially
-        const imageResults = new Array(acts.length);
-        const resolvers = new Array(acts.length);
-        const readyPromises = acts.map((_, i) => new Promise((resolve) => { resolvers[i] = resolve; }));
-
-        const pollAll = Promise.all(
-            submissions.map(async ({ act, actNum, submitData }, idx) => {
-                const requestId = submitData.request_id;
-                let imageURL;
-
-                if (!requestId) {
-                    imageURL = extractImageURL(submitData);
-                    if (!imageURL) throw new Error(`No image returned for act ${actNum}`);
-                } else {
-                    imageURL = await pollImageStatus(requestId, actNum);
-                }
-
-                imageResults[idx] = { imageURL, act, actNum };
-                actData[idx].imageURL = imageURL;
-                resolvers[idx]();
-            })
-        );
-
-        // Sequential display
-        for (let i = 0; i < acts.length; i++) {
-            await readyPromises[i];
-            const { imageURL, act, actNum } = imageResults[i];
-            showActImage(actNum, imageURL);
-            completedCount++;
-            const dots = ".".repeat((completedCount % 3) + 1);
-            els.statusText.textContent = `${completedCount} of ${acts.length} acts ready${dots}`;
-            els.statusDetail.textContent = act.prompt;
+        if (!acts || acts.length === 0) {
+            throw new Error("No acts returned from storyboard generation");
         }
 
-        await pollAll;
+        els.statusDetail.textContent = "All acts submitted, waiting for results...";
+        await displayChain;
 
         // All acts generated — hide status bar
         els.generateStatus.style.display = "none";
@@ -907,6 +1009,7 @@ async function generateClip(index) {
             body: JSON.stringify({
                 image_url: generatedImages[index],
                 prompt: scenePrompt,
+                session_id: sessionId,
             }),
         });
 
@@ -945,13 +1048,11 @@ async function pollClipStatus(requestId, clipIndex) {
         attempt++;
 
         try {
-            const statusResponse = await fetch(`/api/video-status/${requestId}`);
-            const statusData = await statusResponse.json();
-            const status = statusData.status;
+            const job = await nextJobState(requestId, "video", 3000);
+            const status = job.status;
 
             if (status === "COMPLETED") {
-                const resultResponse = await fetch(`/api/video-result/${requestId}`);
-                const resultData = await resultResponse.json();
+                const resultData = job.result || {};
 
                 if (resultData.video && resultData.video.url) {
                     onClipReady(clipIndex, resultData.video.url);
@@ -972,9 +1073,8 @@ async function pollClipStatus(requestId, clipIndex) {
             ) {
                 throw error;
             }
+            await new Promise((resolve) => setTimeout(resolve, 3000));
         }
-
-        await new Promise((resolve) => setTimeout(resolve, 3000));
     }
 
     throw new Error(`Clip ${clipIndex + 1} timed out`);
@@ -1051,6 +1151,7 @@ els.tryagainBtn.addEventListener("click", () => {
     generatedClips = [];
     currentClipIndex = 0;
     actData = [];
+    expandedPrompts = null;
     photoToken = null;
     detectedGender = null;
     selectedShow = null;
@@ -1073,11 +1174,35 @@ async function mergeClips(btn) {
     btn.disabled = true;
 
     try {
-        const resp = await fetch("/api/merge-clips", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ clip_urls: clipUrls }),
-        });
+        // Submit to the server's merge queue, backing off while it is full
+        let job;
+        for (;;) {
+            const submit = await fetch("/api/merge-jobs", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ clip_urls: clipUrls }),
+            });
+            job = await submit.json().catch(() => ({}));
+            if (submit.status === 429) {
+                const retryAfter = parseInt(submit.headers.get("Retry-After"), 10) || job.retry_after || 10;
+                btn.textContent = `Queued, retrying in ${retryAfter}s...`;
+                await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+                continue;
+            }
+            if (!submit.ok) throw new Error(job.error || "Failed to merge clips");
+            break;
+        }
+
+        while (job.status === "QUEUED" || job.status === "RUNNING") {
+            btn.textContent = job.status === "QUEUED" ? "Waiting to merge..." : "Merging...";
+            await new Promise((resolve) => setTimeout(resolve, 2000));
+            const statusResp = await fetch(`/api/merge-jobs/${job.job_id}`);
+            job = await statusResp.json().catch(() => ({}));
+            if (!statusResp.ok) throw new Error(job.error || "Failed to merge clips");
+        }
+        if (job.status !== "COMPLETED") throw new Error(job.error || "Failed to merge clips");
+
+        const resp = await fetch(`/api/merge-jobs/${job.job_id}/result`);
 
         if (!resp.ok) {
             let errMsg = "Failed to merge clips";
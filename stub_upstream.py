@@ -0,0 +1,284 @@
+"""Local stand-in for the fal.ai queue API and the Anthropic messages API.
+
+Used to benchmark app.py without spending money on real upstream calls:
+
+    python stub_upstream.py --port 9100 --llm-latency 2 --job-seconds 5 --fal-error-rate 0.02
+
+then start the app with
+
+    FAL_QUEUE_URL=http://127.0.0.1:9100 ANTHROPIC_BASE_URL=http://127.0.0.1:9100 \\
+        FAL_KEY=stub ANTHROPIC_API_KEY=stub gunicorn app:app ...
+
+Queue jobs report IN_QUEUE/IN_PROGRESS until ``--job-seconds`` have passed
+since submission and COMPLETED afterwards.  Point FAL_STORAGE_URL at the stub
+too to exercise photo uploads to fal.ai storage.
+
+Failures can be injected: ``--llm-error-rate`` answers that fraction of
+Anthropic calls with 529 overloaded, ``--fal-error-rate`` answers fal.ai
+submit/status/result calls with 503, and ``--job-failure-rate`` makes
+that fraction of jobs complete with an error result. ``--throttle-rate``
+answers Anthropic calls and fal.ai submissions with 429 and a Retry-After
+of ``--retry-after`` seconds. Generated images and
+clips are served by the stub itself (``--clip`` serves a real MP4 so merges
+can run through ffmpeg).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# 1x1 PNG
+STUB_IMAGE = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6360f8cfc0f01f0005000201e2b1f7e20000000049454e44ae426082"
+)
+
+
+class StubConfig:
+    llm_latency = 2.0
+    fal_latency = 0.05
+    job_seconds = 5.0
+    llm_error_rate = 0.0
+    fal_error_rate = 0.0
+    job_failure_rate = 0.0
+    throttle_rate = 0.0
+    retry_after = 1
+    clip = b"stub clip"
+
+
+config = StubConfig()
+_jobs = {}  # request_id -> (submit time, whether the job fails)
+_uploads = {}  # upload id -> (content type, bytes)
+
+
+def _storyboard_text(prompt):
+    match = re.search(r"The user's name is '([^']*)'", prompt)
+    name = match.group(1) if match else "the protagonist"
+    acts = [
+        {
+            "act_number": i,
+            "title": f"Stub Act {i}",
+            "prompt": f"The lead from the reference photo and Rachel Chu share scene {i}, 9:16 portrait.",
+            "scenes": [f"{name} takes part in beat {j} of act {i}" for j in range(1, 5)],
+        }
+        for i in range(1, 6)
+    ]
+    return json.dumps(acts)
+
+
+def _reply_for(prompt):
+    if "male or female" in prompt:
+        return "female"
+    if "JSON array of 5 objects" in prompt:
+        return _storyboard_text(prompt)
+    return "\n".join(
+        f"Scene {i}: The man and the woman lean close as the camera dollies in slowly." for i in range(1, 5)
+    )
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _throttled(body):
+    if random.random() < config.throttle_rate:
+        return JSONResponse(body, status_code=429, headers={"Retry-After": str(config.retry_after)})
+    return None
+
+
+def _fal_unavailable():
+    if random.random() < config.fal_error_rate:
+        return JSONResponse({"detail": "Stub injected failure"}, status_code=503)
+    return None
+
+
+async def _stream_message(message, text, chunks=20):
+    """Emit ``text`` as Anthropic streaming events spread evenly over ``--llm-latency``."""
+    yield _sse("message_start", {"type": "message_start", "message": dict(
+        message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=0),
+    )})
+    yield _sse("content_block_start", {"type": "content_block_start", "index": 0,
+                                       "content_block": {"type": "text", "text": ""}})
+    size = max(1, -(-len(text) // chunks))
+    for i in range(0, len(text), size):
+        await asyncio.sleep(config.llm_latency / chunks)
+        yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                           "delta": {"type": "text_delta", "text": text[i:i + size]}})
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {"type": "message_delta",
+                                 "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                 "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+async def messages(request: Request):
+    body = await request.json()
+    if random.random() < config.llm_error_rate:
+        await asyncio.sleep(config.llm_latency / 10)
+        return JSONResponse(
+            {"type": "error", "error": {"type": "overloaded_error", "message": "Stub injected failure"}},
+            status_code=529,
+        )
+    throttled = _throttled({"type": "error", "error": {"type": "rate_limit_error", "message": "Stub throttled"}})
+    if throttled is not None:
+        return throttled
+    content = body["messages"][-1]["content"]
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    text = _reply_for(content)
+    message = {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(content) // 4, "output_tokens": len(text) // 4},
+    }
+    if body.get("stream"):
+        return StreamingResponse(_stream_message(message, text), media_type="text/event-stream")
+    await asyncio.sleep(config.llm_latency)
+    return JSONResponse(message)
+
+
+async def fal_submit(request: Request):
+    await request.body()
+    await asyncio.sleep(config.fal_latency)
+    failure = _fal_unavailable() or _throttled({"detail": "Stub throttled"})
+    if failure is not None:
+        return failure
+    request_id = str(uuid.uuid4())
+    _jobs[request_id] = (time.monotonic(), random.random() < config.job_failure_rate)
+    return JSONResponse({"request_id": request_id, "status": "IN_QUEUE"})
+
+
+async def fal_status(request: Request):
+    await asyncio.sleep(config.fal_latency)
+    failure = _fal_unavailable()
+    if failure is not None:
+        return failure
+    job = _jobs.get(request.path_params["request_id"])
+    if job is None:
+        return JSONResponse({"detail": "Request not found"}, status_code=404)
+    elapsed = time.monotonic() - job[0]
+    if elapsed >= config.job_seconds:
+        return JSONResponse({"status": "COMPLETED"})
+    if elapsed < config.job_seconds / 4:
+        return JSONResponse({"status": "IN_QUEUE", "queue_position": 0})
+    return JSONResponse({"status": "IN_PROGRESS"})
+
+
+async def fal_result(request: Request):
+    await asyncio.sleep(config.fal_latency)
+    failure = _fal_unavailable()
+    if failure is not None:
+        return failure
+    job = _jobs.get(request.path_params["request_id"])
+    if job is None:
+        return JSONResponse({"detail": "Request not found"}, status_code=404)
+    if job[1]:
+        return JSONResponse({"detail": [{"msg": "Stub injected job failure"}]}, status_code=422)
+    base = str(request.base_url).rstrip("/")
+    if "sora" in request.path_params["model"]:
+        return JSONResponse({"video": {"url": f"{base}/files/clip.mp4"}})
+    return JSONResponse({"images": [{"url": f"{base}/files/act.png"}]})
+
+
+async def stub_file(request: Request):
+    if request.path_params["name"].endswith(".mp4"):
+        return Response(config.clip, media_type="video/mp4")
+    return Response(STUB_IMAGE, media_type="image/png")
+
+
+async def storage_initiate(request: Request):
+    body = await request.json()
+    await asyncio.sleep(config.fal_latency)
+    upload_id = uuid.uuid4().hex
+    _uploads[upload_id] = (body.get("content_type", "application/octet-stream"), b"")
+    base = str(request.base_url).rstrip("/")
+    return JSONResponse({
+        "upload_url": f"{base}/stub-uploads/{upload_id}",
+        "file_url": f"{base}/stub-uploads/{upload_id}",
+    })
+
+
+async def storage_put(request: Request):
+    upload_id = request.path_params["upload_id"]
+    if upload_id not in _uploads:
+        return JSONResponse({"detail": "Unknown upload"}, status_code=404)
+    _uploads[upload_id] = (_uploads[upload_id][0], await request.body())
+    return Response(status_code=200)
+
+
+async def storage_get(request: Request):
+    upload = _uploads.get(request.path_params["upload_id"])
+    if upload is None:
+        return JSONResponse({"detail": "Unknown upload"}, status_code=404)
+    return Response(upload[1], media_type=upload[0])
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+app = Starlette(routes=[
+    Route("/health", health, methods=["GET"]),
+    Route("/v1/messages", messages, methods=["POST"]),
+    Route("/storage/upload/initiate", storage_initiate, methods=["POST"]),
+    Route("/files/{name}", stub_file, methods=["GET"]),
+    Route("/stub-uploads/{upload_id}", storage_put, methods=["PUT"]),
+    Route("/stub-uploads/{upload_id}", storage_get, methods=["GET"]),
+    Route("/{model:path}/requests/{request_id}/status", fal_status, methods=["GET"]),
+    Route("/{model:path}/requests/{request_id}", fal_result, methods=["GET"]),
+    Route("/{model:path}", fal_submit, methods=["POST"]),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--llm-latency", type=float, default=config.llm_latency,
+                        help="seconds each Anthropic call takes")
+    parser.add_argument("--fal-latency", type=float, default=config.fal_latency,
+                        help="seconds each fal.ai submit/status/result call takes")
+    parser.add_argument("--job-seconds", type=float, default=config.job_seconds,
+                        help="seconds until a queued fal.ai job reports COMPLETED")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="fraction of Anthropic calls answered with 529 overloaded")
+    parser.add_argument("--fal-error-rate", type=float, default=0.0,
+                        help="fraction of fal.ai submit/status/result calls answered with 503")
+    parser.add_argument("--job-failure-rate", type=float, default=0.0,
+                        help="fraction of fal.ai jobs whose result is an error")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="fraction of Anthropic calls and fal.ai submits answered with 429")
+    parser.add_argument("--retry-after", type=int, default=config.retry_after,
+                        help="Retry-After seconds sent with throttled responses")
+    parser.add_argument("--clip", help="MP4 file served as every generated clip")
+    args = parser.parse_args()
+    config.llm_latency = args.llm_latency
+    config.fal_latency = args.fal_latency
+    config.job_seconds = args.job_seconds
+    config.llm_error_rate = args.llm_error_rate
+    config.fal_error_rate = args.fal_error_rate
+    config.job_failure_rate = args.job_failure_rate
+    config.throttle_rate = args.throttle_rate
+    config.retry_after = args.retry_after
+    if args.clip:
+        with open(args.clip, "rb") as f:
+            config.clip = f.read()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Shared test setup.
+
+app.py reads its configuration at import, so the environment is pointed at a
+throwaway cache directory and at stub_upstream.py before any test imports it.
+Tests that talk to fal.ai or Anthropic request the ``stub`` fixture, which
+starts the stub once per session.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+STUB_PORT = _free_port()
+STUB_URL = f"http://127.0.0.1:{STUB_PORT}"
+CACHE_DIR = tempfile.mkdtemp(prefix="sorashorts-tests-")
+
+os.environ.update({
+    "CACHE_DIR": CACHE_DIR,
+    "FAL_KEY": "stub",
+    "ANTHROPIC_API_KEY": "stub",
+    "FAL_QUEUE_URL": STUB_URL,
+    "FAL_STORAGE_URL": STUB_URL,
+    "ANTHROPIC_BASE_URL": STUB_URL,
+})
+sys.path.insert(0, ROOT)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """Base URL of a running stub_upstream.py with fast LLM replies and jobs."""
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "stub_upstream.py"), "--port", str(STUB_PORT),
+         "--llm-latency", "0.05", "--job-seconds", "0.2"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            requests.get(f"{STUB_URL}/health", timeout=1)
+            break
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                proc.kill()
+                raise RuntimeError("stub_upstream.py did not come up")
+            time.sleep(0.1)
+    yield STUB_URL
+    proc.terminate()
+    proc.wait(timeout=10)
+
+
+def wait_for(predicate, timeout=10.0):
+    """Poll ``predicate`` until it is truthy; fail the test after ``timeout`` seconds."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for condition")
+        time.sleep(0.02)
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app
+from conftest import wait_for
+
+
+def _admit_in_threads(ctrl, callers, model="model", timeout=5):
+    """Start one ``acquire`` per ``(name, session)`` in order, each queued before the next starts."""
+    admitted, errors = [], {}
+
+    def call(name, key):
+        try:
+            ctrl.acquire(model, key, timeout=timeout)
+            admitted.append(name)
+        except app.AdmissionTimeout as e:
+            errors[name] = e
+
+    threads = []
+    for i, (name, key) in enumerate(callers, start=1):
+        threads.append(threading.Thread(target=call, args=(name, key)))
+        threads[-1].start()
+        wait_for(lambda: ctrl.stats()["queued"] == i)
+    return threads, admitted, errors
+
+
+def test_defaults_leave_throttling_off():
+    assert app.fal_admission.bucket.rate == 0
+    assert all(bucket.rate == 0 for bucket in app.fal_admission.models.values())
+    assert app.anthropic_admission.bucket.rate == 0
+    assert all(bucket.rate == 0 for bucket in app.anthropic_admission.models.values())
+
+    ctrl = app.AdmissionController("test", rate=0, burst=1)
+    start = time.monotonic()
+    for _ in range(50):
+        ctrl.acquire("model", "A", timeout=1)
+    assert time.monotonic() - start < 1
+    assert ctrl.stats()["admitted"] == 50
+
+
+def test_queued_calls_are_admitted_round_robin_across_sessions():
+    ctrl = app.AdmissionController("test", rate=20, burst=1)
+    ctrl.defer("model", 0.3)  # hold every caller until all five are queued
+
+    threads, admitted, errors = _admit_in_threads(
+        ctrl, [("A1", "A"), ("A2", "A"), ("A3", "A"), ("B1", "B"), ("C1", "C")])
+    for thread in threads:
+        thread.join(10)
+
+    assert admitted == ["A1", "B1", "C1", "A2", "A3"]
+    assert errors == {}
+    assert ctrl.stats()["queued"] == 0
+
+
+def test_defer_pauses_only_the_deferred_model():
+    ctrl = app.AdmissionController("test", rate=0, burst=1, models={"slow": (0, 1), "fast": (0, 1)})
+    ctrl.defer("slow", 0.4)
+
+    start = time.monotonic()
+    ctrl.acquire("fast", "A", timeout=1)
+    assert time.monotonic() - start < 0.2
+    ctrl.acquire("slow", "A", timeout=2)
+    assert time.monotonic() - start >= 0.35
+    assert ctrl.stats()["deferrals"] == 1
+
+
+def test_calls_still_queued_at_their_timeout_give_up():
+    ctrl = app.AdmissionController("test", rate=0, burst=1)
+    ctrl.defer("model", 10)
+
+    threads, admitted, errors = _admit_in_threads(ctrl, [("A1", "A"), ("B1", "B")], timeout=0.2)
+    for thread in threads:
+        thread.join(10)
+
+    assert admitted == []
+    assert sorted(errors) == ["A1", "B1"]
+    assert ctrl.stats()["timeouts"] == 2
+    assert ctrl.stats()["queued"] == 0
+
+
+def test_admission_timeout_answers_503_with_retry_after(stub, monkeypatch):
+    ctrl = app.AdmissionController("fal", rate=0, burst=1, queue_timeout=0.1)
+    ctrl.defer(app.FAL_VIDEO_MODEL, 10)
+    monkeypatch.setattr(app.fal, "admission", ctrl)
+
+    response = app.app.test_client().post(
+        "/api/generate-video", json={"prompt": "A walk on the beach", "image_url": "https://v3.fal.media/files/a.png"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert "Too many fal requests" in response.get_json()["error"]
+
+
+def test_async_acquire_shares_the_queue():
+    ctrl = app.AdmissionController("test", rate=20, burst=1)
+    ctrl.defer("model", 0.2)
+    threads, admitted, _ = _admit_in_threads(ctrl, [("A1", "A"), ("A2", "A")])
+
+    async def acquire():
+        await ctrl.acquire_async("model", "B", timeout=5)
+        admitted.append("B1")
+
+    asyncio.run(acquire())
+    for thread in threads:
+        thread.join(10)
+
+    assert admitted.index("B1") < admitted.index("A2")
+
+
+@pytest.mark.parametrize("value, attempt, expected", [("3", 0, 3.0), (None, 2, 4.0), ("oops", 10, 60.0)])
+def test_retry_after_seconds(value, attempt, expected):
+    assert app.retry_after_seconds(value, attempt) == expected
@@ -0,0 +1,76 @@
+import asyncio
+import uuid
+
+import pytest
+from starlette.requests import Request
+
+import app
+import asgi_app
+
+MODEL = "test-model"
+
+
+def _clients(max_concurrency):
+    limits = {MODEL: {"max_concurrency": max_concurrency, "timeout": 5, "queue_timeout": 0.2}}
+    sync = app.LLMClient("stub", limits, app.AdmissionController("test", rate=0, burst=1))
+    return sync, asgi_app.AsyncLLMClient(sync)
+
+
+def test_async_and_threaded_calls_share_one_concurrency_limit():
+    sync, async_llm = _clients(max_concurrency=1)
+
+    sync._acquire(MODEL)
+    with pytest.raises(app.LLMBusyError):
+        asyncio.run(async_llm._acquire(MODEL))
+
+    sync._release(MODEL, 0.0, None)
+    asyncio.run(async_llm._acquire(MODEL))
+    with pytest.raises(app.LLMBusyError):
+        sync._acquire(MODEL)
+
+    async_llm._release(MODEL, 0.0, None)
+    sync._acquire(MODEL)
+
+
+def test_async_caller_gets_a_slot_freed_while_it_waits():
+    sync, async_llm = _clients(max_concurrency=1)
+    sync._acquire(MODEL)
+
+    async def wait_for_slot():
+        waiter = asyncio.ensure_future(async_llm._acquire(MODEL))
+        await asyncio.sleep(0.05)
+        sync._release(MODEL, 0.0, None)
+        return await waiter
+
+    assert asyncio.run(wait_for_slot())["max_concurrency"] == 1
+
+
+def test_event_stream_that_is_never_started_holds_no_slot():
+    session_id = uuid.uuid4().hex
+    scope = {
+        "type": "http", "method": "GET", "path": f"/api/sessions/{session_id}/events",
+        "headers": [], "query_string": b"", "path_params": {"session_id": session_id},
+    }
+
+    response = asyncio.run(asgi_app.session_event_stream(Request(scope)))
+
+    assert response.media_type == "text/event-stream"
+    assert asgi_app._sse_open == 0
+    assert session_id not in app.session_bus._listeners
+
+
+def test_pipelines_resume_at_server_startup_not_on_a_request(monkeypatch):
+    from starlette.testclient import TestClient
+
+    restored = []
+    monkeypatch.setattr(app, "_resumed_from_store", False)
+    monkeypatch.setattr(app.jobs, "restore", lambda: restored.append("jobs"))
+    monkeypatch.setattr(app.pipelines, "restore", lambda: restored.append("pipelines") or 0)
+
+    app.app.test_client().get("/api/health")
+    assert restored == []
+
+    with TestClient(asgi_app.app):
+        assert restored == ["jobs", "pipelines"]
+    with TestClient(asgi_app.app):
+        assert restored == ["jobs", "pipelines"]
@@ -0,0 +1,46 @@
+import uuid
+
+import app
+
+
+def _opus_calls():
+    return app.llm.stats()[app.OPUS_MODEL]["calls"]
+
+
+def _acts(name):
+    return [
+        {"act_number": i, "title": f"Act {i}", "prompt": f"Scene {i}",
+         "scenes": [f"{name} takes part in beat {j} of act {i}" for j in range(1, 5)]}
+        for i in range(1, 6)
+    ]
+
+
+def _expand(client, show_name, acts, user_name=None):
+    response = client.post("/api/expand-video-prompts",
+                           json={"show_name": show_name, "acts": acts, "user_name": user_name})
+    assert response.status_code == 200
+    return response.get_json()["video_prompts"]
+
+
+def test_batch_expands_every_act_in_order_with_one_call_each(stub):
+    client = app.app.test_client()
+    calls = _opus_calls()
+
+    prompts = _expand(client, f"Batch Show {uuid.uuid4().hex[:8]}", _acts("Alice"))
+
+    assert [entry["act_number"] for entry in prompts] == [1, 2, 3, 4, 5]
+    assert all(entry["video_prompt"] and "error" not in entry for entry in prompts)
+    assert _opus_calls() == calls + 5
+
+
+def test_batch_is_cached_per_act_across_user_names(stub):
+    client = app.app.test_client()
+    show = f"Batch Cache Show {uuid.uuid4().hex[:8]}"
+    first = _expand(client, show, _acts("Alice"), "Alice")
+    calls = _opus_calls()
+
+    second = _expand(client, show, _acts("Bea"), "Bea")
+
+    assert _opus_calls() == calls
+    assert [entry["video_prompt"] for entry in second] == [entry["video_prompt"] for entry in first]
+    assert app.USER_NAME_PLACEHOLDER not in str(second)
@@ -0,0 +1,66 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import app
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    """Answers each request with the next scripted status; None drops the connection unanswered."""
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.requests.append(self.command)
+        status = self.server.script.pop(0)
+        if status is None:
+            self.close_connection = True
+            return
+        body = b'{"request_id": "req-1"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    server.requests, server.script = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server):
+    url = f"http://127.0.0.1:{server.server_port}"
+    return app.FalClient(url, url, "stub", pool_size=2, retries=3,
+                         admission=app.AdmissionController("test", rate=0, burst=1))
+
+
+def test_submit_is_not_resent_when_the_response_is_lost(upstream):
+    upstream.script = [None, 200]
+    with pytest.raises(requests.ConnectionError):
+        _client(upstream).submit("fal-ai/model", {"prompt": "x"})
+    assert upstream.requests == ["POST"]
+
+
+def test_submit_is_not_retried_on_5xx(upstream):
+    upstream.script = [503, 200]
+    assert _client(upstream).submit("fal-ai/model", {"prompt": "x"}).status_code == 503
+    assert upstream.requests == ["POST"]
+
+
+def test_status_get_is_retried_on_5xx(upstream):
+    upstream.script = [503, 200]
+    assert _client(upstream).status("fal-ai/model", "req-1").status_code == 200
+    assert upstream.requests == ["GET", "GET"]
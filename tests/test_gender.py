@@ -0,0 +1,50 @@
+import base64
+import io
+import random
+
+from PIL import Image
+
+import app
+
+
+def _haiku_calls():
+    return app.llm.stats()[app.HAIKU_MODEL]["calls"]
+
+
+def _photo():
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), tuple(random.randrange(256) for _ in range(3))).save(out, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def test_detection_is_cached_by_photo_content_and_shared_with_uploads(stub):
+    client = app.app.test_client()
+    photo = _photo()
+    calls = _haiku_calls()
+
+    first = client.post("/api/detect-gender", json={"photo": photo}).get_json()
+    again = client.post("/api/detect-gender", json={"photo": photo}).get_json()
+
+    assert first == {"gender": "female", "cached": False}
+    assert again == {"gender": "female", "cached": True}
+    assert _haiku_calls() == calls + 1
+
+    uploaded = client.post("/api/upload-photo", json={"photo": photo, "detect_gender": True}).get_json()
+    by_token = client.post("/api/detect-gender", json={"photo_token": uploaded["photo_token"]}).get_json()
+
+    assert (uploaded["gender"], uploaded["gender_cached"]) == ("female", True)
+    assert by_token == {"gender": "female", "cached": True}
+    assert _haiku_calls() == calls + 1
+
+
+def test_upload_detection_is_cached_for_later_requests(stub):
+    client = app.app.test_client()
+    photo = _photo()
+    calls = _haiku_calls()
+
+    uploaded = client.post("/api/upload-photo", json={"photo": photo, "detect_gender": True}).get_json()
+    detected = client.post("/api/detect-gender", json={"photo": photo}).get_json()
+
+    assert (uploaded["gender"], uploaded["gender_cached"]) == ("female", False)
+    assert detected == {"gender": "female", "cached": True}
+    assert _haiku_calls() == calls + 1
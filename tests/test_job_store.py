@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import app
+from conftest import wait_for
+
+
+def test_job_round_trip(tmp_path):
+    store = app.JobStore(str(tmp_path / "jobs.sqlite3"), retention=3600)
+    job = app.Job("req-1", "image", session_id="s1")
+    job.status = "IN_PROGRESS"
+    store.save_job(job.to_record())
+
+    restored = app.Job.from_record(store.load_job("req-1"))
+    assert (restored.request_id, restored.kind, restored.session_id, restored.status) == \
+        ("req-1", "image", "s1", "IN_PROGRESS")
+    assert [record["request_id"] for record in store.pending_jobs()] == ["req-1"]
+
+    job.status, job.result = "COMPLETED", {"images": [{"url": "https://images.example/1.png"}]}
+    store.save_job(job.to_record())
+    record = store.load_job("req-1")
+    assert record["result"] == job.result
+    assert record["result_url"] == "https://images.example/1.png"
+    assert store.pending_jobs() == []
+    assert [record["request_id"] for record in store.session_jobs("s1")] == ["req-1"]
+    assert store.load_job("missing") is None
+
+
+def test_session_round_trip(tmp_path):
+    store = app.JobStore(str(tmp_path / "jobs.sqlite3"), retention=3600)
+    pipeline = app.Pipeline("s1", {"show_name": "Test Show", "photo_token": "t", "gender": "female"})
+    store.save_session("s1", pipeline.status, pipeline.to_record())
+    store.save_session("s2", "COMPLETED", {"show_name": "Done"})
+
+    restored = app.Pipeline.from_record("s1", store.load_session("s1"))
+    assert restored.to_record() == pipeline.to_record()
+    assert [session_id for session_id, _ in store.running_sessions()] == ["s1"]
+    assert store.load_session("missing") is None
+
+
+def test_restore_reattaches_jobs_and_requeues_interrupted_stages(tmp_path, monkeypatch):
+    store = app.JobStore(str(tmp_path / "jobs.sqlite3"), retention=3600)
+    pipeline = app.Pipeline("s1", {"show_name": "Test Show", "photo_token": "t", "gender": "female",
+                                   "videos": False})
+    pipeline.acts = [{"act": {"prompt": "act one"}, "image_url": None, "video_prompt": None, "video_url": None}]
+    pipeline.storyboard_done = True
+    pipeline.stages["image_1"] = app.PipelineStage("image_1")
+    for name, status in (("photo", "RUNNING"), ("gender", "SKIPPED"), ("storyboard", "COMPLETED"),
+                         ("image_1", "RUNNING"), ("expand", "SKIPPED"), ("merge", "SKIPPED")):
+        pipeline.stages[name].status = status
+        pipeline.stages[name].started = pipeline.created
+    pipeline.stages["image_1"].request_id = "req-1"
+    store.save_session("s1", pipeline.status, pipeline.to_record())
+
+    tracked = []
+    monkeypatch.setattr(app, "jobs", SimpleNamespace(
+        track=lambda request_id, kind, session_id, on_done: tracked.append((request_id, kind, session_id, on_done))))
+    photo_runs = []
+    runner = app.PipelineRunner(workers=2, retention=60, store=store)
+    runner._run_photo = photo_runs.append
+
+    assert runner.restore() == 1
+    assert [call[:3] for call in tracked] == [("req-1", "image", "s1")]
+    wait_for(lambda: runner.describe("s1")["stages"]["photo"]["status"] == "COMPLETED")
+    assert len(photo_runs) == 1
+    assert runner.describe("s1")["status"] == "RUNNING"
+
+    finished = SimpleNamespace(status="COMPLETED", result={"images": [{"url": "https://images.example/1.png"}]},
+                               error=None)
+    tracked[0][3](finished)
+    wait_for(lambda: runner.describe("s1")["status"] == "COMPLETED")
+    assert runner.describe("s1")["acts"][0]["image_url"] == "https://images.example/1.png"
+    assert [session_id for session_id, _ in store.running_sessions()] == []
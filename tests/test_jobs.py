@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import app
+from conftest import wait_for
+
+
+def test_tracked_job_is_polled_to_completion(stub, monkeypatch):
+    events = []
+    manager = app.JobManager(app.fal, poll_workers=2, retention=60,
+                             on_change=lambda session_id, kind, snapshot: events.append((session_id, snapshot["status"])))
+    monkeypatch.setattr(app, "jobs", manager)
+    request_id = app.fal.submit(app.FAL_IMAGE_MODEL, {"prompt": "x"}).json()["request_id"]
+    finished = []
+
+    manager.track(request_id, "image", "session-1", on_done=finished.append)
+    wait_for(lambda: finished)
+
+    assert finished[0].status == "COMPLETED"
+    assert app.extract_image_url(finished[0].result) == f"{stub}/files/act.png"
+    assert events[0] == ("session-1", "IN_QUEUE")
+    assert events[-1] == ("session-1", "COMPLETED")
+    client = app.app.test_client()
+    body = client.get(f"/api/jobs/{request_id}").get_json()
+    assert (body["status"], body["result"]) == ("COMPLETED", finished[0].result)
+    assert client.get("/api/jobs/not-a-job-we-submitted").status_code == 404
+
+
+class _FakeFal:
+    def __init__(self, result_statuses):
+        self.result_statuses = list(result_statuses)
+
+    def status(self, model, request_id):
+        return SimpleNamespace(json=lambda: {"status": "COMPLETED"})
+
+    def result(self, model, request_id):
+        code = self.result_statuses.pop(0)
+        return SimpleNamespace(status_code=code, text="unavailable",
+                               json=lambda: {"images": [{"url": "https://fal.media/1.png"}]})
+
+
+def test_job_completes_only_once_its_result_is_fetched():
+    fake = _FakeFal([503, 429, 200])
+    manager = app.JobManager(fake, poll_workers=1, retention=60)
+    job = app.Job("req-1", "image")
+
+    manager._poll(job)
+    manager._poll(job)
+    assert job.status == "IN_QUEUE" and job.result is None
+
+    manager._poll(job)
+    assert job.status == "COMPLETED"
+    assert job.result == {"images": [{"url": "https://fal.media/1.png"}]}
+
+
+def test_job_fails_when_the_result_is_rejected():
+    manager = app.JobManager(_FakeFal([422]), poll_workers=1, retention=60)
+    job = app.Job("req-1", "image")
+    manager._poll(job)
+    assert (job.status, job.error) == ("FAILED", "unavailable")
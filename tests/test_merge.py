@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+
+import pytest
+
+import app
+from conftest import wait_for
+from stub_upstream import STUB_IMAGE
+
+
+def test_download_clips_returns_paths_in_clip_order(stub, tmp_path):
+    urls = [f"{stub}/files/clip.mp4", f"{stub}/files/act.png"]
+    paths = app.download_clips(urls, str(tmp_path))
+    assert paths == [str(tmp_path / "clip_0.mp4"), str(tmp_path / "clip_1.mp4")]
+    with open(paths[0], "rb") as f:
+        assert f.read() == b"stub clip"
+    with open(paths[1], "rb") as f:
+        assert f.read() == STUB_IMAGE
+
+
+def test_download_clips_names_the_clip_that_failed(stub, tmp_path):
+    urls = [f"{stub}/files/clip.mp4", f"{stub}/stub-uploads/missing"]
+    with pytest.raises(Exception, match="Failed to download clip 2: HTTP 404"):
+        app.download_clips(urls, str(tmp_path))
+
+
+def _staged(cache, data):
+    path = os.path.join(cache.staging_dir(), "merged.mp4")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_merged_cache_evicts_least_recently_used(tmp_path):
+    cache = app.MergedVideoCache(str(tmp_path), max_bytes=300)
+    now = time.time()
+    paths = {}
+    for age, key in ((300, "a"), (200, "b"), (100, "c")):
+        paths[key] = cache.put(key, _staged(cache, b"x" * 100))
+        os.utime(paths[key], (now - age, now - age))
+
+    assert cache.get("a") == paths["a"]
+    cache.put("d", _staged(cache, b"x" * 100))
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    assert cache.evictions == 1
+
+
+def test_merge_clips_get_serves_a_cached_merge_and_answers_304():
+    urls = ["https://v3.fal.media/files/1.mp4", "https://v3.fal.media/files/2.mp4"]
+    key = app.merged_cache.key(urls)
+    app.merged_cache.put(key, _staged(app.merged_cache, b"merged video"))
+    query = "&".join(f"clip_url={url}" for url in urls)
+    client = app.app.test_client()
+
+    first = client.get(f"/api/merge-clips?{query}")
+    assert first.status_code == 200
+    assert first.data == b"merged video"
+    assert first.headers["ETag"] == f'"{key}"'
+
+    again = client.get(f"/api/merge-clips?{query}", headers={"If-None-Match": f'"{key}"'})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == f'"{key}"'
+
+
+def test_merge_clips_get_never_starts_a_merge(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(app.merge_queue, "submit", submitted.append)
+    query = "clip_url=https://v3.fal.media/files/new1.mp4&clip_url=https://v3.fal.media/files/new2.mp4"
+
+    response = app.app.test_client().get(f"/api/merge-clips?{query}")
+
+    assert response.status_code == 404
+    assert submitted == []
+
+
+@pytest.mark.parametrize("url", [
+    "http://169.254.169.254/latest/meta-data",
+    "https://fal.media.evil.example/clip.mp4",
+    "file:///etc/passwd",
+    42,
+])
+def test_merges_only_accept_fal_cdn_clip_urls(monkeypatch, url):
+    submitted = []
+    monkeypatch.setattr(app.merge_queue, "submit", submitted.append)
+    client = app.app.test_client()
+    body = {"clip_urls": ["https://v3.fal.media/files/1.mp4", url]}
+
+    for route in ("/api/merge-clips", "/api/merge-jobs"):
+        response = client.post(route, json=body)
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Clip URLs must point at the fal.ai CDN"
+    assert submitted == []
+
+
+def test_full_merge_queue_answers_429_with_retry_after(monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def blocked_download(clip_urls, workdir):
+        release.wait(10)
+        raise RuntimeError("download released")
+
+    monkeypatch.setattr(app, "download_clips", blocked_download)
+    queue = app.MergeQueue(app.MergedVideoCache(str(tmp_path), max_bytes=10 ** 6),
+                           workers=1, max_queued=1, retention=60)
+    monkeypatch.setattr(app, "merge_queue", queue)
+    try:
+        running = queue.submit(["https://v3.fal.media/files/a1", "https://v3.fal.media/files/a2"])
+        wait_for(lambda: running.status == "RUNNING")
+        waiting = queue.submit(["https://v3.fal.media/files/b1", "https://v3.fal.media/files/b2"])
+        assert waiting.status == "QUEUED"
+
+        with pytest.raises(app.MergeQueueFull):
+            queue.submit(["https://v3.fal.media/files/c1", "https://v3.fal.media/files/c2"])
+
+        response = app.app.test_client().post(
+            "/api/merge-jobs", json={"clip_urls": ["https://v3.fal.media/files/d1", "https://v3.fal.media/files/d2"]})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 5
+        assert response.get_json()["retry_after"] == int(response.headers["Retry-After"])
+        assert queue.stats()["rejected"] == 2
+    finally:
+        release.set()
+    assert waiting.done.wait(10)
+    assert running.status == waiting.status == "FAILED"
+
+
+def _queue(tmp_path):
+    return app.MergeQueue(app.MergedVideoCache(str(tmp_path), max_bytes=10 ** 6),
+                          workers=1, max_queued=4, retention=60)
+
+
+def test_missing_ffmpeg_is_reported_as_such(monkeypatch, tmp_path):
+    def no_ffmpeg(*args, **kwargs):
+        raise FileNotFoundError(2, "No such file or directory", "ffmpeg")
+
+    monkeypatch.setattr(app, "download_clips", lambda urls, workdir: [os.path.join(workdir, "clip_0.mp4")])
+    monkeypatch.setattr(app.subprocess, "run", no_ffmpeg)
+    job = _queue(tmp_path).submit(["https://v3.fal.media/files/1.mp4", "https://v3.fal.media/files/2.mp4"])
+
+    assert job.done.wait(10)
+    assert (job.status, job.error) == ("FAILED", "ffmpeg is not installed on the server")
+
+
+def test_other_missing_files_keep_their_own_error(monkeypatch, tmp_path):
+    # ffmpeg "succeeds" without writing its output, so publishing it fails
+    monkeypatch.setattr(app, "download_clips", lambda urls, workdir: [])
+    monkeypatch.setattr(app, "concat_clips", lambda clip_files, output_path: None)
+    job = _queue(tmp_path).submit(["https://v3.fal.media/files/1.mp4", "https://v3.fal.media/files/2.mp4"])
+
+    assert job.done.wait(10)
+    assert job.status == "FAILED"
+    assert "No such file or directory" in job.error
+    assert "ffmpeg" not in job.error
+
+
+def test_slow_synchronous_merge_answers_202_with_its_job(monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def blocked_download(clip_urls, workdir):
+        release.wait(10)
+        raise RuntimeError("download released")
+
+    monkeypatch.setattr(app, "download_clips", blocked_download)
+    monkeypatch.setattr(app, "merge_queue", _queue(tmp_path))
+    monkeypatch.setattr(app, "MERGE_WAIT_SECONDS", 0.1)
+    try:
+        response = app.app.test_client().post(
+            "/api/merge-clips", json={"clip_urls": ["https://v3.fal.media/files/s1", "https://v3.fal.media/files/s2"]})
+        assert response.status_code == 202
+        body = response.get_json()
+        assert body["status"] in ("QUEUED", "RUNNING")
+        assert response.headers["Location"] == f"/api/merge-jobs/{body['job_id']}"
+        assert app.app.test_client().get(response.headers["Location"]).get_json()["job_id"] == body["job_id"]
+    finally:
+        release.set()
+
+
+def test_on_done_runs_when_the_merge_finishes_and_at_once_for_cached_merges(monkeypatch, tmp_path):
+    def fake_concat(clip_files, output_path):
+        with open(output_path, "wb") as f:
+            f.write(b"merged")
+
+    monkeypatch.setattr(app, "download_clips", lambda urls, workdir: [])
+    monkeypatch.setattr(app, "concat_clips", fake_concat)
+    queue = _queue(tmp_path)
+    urls = ["https://v3.fal.media/files/cb1.mp4", "https://v3.fal.media/files/cb2.mp4"]
+    finished = []
+
+    job = queue.submit(urls, on_done=finished.append)
+    wait_for(lambda: finished == [job])
+    assert job.status == "COMPLETED"
+
+    cached = queue.submit(urls, on_done=finished.append)
+    assert finished == [job, cached]
+    assert cached.status == "COMPLETED" and cached.path == job.path
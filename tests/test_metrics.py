@@ -0,0 +1,157 @@
+import math
+import re
+
+import app
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"(,|$)')
+
+
+def _unescape(value):
+    return re.sub(r'\\([\\"n])', lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def parse(text):
+    """Parse the text exposition format into ``{family: {"help", "type", "samples"}}``.
+
+    Fails on any line that is not a HELP/TYPE comment or a well-formed sample
+    of a family whose HELP and TYPE came before it.
+    """
+    families = {}
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, help = line[7:].split(" ", 1)
+            families.setdefault(name, {"samples": []})["help"] = help
+            continue
+        if line.startswith("# TYPE "):
+            name, kind = line[7:].split(" ")
+            assert kind in ("counter", "gauge", "histogram")
+            families[name]["type"] = kind
+            continue
+        m = SAMPLE_RE.match(line)
+        assert m, line
+        name, raw_labels, value = m.groups()
+        labels, pos = {}, 0
+        while raw_labels and pos < len(raw_labels):
+            label = LABEL_RE.match(raw_labels, pos)
+            assert label, line
+            labels[label.group(1)] = _unescape(label.group(2))
+            pos = label.end()
+        family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in families else name
+        assert "help" in families[family] and "type" in families[family], line
+        families[family]["samples"].append((name, labels, float(value)))
+    return families
+
+
+def _histograms(family):
+    """Group a histogram family's samples by their labels without ``le``."""
+    series = {}
+    for name, labels, value in family["samples"]:
+        key = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+        entry = series.setdefault(key, {"buckets": []})
+        if name.endswith("_bucket"):
+            entry["buckets"].append((float(labels["le"]), value))
+        else:
+            entry[name.rsplit("_", 1)[1]] = value
+    return series
+
+
+def test_render_escapes_labels_and_keeps_histograms_consistent():
+    registry = app.Metrics("t")
+    registry.counter("events_total", "Events.", ["path"])
+    registry.histogram("wait_seconds", "Waits.", ["queue"], buckets=(0.1, 1.0))
+    registry.inc("events_total", path='C:\\tmp\\"x"\nnext')
+    for value in (0.05, 0.5, 0.5, 3.0):
+        registry.observe("wait_seconds", value, queue="a")
+
+    families = parse(registry.render())
+
+    assert families["t_events_total"]["help"] == "Events."
+    assert families["t_events_total"]["type"] == "counter"
+    assert families["t_events_total"]["samples"] == [("t_events_total", {"path": 'C:\\tmp\\"x"\nnext'}, 1.0)]
+    assert families["t_wait_seconds"]["type"] == "histogram"
+    series = _histograms(families["t_wait_seconds"])[(("queue", "a"),)]
+    assert series["buckets"] == [(0.1, 1), (1.0, 3), (math.inf, 4)]
+    assert series["count"] == 4
+    assert series["sum"] == 4.05
+
+
+def test_metrics_endpoint_is_valid_exposition():
+    client = app.app.test_client()
+    client.get("/api/stats")
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    families = parse(response.get_data(as_text=True))
+
+    for name, family in families.items():
+        assert name.startswith("sorashorts_")
+        if family["type"] != "histogram":
+            continue
+        for series in _histograms(family).values():
+            bounds = [bound for bound, _ in series["buckets"]]
+            counts = [count for _, count in series["buckets"]]
+            assert bounds == sorted(bounds) and bounds[-1] == math.inf
+            assert counts == sorted(counts)
+            assert counts[-1] == series["count"]
+            assert series["sum"] >= 0
+
+
+def test_requests_are_counted_until_the_body_is_closed():
+    client = app.app.test_client()
+
+    def count():
+        families = parse(app.metrics.render())
+        samples = families["sorashorts_http_request_seconds"]["samples"]
+        return sum(value for name, _, value in samples if name.endswith("_count"))
+
+    before = count()
+    response = client.get("/api/stats", buffered=False)
+    assert count() == before
+    response.close()
+    assert count() == before + 1
+
+
+def _sample(name, **labels):
+    families = parse(app.app.test_client().get("/api/metrics").get_data(as_text=True))
+    family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in families else name
+    return sum(
+        value for sample, sample_labels, value in families.get(family, {"samples": []})["samples"]
+        if sample == name and all(sample_labels.get(k) == v for k, v in labels.items())
+    )
+
+
+def test_upstream_calls_are_timed_counted_and_billed(stub):
+    client = app.app.test_client()
+    llm_calls = _sample("sorashorts_llm_request_seconds_count", model=app.OPUS_MODEL)
+    output_tokens = _sample("sorashorts_llm_tokens_total", model=app.OPUS_MODEL, type="output")
+    video_endpoint = f"{app.FAL_VIDEO_MODEL}/image-to-video"
+    submits = _sample("sorashorts_fal_request_seconds_count", kind="submit", endpoint=video_endpoint)
+    sanitized = _sample("sorashorts_sanitizer_seconds_count")
+    status_errors = _sample("sorashorts_fal_errors_total", kind="status", endpoint=app.FAL_VIDEO_MODEL)
+
+    expanded = client.post("/api/expand-video-prompt", json={
+        "show_name": "Metrics Show", "act_title": "One", "scenes": ["a", "b", "c", "d"]})
+    assert expanded.status_code == 200
+    submitted = client.post("/api/generate-video", json={
+        "prompt": expanded.get_json()["video_prompt"], "image_url": "https://v3.fal.media/files/a.png"})
+    assert submitted.status_code == 200
+    client.get("/api/video-status/no-such-request")
+
+    assert _sample("sorashorts_llm_request_seconds_count", model=app.OPUS_MODEL) == llm_calls + 1
+    assert _sample("sorashorts_llm_tokens_total", model=app.OPUS_MODEL, type="output") > output_tokens
+    assert _sample("sorashorts_fal_request_seconds_count", kind="submit", endpoint=video_endpoint) == submits + 1
+    assert _sample("sorashorts_sanitizer_seconds_count") == sanitized + 1
+    assert _sample("sorashorts_fal_errors_total", kind="status", endpoint=app.FAL_VIDEO_MODEL) == status_errors + 1
+
+
+def test_payload_logging_can_be_switched_off(stub, monkeypatch, caplog):
+    monkeypatch.setattr(app, "LOG_PAYLOADS", False)
+    with caplog.at_level("INFO", logger=app.log.name):
+        response = app.app.test_client().post("/api/generate-video", json={
+            "prompt": "A quiet kiss at dawn", "image_url": "https://v3.fal.media/files/a.png"})
+    assert response.status_code == 200
+    assert "quiet" not in caplog.text
+    assert "[GENERATE-VIDEO]" not in caplog.text
@@ -0,0 +1,72 @@
+import base64
+import io
+import random
+
+import requests
+from PIL import Image
+
+import app
+from conftest import wait_for
+
+
+def _photo():
+    out = io.BytesIO()
+    color = tuple(random.randrange(256) for _ in range(3))
+    Image.new("RGB", (64, 64), color).save(out, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def test_photo_is_uploaded_to_fal_storage_once_and_referenced_by_url(stub, monkeypatch):
+    uploads, payloads = [], []
+    real_upload, real_submit = app.fal.upload, app.fal.submit
+
+    def upload(data, media_type, file_name):
+        uploads.append(file_name)
+        return real_upload(data, media_type, file_name)
+
+    def submit(model, payload):
+        payloads.append(payload)
+        return real_submit(model, payload)
+
+    monkeypatch.setattr(app.fal, "upload", upload)
+    monkeypatch.setattr(app.fal, "submit", submit)
+    client = app.app.test_client()
+
+    token = client.post("/api/upload-photo", json={"photo": _photo()}).get_json()["photo_token"]
+    wait_for(lambda: app._photo_store.get_url(token) is not None)
+    for scene in range(1, 4):
+        response = client.post("/api/generate-image",
+                               json={"photo_token": token, "prompt": f"Scene {scene}", "scene_number": scene})
+        assert response.status_code == 200
+
+    url = app._photo_store.get_url(token)
+    assert len(uploads) == 1
+    assert url.startswith(f"{stub}/stub-uploads/")
+    assert [payload["image_urls"] for payload in payloads] == [[url]] * 3
+    assert requests.get(url, timeout=5).content == app._photo_store.get(token)[1]
+
+
+def test_failed_upload_inlines_the_photo_without_retrying_every_job(stub, monkeypatch):
+    uploads, payloads = [], []
+    real_submit = app.fal.submit
+
+    def failing_upload(data, media_type, file_name):
+        uploads.append(file_name)
+        raise RuntimeError("fal.ai storage error 503")
+
+    def submit(model, payload):
+        payloads.append(payload)
+        return real_submit(model, payload)
+
+    monkeypatch.setattr(app.fal, "upload", failing_upload)
+    monkeypatch.setattr(app.fal, "submit", submit)
+    client = app.app.test_client()
+
+    token = client.post("/api/upload-photo", json={"photo": _photo()}).get_json()["photo_token"]
+    wait_for(lambda: uploads)
+    for scene in (1, 2):
+        response = client.post("/api/generate-image", json={"photo_token": token, "prompt": f"Scene {scene}"})
+        assert response.status_code == 200
+
+    assert len(uploads) == 1
+    assert [payload["image_urls"] for payload in payloads] == [[app._photo_store.get_data_uri(token)]] * 2
@@ -0,0 +1,79 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def _jpeg(img, **save):
+    out = io.BytesIO()
+    img.save(out, format="JPEG", **save)
+    return out.getvalue()
+
+
+def _data_uri(data, media_type="image/jpeg"):
+    return f"data:{media_type};base64," + base64.b64encode(data).decode("ascii")
+
+
+def _decode(data):
+    return Image.open(io.BytesIO(data))
+
+
+def _halves(size, left, right):
+    img = Image.new("RGB", size, left)
+    img.paste(right, (size[0] // 2, 0, size[0], size[1]))
+    return img
+
+
+@pytest.mark.parametrize("endpoint", ["/api/upload-photo", "/api/detect-gender"])
+def test_truncated_jpeg_is_rejected_with_400(endpoint):
+    data = _jpeg(_halves((400, 300), (250, 10, 10), (10, 10, 250)))
+    truncated = data[:len(data) // 2]
+
+    response = app.app.test_client().post(endpoint, json={"photo": _data_uri(truncated)})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Could not read photo")
+
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored sideways, displayed rotated 90 degrees clockwise
+    data = _jpeg(_halves((80, 40), (250, 10, 10), (10, 10, 250)), exif=exif)
+
+    (media_type, normalized), _ = app.normalize_photo(data)
+
+    img = _decode(normalized)
+    assert media_type == "image/jpeg"
+    assert img.size == (40, 80)
+    red, green, blue = img.getpixel((20, 10))
+    assert red > 200 and blue < 60  # the stored left half is now on top
+    assert 0x0112 not in img.getexif()
+
+
+def test_oversize_photo_is_downscaled_for_fal_and_the_thumbnail():
+    data = _jpeg(Image.new("RGB", (4000, 2000), (120, 160, 200)))
+
+    (_, normalized), (_, thumbnail) = app.normalize_photo(data)
+
+    assert _decode(normalized).size == (app.PHOTO_MAX_DIMENSION, app.PHOTO_MAX_DIMENSION // 2)
+    assert _decode(thumbnail).size == (app.PHOTO_THUMB_DIMENSION, app.PHOTO_THUMB_DIMENSION // 2)
+
+
+@pytest.mark.parametrize("mode", ["P", "PA", "LA", "RGBA"])
+def test_transparent_pixels_become_white(mode):
+    img = Image.new("RGBA", (20, 20), (0, 0, 0, 0))
+    img.paste((200, 0, 0, 255), (0, 0, 10, 20))
+    if mode == "P":
+        img = img.convert("P")
+        img.info["transparency"] = img.getpixel((15, 5))
+    else:
+        img = img.convert(mode)
+
+    fitted = app._fit_photo(img, 64)
+
+    assert fitted.mode == "RGB"
+    assert fitted.getpixel((15, 5)) == (255, 255, 255)
+    assert fitted.getpixel((5, 5)) != (255, 255, 255)
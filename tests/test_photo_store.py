@@ -0,0 +1,73 @@
+import base64
+import io
+import time
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def _fill(store, size, **extra):
+    return store.put("image/jpeg", b"x" * size, **extra)
+
+
+def test_least_recently_used_photo_is_evicted_over_budget():
+    store = app.PhotoStore(max_bytes=300, ttl=60)
+    a, b, c = (_fill(store, 100) for _ in range(3))
+    assert store.get(a) is not None
+
+    d = _fill(store, 100)
+
+    assert store.get(b) is None
+    assert all(store.get(token) is not None for token in (a, c, d))
+    assert store.stats()["bytes"] == 300
+    assert store.evictions == 1
+
+
+def test_photos_expire_after_ttl():
+    store = app.PhotoStore(max_bytes=1000, ttl=0.05)
+    token = _fill(store, 10)
+    time.sleep(0.1)
+
+    assert store.get(token) is None
+    assert store.expirations == 1
+    assert store.stats()["entries"] == 0
+    assert store.stats()["bytes"] == 0
+
+
+def test_eviction_clears_side_maps():
+    store = app.PhotoStore(max_bytes=200, ttl=60)
+    old = _fill(store, 50, thumbnail=("image/jpeg", b"t" * 50), digest="abc")
+    store.set_url(old, "https://fal.media/old.jpg")
+    assert store.get_url(old) == "https://fal.media/old.jpg"
+    assert store.get_digest(old) == "abc"
+
+    _fill(store, 150)
+
+    assert store.get(old) is None
+    assert (store._urls, store._thumbs, store._digests) == ({}, {}, {})
+    assert store.stats()["bytes"] == 150
+
+
+def test_photo_larger_than_the_budget_is_refused():
+    store = app.PhotoStore(max_bytes=100, ttl=60)
+    kept = _fill(store, 60)
+
+    with pytest.raises(app.PhotoTooLarge):
+        _fill(store, 80, thumbnail=("image/jpeg", b"t" * 30))
+
+    assert store.get(kept) is not None
+    assert store.stats()["bytes"] == 60
+
+
+def test_upload_over_the_photo_budget_answers_413(monkeypatch):
+    monkeypatch.setattr(app, "_photo_store", app.PhotoStore(max_bytes=100, ttl=60))
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 80, 40)).save(out, format="JPEG")
+    photo = "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+    response = app.app.test_client().post("/api/upload-photo", json={"photo": photo})
+
+    assert response.status_code == 413
+    assert "too large" in response.get_json()["error"]
@@ -0,0 +1,115 @@
+import threading
+
+import app
+from conftest import wait_for
+
+PARAMS = {"show_name": "Test Show", "photo_token": "t", "gender": "female", "videos": False}
+
+
+def test_start_resumes_only_the_failed_stages():
+    runner = app.PipelineRunner(workers=2, retention=60)
+    calls = {"photo": 0, "storyboard": 0, "image": 0}
+
+    def run_photo(p):
+        calls["photo"] += 1
+
+    def run_storyboard(p):
+        calls["storyboard"] += 1
+        with p.lock:
+            p.acts.append({"act": {"prompt": "act one"}, "image_url": None, "video_prompt": None, "video_url": None})
+            p.stages["image_1"] = app.PipelineStage("image_1")
+            p.storyboard_done = True
+
+    def run_image(p, entry, n):
+        calls["image"] += 1
+        if calls["image"] == 1:
+            raise RuntimeError("fal.ai submit error")
+        entry["image_url"] = "https://images.example/1.png"
+
+    runner._run_photo, runner._run_storyboard, runner._run_image = run_photo, run_storyboard, run_image
+
+    pipeline, created = runner.start("s1", PARAMS)
+    assert created
+    wait_for(lambda: runner.describe("s1")["status"] == "FAILED")
+    assert runner.describe("s1")["stages"]["image_1"]["error"] == "fal.ai submit error"
+
+    again, created = runner.start("s1", PARAMS)
+    assert again is pipeline and not created
+    wait_for(lambda: runner.describe("s1")["status"] == "COMPLETED")
+
+    assert calls == {"photo": 1, "storyboard": 1, "image": 2}
+    assert runner.stats()["resumed"] == 1
+    stages = runner.describe("s1")["stages"]
+    assert [stages[name]["status"] for name in ("gender", "expand", "merge")] == ["SKIPPED"] * 3
+    assert runner.describe("s1")["acts"][0]["image_url"] == "https://images.example/1.png"
+
+
+def _video_runner(monkeypatch, tmp_path):
+    runner = app.PipelineRunner(workers=1, retention=60)
+
+    def run_storyboard(p):
+        with p.lock:
+            p.acts.append({"act": {"prompt": "act one"}, "image_url": None, "video_prompt": None, "video_url": None})
+            p.stages["image_1"] = app.PipelineStage("image_1")
+            p.stages["video_1"] = app.PipelineStage("video_1")
+            p.storyboard_done = True
+
+    def run_image(p, entry, n):
+        entry["image_url"] = "https://v3.fal.media/files/1.png"
+
+    def run_expand(p):
+        p.acts[0]["video_prompt"] = "prompt"
+
+    def run_video(p, entry, n):
+        entry["video_url"] = f"https://v3.fal.media/files/{p.session_id}.mp4"
+
+    runner._run_photo = lambda p: None
+    runner._run_storyboard, runner._run_image = run_storyboard, run_image
+    runner._run_expand, runner._run_video = run_expand, run_video
+    queue = app.MergeQueue(app.MergedVideoCache(str(tmp_path), max_bytes=10 ** 6),
+                           workers=1, max_queued=4, retention=60)
+    monkeypatch.setattr(app, "merge_queue", queue)
+    return runner, queue
+
+
+def test_merge_stage_finishes_from_the_merge_callback_without_holding_a_worker(monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def blocked_download(clip_urls, workdir):
+        release.wait(10)
+        return []
+
+    def fake_concat(clip_files, output_path):
+        with open(output_path, "wb") as f:
+            f.write(b"merged")
+
+    monkeypatch.setattr(app, "download_clips", blocked_download)
+    monkeypatch.setattr(app, "concat_clips", fake_concat)
+    runner, queue = _video_runner(monkeypatch, tmp_path)
+    try:
+        runner.start("m1", dict(PARAMS, videos=True))
+        wait_for(lambda: queue.stats()["running"] == 1)
+        assert runner.describe("m1")["stages"]["merge"]["status"] == "RUNNING"
+        # The pipeline pool's only worker is free while the merge runs
+        assert runner._executor.submit(lambda: "free").result(timeout=5) == "free"
+    finally:
+        release.set()
+
+    wait_for(lambda: runner.describe("m1")["status"] == "COMPLETED")
+    merged = runner.describe("m1")["merged"]
+    assert merged["url"] == f"/api/merge-jobs/{merged['job_id']}/result"
+
+
+def test_merge_stage_fails_once_a_full_queue_outlasts_the_timeout(monkeypatch, tmp_path):
+    runner, queue = _video_runner(monkeypatch, tmp_path)
+
+    def full(clip_urls, on_done=None):
+        raise app.MergeQueueFull(retry_after=5)
+
+    monkeypatch.setattr(queue, "submit", full)
+    monkeypatch.setattr(app, "PIPELINE_MERGE_TIMEOUT", 1)
+
+    runner.start("m2", dict(PARAMS, videos=True))
+
+    wait_for(lambda: runner.describe("m2")["status"] == "FAILED")
+    assert runner.describe("m2")["stages"]["merge"]["error"] == "Too many merges in progress, please retry shortly"
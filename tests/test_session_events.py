@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import uuid
+
+from starlette.testclient import TestClient
+
+import app
+import asgi_app
+from conftest import ROOT
+
+
+def _publish_two(session_id):
+    app.session_bus.publish(session_id, "image", {"status": "IN_QUEUE"})
+    app.session_bus.publish(session_id, "image", {"status": "COMPLETED"})
+
+
+def _assert_replayed(body):
+    assert body.startswith("retry: 1000\n\n")
+    assert 'id: 1\nevent: image\ndata: {"status": "IN_QUEUE"}\n\n' in body
+    assert 'id: 2\nevent: image\ndata: {"status": "COMPLETED"}\n\n' in body
+
+
+def test_flask_stream_replays_the_session_log(monkeypatch):
+    monkeypatch.setattr(app, "SSE_STREAM_SECONDS", 0.2)
+    session_id = uuid.uuid4().hex
+    _publish_two(session_id)
+
+    response = app.app.test_client().get(f"/api/sessions/{session_id}/events")
+
+    assert response.mimetype == "text/event-stream"
+    _assert_replayed(response.get_data(as_text=True))
+    resumed = app.app.test_client().get(f"/api/sessions/{session_id}/events", headers={"Last-Event-ID": "1"})
+    assert "id: 1\n" not in resumed.get_data(as_text=True)
+
+
+def test_sse_cap_can_be_raised_past_a_share_of_the_threads():
+    env = dict(os.environ, WORKER_THREADS="12", SSE_MAX_STREAMS="40")
+    out = subprocess.run([sys.executable, "-c", "import app; print(app.SSE_MAX_STREAMS)"],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "40"
+
+
+def test_deployed_asgi_stream_replays_the_session_log(monkeypatch):
+    monkeypatch.setattr(app, "SSE_STREAM_SECONDS", 0.2)
+    session_id = uuid.uuid4().hex
+    _publish_two(session_id)
+
+    response = TestClient(asgi_app.app).get(f"/api/sessions/{session_id}/events")
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    _assert_replayed(response.text)
+    assert asgi_app._sse_open == 0
+
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+import app
+from conftest import wait_for
+
+
+def _run_callers(flight, key, fn, count):
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_call():
+    flight = app.SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(10)
+        return {"value": 42}
+
+    threads, results = _run_callers(flight, "k", fn, 5)
+    wait_for(lambda: flight.stats()["collapsed"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"leaders": 1, "collapsed": 4, "in_flight": 0}
+
+
+def test_finished_result_is_reused_only_while_it_lingers():
+    flight = app.SingleFlight("test", linger=0.1)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return len(calls)
+
+    assert flight.do("k", fn) == 1
+    assert flight.do("k", fn) == 1
+    time.sleep(0.15)
+    assert flight.do("k", fn) == 2
+    assert len(calls) == 2
+
+
+def test_leader_exception_reaches_followers_and_is_not_kept():
+    flight = app.SingleFlight("test", linger=60)
+    release = threading.Event()
+    error = RuntimeError("upstream down")
+
+    def failing():
+        release.wait(10)
+        raise error
+
+    threads, results = _run_callers(flight, "k", failing, 3)
+    wait_for(lambda: flight.stats()["collapsed"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert all(result is error for result in results)
+    assert flight.do("k", lambda: "recovered") == "recovered"
+
+
+def test_shared_fal_status_is_a_read_only_copy(stub):
+    client = app.FalClient(stub, stub, "stub", pool_size=2, retries=0,
+                           admission=app.AdmissionController("test", rate=0, burst=1), status_dedupe=60)
+    request_id = client.submit(app.FAL_IMAGE_MODEL, {"prompt": "x"}).json()["request_id"]
+
+    first = client.status(app.FAL_IMAGE_MODEL, request_id)
+    second = client.status(app.FAL_IMAGE_MODEL, request_id)
+
+    assert second is first
+    assert client.stats()["calls"]["status"] == 1
+    assert isinstance(first, app.SharedResponse)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == first.headers["Content-Type"]
+    body = first.json()
+    body["status"] = "MUTATED"
+    assert second.json()["status"] != "MUTATED"
+    with pytest.raises(AttributeError):
+        first.status_code = 500
+    with pytest.raises(TypeError):
+        first.headers["Content-Type"] = "text/plain"
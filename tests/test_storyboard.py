@@ -0,0 +1,33 @@
+import uuid
+
+import app
+
+
+def _opus_calls():
+    return app.llm.stats()[app.OPUS_MODEL]["calls"]
+
+
+def _storyboard(client, show_name, gender, user_name):
+    response = client.post("/api/generate-storyboard",
+                           json={"show_name": show_name, "gender": gender, "user_name": user_name})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_storyboard_is_cached_per_show_and_gender_across_user_names(stub):
+    client = app.app.test_client()
+    show = f"Cache Show {uuid.uuid4().hex[:8]}"
+    calls = _opus_calls()
+
+    first = _storyboard(client, show, "female", "Alice")
+    second = _storyboard(client, f"  {show.upper()}!", "female", "Bea")
+
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert _opus_calls() == calls + 1
+    assert "Alice takes part in beat 1 of act 1" in first["acts"][0]["scenes"]
+    assert "Bea takes part in beat 1 of act 1" in second["acts"][0]["scenes"]
+    assert app.USER_NAME_PLACEHOLDER not in str(second["acts"])
+
+    other_gender = _storyboard(client, show, "male", "Alice")
+    assert other_gender["cached"] is False
+    assert _opus_calls() == calls + 2
@@ -0,0 +1,90 @@
+import json
+import random
+
+import pytest
+
+import app
+
+ACTS = [
+    {"act_number": 1, "title": 'He said "stop" and left', "scenes": ["a \\ b", "path C:\\\\x\\"]},
+    {"act_number": 2, "title": "Braces {inside} a string", "scenes": ["}{", "[not an array]", "{\"a\": 1}"]},
+    {"act_number": 3, "title": "Unicode \u00e9\u4e2d and \\u escapes", "scenes": ["tab\there", "line\nbreak"]},
+    {"act_number": 4, "title": "Nested", "prompt": {"camera": {"move": "dolly"}, "tags": ["}", "]"]}},
+    {"act_number": 5, "title": "Last act ]", "scenes": ["the end\\\""]},
+]
+TEXT = json.dumps(ACTS, indent=2)
+FENCED = "```json\n" + TEXT + "\n```"
+
+
+def _chunks(text, sizes):
+    pos = 0
+    for size in sizes:
+        if pos >= len(text):
+            return
+        yield text[pos:pos + size]
+        pos += size
+    if pos < len(text):
+        yield text[pos:]
+
+
+def _random_sizes(seed):
+    rng = random.Random(seed)
+    return [rng.randint(1, 40) for _ in range(1000)]
+
+
+def _feed(parser, text, sizes):
+    emitted = []
+    for chunk in _chunks(text, sizes):
+        emitted.extend(parser.feed(chunk))
+    return emitted
+
+
+@pytest.mark.parametrize("text", [TEXT, FENCED], ids=["bare", "fenced"])
+@pytest.mark.parametrize("seed", [None, 1, 2, 3, 4, 5])
+def test_acts_survive_any_chunking(text, seed):
+    parser = app.StoryboardStreamParser()
+    sizes = [1] * len(text) if seed is None else _random_sizes(seed)
+
+    emitted = _feed(parser, text, sizes)
+
+    assert emitted == ACTS
+    assert parser.acts == ACTS
+    assert parser.complete
+
+
+def test_each_act_is_emitted_with_its_closing_brace():
+    parser = app.StoryboardStreamParser()
+    ends = [TEXT.index("\n  }", TEXT.index('"act_number": %d' % act["act_number"])) + 4 for act in ACTS]
+    pos = 0
+    for end, act in zip(ends, ACTS):
+        assert parser.feed(TEXT[pos:end - 1]) == []
+        assert parser.feed(TEXT[end - 1:end]) == [act]
+        pos = end
+    assert parser.feed(TEXT[pos:]) == []
+    assert parser.complete
+
+
+@pytest.mark.parametrize("seed", [None, 7, 8])
+def test_truncated_stream_is_incomplete_and_drops_the_partial_act(seed):
+    cut = TEXT.index("Braces {inside}") + len("Braces {ins")
+    parser = app.StoryboardStreamParser()
+    sizes = [1] * cut if seed is None else _random_sizes(seed)
+
+    emitted = _feed(parser, TEXT[:cut], sizes)
+
+    assert emitted == ACTS[:1]
+    assert parser.acts == ACTS[:1]
+    assert not parser.complete
+
+
+def test_closed_array_with_missing_acts_is_incomplete():
+    parser = app.StoryboardStreamParser()
+    parser.feed(json.dumps(ACTS[:3]))
+    assert parser.closed
+    assert not parser.complete
+
+
+def test_invalid_act_raises():
+    parser = app.StoryboardStreamParser()
+    with pytest.raises(json.JSONDecodeError):
+        parser.feed('[{"act_number": 1, "title": oops}')
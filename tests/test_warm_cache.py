@@ -0,0 +1,56 @@
+import uuid
+
+import app
+
+
+def _opus_calls():
+    return app.llm.stats()[app.OPUS_MODEL]["calls"]
+
+
+def _warm(*args):
+    result = app.app.test_cli_runner().invoke(args=["warm-cache", *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_warmed_show_is_served_from_cache_on_first_user_request(stub):
+    show = f"Warm Show {uuid.uuid4().hex[:8]}"
+    calls = _opus_calls()
+
+    output = _warm(show, "--gender", "female")
+
+    assert "1 warmed, 0 failed" in output
+    assert "storyboard generated, 5 prompts expanded (batch and per act)" in output
+    assert _opus_calls() == calls + 1 + 5 + 5
+
+    client = app.app.test_client()
+    calls = _opus_calls()
+    storyboard = client.post("/api/generate-storyboard",
+                             json={"show_name": show, "gender": "female", "user_name": "Dana"}).get_json()
+    assert storyboard["cached"] is True
+    acts = storyboard["acts"]
+    assert "Dana takes part in beat 1 of act 1" in acts[0]["scenes"]
+
+    batch = client.post("/api/expand-video-prompts",
+                        json={"show_name": show, "acts": acts, "user_name": "Dana"}).get_json()["video_prompts"]
+    assert len(batch) == 5 and all(entry["video_prompt"] for entry in batch)
+
+    all_acts = [{"act_number": act["act_number"], "title": act["title"]} for act in acts]
+    for act in acts:
+        single = client.post("/api/expand-video-prompt", json={
+            "show_name": show, "act_title": act["title"], "scenes": act["scenes"],
+            "all_acts": all_acts, "user_name": "Dana"}).get_json()
+        assert single["cached"] is True
+    assert _opus_calls() == calls
+
+
+def test_warming_again_skips_cached_entries_unless_refreshed(stub):
+    show = f"Rewarm Show {uuid.uuid4().hex[:8]}"
+    _warm(show, "--gender", "male", "--no-expand")
+    calls = _opus_calls()
+
+    assert "storyboard cached" in _warm(show, "--gender", "male", "--no-expand")
+    assert _opus_calls() == calls
+
+    assert "storyboard generated" in _warm(show, "--gender", "male", "--no-expand", "--refresh")
+    assert _opus_calls() == calls + 1